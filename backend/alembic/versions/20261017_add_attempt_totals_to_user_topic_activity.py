@@ -0,0 +1,48 @@
+"""
+Add attempt_count and score_sum to user_topic_activity
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017activitytotals'
+down_revision = '20261017parsecache'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # user_topic_activity used to be created only by Base.metadata.create_all on app startup,
+    # so on a fresh database it doesn't exist yet when `alembic upgrade head` runs
+    if not inspector.has_table('user_topic_activity'):
+        op.create_table(
+            'user_topic_activity',
+            sa.Column('username', sa.String(), primary_key=True),
+            sa.Column('topic', sa.String(), primary_key=True),
+            sa.Column('last_attempt', sa.DateTime(), nullable=True),
+            sa.Column('average_score', sa.Float(), nullable=True),
+            sa.Column('mastery_status', sa.String(), nullable=True),
+            sa.Column('attempt_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('score_sum', sa.Float(), nullable=False, server_default='0'),
+        )
+        return
+
+    columns = {c['name'] for c in inspector.get_columns('user_topic_activity')}
+    if 'attempt_count' not in columns:
+        op.add_column('user_topic_activity', sa.Column('attempt_count', sa.Integer(), nullable=False, server_default='0'))
+    if 'score_sum' not in columns:
+        op.add_column('user_topic_activity', sa.Column('score_sum', sa.Float(), nullable=False, server_default='0'))
+    # the old pairwise-halved average is all that's left of earlier attempts, count it as one
+    op.execute(
+        "UPDATE user_topic_activity SET attempt_count = 1, score_sum = average_score "
+        "WHERE average_score IS NOT NULL AND attempt_count = 0"
+    )
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('user_topic_activity'):
+        return
+    columns = {c['name'] for c in inspector.get_columns('user_topic_activity')}
+    if 'score_sum' in columns:
+        op.drop_column('user_topic_activity', 'score_sum')
+    if 'attempt_count' in columns:
+        op.drop_column('user_topic_activity', 'attempt_count')
@@ -0,0 +1,20 @@
+"""
+Add worker_id and lease_expires_at to jobs
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017joblease'
+down_revision = '20261017activitytotals'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('jobs', sa.Column('worker_id', sa.String(length=64), nullable=True))
+    op.add_column('jobs', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_jobs_lease_expires_at', 'jobs', ['lease_expires_at'])
+
+def downgrade():
+    op.drop_index('ix_jobs_lease_expires_at', table_name='jobs')
+    op.drop_column('jobs', 'lease_expires_at')
+    op.drop_column('jobs', 'worker_id')
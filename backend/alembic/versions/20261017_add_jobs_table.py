@@ -0,0 +1,31 @@
+"""
+Add jobs table for background syllabus parsing
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017jobs'
+down_revision = '20261017quizbank'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.String(length=32), primary_key=True),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('username', sa.String(), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=64), nullable=False, unique=True),
+        sa.Column('status', sa.String(), nullable=False, server_default='queued'),
+        sa.Column('stage', sa.String(), nullable=True),
+        sa.Column('progress', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index('ix_jobs_username', 'jobs', ['username'])
+
+def downgrade():
+    op.drop_index('ix_jobs_username', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,33 @@
+"""
+Add quiz_bank and quiz_bank_seen tables
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017quizbank'
+down_revision = '20250705adusernamefk1'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'quiz_bank',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('topic_key', sa.String(), nullable=False),
+        sa.Column('difficulty', sa.String(), nullable=False),
+        sa.Column('question_hash', sa.String(length=64), nullable=False, unique=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index('ix_quiz_bank_topic_difficulty', 'quiz_bank', ['topic_key', 'difficulty'])
+    op.create_table(
+        'quiz_bank_seen',
+        sa.Column('username', sa.String(), primary_key=True),
+        sa.Column('question_id', sa.Integer(), sa.ForeignKey('quiz_bank.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('seen_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+def downgrade():
+    op.drop_table('quiz_bank_seen')
+    op.drop_index('ix_quiz_bank_topic_difficulty', table_name='quiz_bank')
+    op.drop_table('quiz_bank')
@@ -0,0 +1,27 @@
+"""
+Add syllabus_parse_cache table
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017parsecache'
+down_revision = '20261017jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'syllabus_parse_cache',
+        sa.Column('content_sha256', sa.String(length=64), primary_key=True),
+        sa.Column('config_hash', sa.String(length=64), primary_key=True),
+        sa.Column('topics', sa.Text(), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=False),
+        sa.Column('hits', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('last_used_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index('ix_syllabus_parse_cache_last_used_at', 'syllabus_parse_cache', ['last_used_at'])
+
+def downgrade():
+    op.drop_index('ix_syllabus_parse_cache_last_used_at', table_name='syllabus_parse_cache')
+    op.drop_table('syllabus_parse_cache')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Sequence, String, Float, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, Sequence, String, Float, ForeignKey, DateTime, Text, Index
 from datetime import datetime, timezone
 from db import Base
 
@@ -29,6 +29,9 @@ class UserTopicActivity(Base):
     last_attempt = Column(DateTime, default=datetime.utcnow)
     average_score = Column(Float, default=0.0)
     mastery_status = Column(String, default="weak")
+    # running mean: average_score = score_sum / attempt_count, updated atomically
+    attempt_count = Column(Integer, nullable=False, default=0, server_default="0")
+    score_sum = Column(Float, nullable=False, default=0.0, server_default="0")
 
 class UserSyllabus(Base):
     __tablename__ = "user_syllabus"
@@ -66,3 +69,59 @@ class UserQuizHistory(Base):
     correct = Column(String, nullable=True)  # e.g. 'yes', 'no', or correct answer text
     score = Column(Float, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
+
+class QuizBankQuestion(Base):
+    """
+    Pre-generated, validated quiz questions served by /quiz.
+    `payload` holds the QuizQuestion JSON; `question_hash` dedupes regenerated questions.
+    """
+    __tablename__ = "quiz_bank"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic_key = Column(String, nullable=False)
+    difficulty = Column(String, nullable=False)
+    question_hash = Column(String(64), nullable=False, unique=True)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index("ix_quiz_bank_topic_difficulty", "topic_key", "difficulty"),)
+
+class QuizBankSeen(Base):
+    __tablename__ = "quiz_bank_seen"
+    username = Column(String, primary_key=True)
+    question_id = Column(Integer, ForeignKey("quiz_bank.id", ondelete="CASCADE"), primary_key=True)
+    seen_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class Job(Base):
+    """
+    Long-running background work (e.g. syllabus parsing), polled via /jobs/{id}.
+    `idempotency_key` makes resubmitting the same work return the existing job.
+    """
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True)
+    kind = Column(String, nullable=False)
+    username = Column(String, nullable=False, index=True)
+    idempotency_key = Column(String(64), nullable=False, unique=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    stage = Column(String, nullable=True)
+    progress = Column(Float, nullable=False, default=0.0)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    # the process holding the job's inputs, and until when it has promised to renew its claim
+    worker_id = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class SyllabusParseCache(Base):
+    """
+    Parsed topics of a syllabus pdf, shared across users.
+    Keyed by the file's sha256 and a hash of the extraction config (parser settings + model).
+    """
+    __tablename__ = "syllabus_parse_cache"
+    content_sha256 = Column(String(64), primary_key=True)
+    config_hash = Column(String(64), primary_key=True)
+    topics = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
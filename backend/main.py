@@ -10,12 +10,16 @@ from google import oauth2
 load_dotenv()
 
 from fastapi import FastAPI
-from routes import ask, oauth, quiz, progress, reminders, syllabus, upload, topics, voices, user
+from routes import ask, oauth, quiz, progress, reminders, syllabus, upload, topics, voices, user, metrics, jobs
 import threading
 from src.services.jsonl_uploader import run_uploader
+from services.llm_clients import init_registry, close_registry
+from services.quiz_bank import refiller as quiz_bank_refiller
+from services.jobs import job_queue
+from services.parser import shutdown_pool as shutdown_parse_pool
 import os 
 app = FastAPI()
-from db import Base, engine
+from db import Base, engine, dispose_async_engine
 from db_models import UserSyllabus, UserTopicActivity
 from fastapi.middleware.cors import CORSMiddleware
 import logging
@@ -41,6 +45,8 @@ app.include_router(topics.router)
 app.include_router(voices.router)
 app.include_router(oauth.router)
 app.include_router(user.router)
+app.include_router(metrics.router)
+app.include_router(jobs.router)
 
 
 
@@ -73,3 +79,39 @@ def root():
 def start_jsonl_uploader():
     t = threading.Thread(target=run_uploader, daemon=True)
     t.start()
+
+
+@app.on_event("startup")
+def start_llm_clients():
+    init_registry()
+
+
+@app.on_event("shutdown")
+async def stop_llm_clients():
+    await close_registry()
+
+
+@app.on_event("startup")
+async def start_quiz_bank_refiller():
+    quiz_bank_refiller.start()
+
+
+@app.on_event("shutdown")
+async def stop_quiz_bank_refiller():
+    await quiz_bank_refiller.stop()
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+    shutdown_parse_pool()
+
+
+@app.on_event("shutdown")
+async def close_async_db():
+    await dispose_async_engine()
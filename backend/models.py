@@ -25,6 +25,13 @@ class AskRequest(BaseModel):
     temperature: float
     max_tokens: int
     llm_config: BackendLLMConfig
+    defer_related_topics: bool = False # if True, related topics are fetched later via /explain/related
+    fused: bool = False # if True, topic + explanation + related topics come from one LLM call
+
+class RelatedTopicsRequest(BaseModel):
+    username: str
+    topic: str
+    llm_config: BackendLLMConfig
     
 
 # unused 
@@ -53,11 +60,12 @@ class QuizEvaluateRequest(BaseModel):
     username: str 
     topic: str
     question_index: int # Index of the question within the quiz context
-    user_answer: str    # The ID of the option selected by the user (e.g., 'A', 'B')
+    user_answer: str    # The ID of the option selected by the user (e.g., 'A', 'B'), or a free-text answer
     question: QuizQuestion 
     num_questions: Optional[int] = 1 # Total number of questions in the context
     difficulty: Optional[str] = "medium"
     llm_config: Optional[BackendLLMConfig] # Optional LLM config for evaluation
+    detailed_feedback: bool = False # if True, an LLM explanation is generated in the background (see /quiz/feedback/{job_id})
 
 
 # ---------- /progress ----------
@@ -0,0 +1,173 @@
+"""
+asyncio load generator for the backend api.
+
+- simulated users register, then loop over a weighted mix of
+  /explain, /quiz, /quiz/evaluate (answering the question they were served),
+  /progress/{user_id} and /reminders with exponential think time
+- reports requests, errors, throughput and p50/p95/p99 latency per route
+
+run against a backend started with MOCK_LLM_ENABLED=1, using the mock provider (no api budget spent):
+  PYTHONPATH=src python src/bench/loadgen.py --base-url http://localhost:8000 \
+      --users 50 --duration 60 --provider mock --model mock
+"""
+
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import httpx
+
+QUESTIONS = [
+    ("linear algebra", "What is an eigenvector?"),
+    ("linear algebra", "Why does a singular matrix have no inverse?"),
+    ("organic chemistry", "What makes a carbon chiral?"),
+    ("thermodynamics", "What does entropy measure?"),
+    ("graph theory", "How does Dijkstra's algorithm work?"),
+    ("microeconomics", "What is price elasticity of demand?"),
+]
+
+# relative weights of what a user does next; evaluate only happens when a question is pending
+USER_MIXES = {
+    "studying": {"explain": 5, "quiz": 3, "progress": 1, "reminders": 1},
+    "revising": {"explain": 1, "quiz": 6, "progress": 2, "reminders": 1},
+    "browsing": {"explain": 2, "quiz": 1, "progress": 4, "reminders": 3},
+}
+
+
+@dataclass
+class RouteStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: dict[int, int] = field(default_factory=lambda: defaultdict(int))
+
+
+class LoadGen:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.llm_config = {"provider": args.provider, "model": args.model, "api_key": args.api_key}
+        self.stats: dict[str, RouteStats] = defaultdict(RouteStats)
+        self.deadline = 0.0
+
+    async def _request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.stats[route].errors += 1
+            return None
+        elapsed = time.perf_counter() - started
+        stats = self.stats[route]
+        stats.statuses[response.status_code] += 1
+        # 404 from /progress just means the user has no progress yet, which is a valid answer
+        if response.status_code >= 500 or (response.status_code >= 400 and response.status_code != 404):
+            stats.errors += 1
+        else:
+            stats.latencies.append(elapsed)
+        return response
+
+    async def _user(self, client: httpx.AsyncClient, index: int):
+        username = f"{self.args.user_prefix}{index}"
+        try:
+            # not measured; a 400 just means the user exists from an earlier run
+            await client.post("/user/register", json={"name": username, "email": f"{username}@load.test", "password": "loadtest"})
+        except httpx.HTTPError:
+            pass
+        mix = USER_MIXES[random.choice(list(USER_MIXES))]
+        pending_question = None
+        while time.monotonic() < self.deadline:
+            if pending_question is not None:
+                topic, question = pending_question
+                pending_question = None
+                await self._request(client, "/quiz/evaluate", "POST", "/quiz/evaluate", json={
+                    "username": username,
+                    "topic": topic,
+                    "question_index": 0,
+                    "user_answer": random.choice([opt["id"] for opt in question["options"]]),
+                    "question": {k: question[k] for k in ("question", "options", "correctAnswerId", "feedback")},
+                    "llm_config": self.llm_config,
+                })
+            else:
+                action = random.choices(list(mix), weights=list(mix.values()))[0]
+                topic, question_text = random.choice(QUESTIONS)
+                if action == "explain":
+                    await self._request(client, "/explain", "POST", "/explain", json={
+                        "username": username,
+                        "question": question_text,
+                        "topic": topic if random.random() < 0.5 else None,
+                        "system_prompt": "You are a helpful tutor.",
+                        "temperature": 0.7,
+                        "max_tokens": self.args.max_tokens,
+                        "llm_config": self.llm_config,
+                    })
+                elif action == "quiz":
+                    response = await self._request(client, "/quiz", "POST", "/quiz", json={
+                        "topic": topic, "difficulty": "medium", "username": username, "llm_config": self.llm_config,
+                    })
+                    if response is not None and response.status_code == 200:
+                        pending_question = (topic, response.json())
+                elif action == "progress":
+                    await self._request(client, "/progress/{user_id}", "GET", f"/progress/{username}")
+                else:
+                    await self._request(client, "/reminders", "GET", "/reminders", params={"username": username})
+            await asyncio.sleep(random.expovariate(1 / self.args.think_time) if self.args.think_time > 0 else 0)
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=self.args.users, max_keepalive_connections=self.args.users)
+        async with httpx.AsyncClient(base_url=self.args.base_url, timeout=self.args.timeout, limits=limits) as client:
+            started = time.monotonic()
+            self.deadline = started + self.args.duration
+            users = []
+            for i in range(self.args.users):
+                users.append(asyncio.create_task(self._user(client, i)))
+                # ramp up instead of a thundering herd at t=0
+                await asyncio.sleep(self.args.ramp_up / max(1, self.args.users))
+            await asyncio.gather(*users)
+            self.report(time.monotonic() - started)
+
+    def report(self, elapsed: float):
+        print(f"\n{self.args.users} users, {elapsed:.1f}s, provider={self.args.provider}/{self.args.model}\n")
+        print(f"{'route':<22}{'ok':>7}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        total_ok = total_err = 0
+        for route in sorted(self.stats):
+            stats = self.stats[route]
+            ok = len(stats.latencies)
+            total_ok += ok
+            total_err += stats.errors
+            print(
+                f"{route:<22}{ok:>7}{stats.errors:>6}{ok / elapsed:>9.1f}"
+                f"{_percentile(stats.latencies, 50):>10.0f}{_percentile(stats.latencies, 95):>10.0f}{_percentile(stats.latencies, 99):>10.0f}"
+            )
+        print(f"{'total':<22}{total_ok:>7}{total_err:>6}{total_ok / elapsed:>9.1f}")
+        for route, stats in sorted(self.stats.items()):
+            if stats.errors:
+                print(f"  {route} status codes: {dict(stats.statuses)}")
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test the exam whisperer api")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--ramp-up", type=float, default=5, help="seconds to start all users")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds between a user's requests")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--provider", default="mock")
+    parser.add_argument("--model", default="mock")
+    parser.add_argument("--api-key", default="")
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--user-prefix", default="loadtest_")
+    asyncio.run(LoadGen(parser.parse_args()).run())
+
+
+if __name__ == "__main__":
+    main()
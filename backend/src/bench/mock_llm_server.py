@@ -0,0 +1,130 @@
+"""
+local stand-in for the llm providers, for load tests that exercise the real http client path.
+
+- POST /v1/chat/completions   openai wire format (json or sse stream)
+- POST /api/chat              ollama wire format (ndjson stream or single json)
+- latency, tokens/second and error rate come from MOCK_LLM_* (see services.mock_llm)
+
+run:
+  PYTHONPATH=src python src/bench/mock_llm_server.py --port 9100
+then point the backend at it:
+  OPENAI_BASE_URL=http://localhost:9100/v1 OLLAMA_BASE_URL=http://localhost:9100
+(or use llm_config.provider="mock" to skip http entirely)
+"""
+
+import time
+import json
+import uuid
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from services.mock_llm import mock_stream, MockLLMError
+
+app = FastAPI(title="mock llm")
+
+
+def _split_messages(messages: list[dict]) -> tuple[str, str]:
+    system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") != "system")
+    return system, prompt
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# --- openai ---
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    body = await request.json()
+    system, prompt = _split_messages(body.get("messages", []))
+    max_tokens = body.get("max_tokens") or 500
+    model = body.get("model", "mock")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    usage = {"prompt_tokens": _estimate_tokens(system + prompt), "prompt_tokens_details": {"cached_tokens": 0}}
+
+    if not body.get("stream"):
+        try:
+            text = "".join([chunk async for chunk in mock_stream(prompt, system, max_tokens)])
+        except MockLLMError as e:
+            return JSONResponse({"error": {"message": str(e), "type": "server_error"}}, status_code=500)
+        usage.update(completion_tokens=_estimate_tokens(text), total_tokens=usage["prompt_tokens"] + _estimate_tokens(text))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    async def events():
+        def chunk(delta: dict, finish=None, **extra) -> str:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+            return f"data: {json.dumps(data)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        produced = 0
+        try:
+            async for piece in mock_stream(prompt, system, max_tokens):
+                produced += 1
+                yield chunk({"content": piece})
+        except MockLLMError as e:
+            yield f"data: {json.dumps({'error': {'message': str(e)}})}\n\n"
+            return
+        yield chunk({}, finish="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage.update(completion_tokens=produced, total_tokens=usage["prompt_tokens"] + produced)
+            yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# --- ollama ---
+
+@app.post("/api/chat")
+async def ollama_chat(request: Request):
+    body = await request.json()
+    system, prompt = _split_messages(body.get("messages", []))
+    max_tokens = (body.get("options") or {}).get("num_predict") or 500
+    model = body.get("model", "mock")
+    prompt_tokens = _estimate_tokens(system + prompt)
+
+    def message(content: str, done: bool, **extra) -> dict:
+        return {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": content}, "done": done, **extra}
+
+    if body.get("stream") is False:
+        try:
+            text = "".join([chunk async for chunk in mock_stream(prompt, system, max_tokens)])
+        except MockLLMError as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+        return message(text, True, prompt_eval_count=prompt_tokens, eval_count=_estimate_tokens(text))
+
+    async def lines():
+        produced = 0
+        try:
+            async for piece in mock_stream(prompt, system, max_tokens):
+                produced += 1
+                yield json.dumps(message(piece, False)) + "\n"
+        except MockLLMError as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+        yield json.dumps(message("", True, done_reason="stop", prompt_eval_count=prompt_tokens, eval_count=produced)) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="mock openai/ollama server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
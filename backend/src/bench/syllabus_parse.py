@@ -0,0 +1,136 @@
+"""
+compares syllabus parsing strategies on sample pdfs.
+
+- text:       map-reduce llm extraction over the raw text (PARSE_STRUCTURED=0)
+- structured: outline / heading detection, llm only cleans up the sections
+- structure:  the structural stage alone, no llm at all
+- reports wall time, parse llm calls and topic recall against the expected
+  topics (--expected json {"file.pdf": [topics]}, else the pdf's own outline)
+
+run with synthetic samples and the mock provider:
+  MOCK_LLM_ENABLED=1 PYTHONPATH=.:src python src/bench/syllabus_parse.py --make-samples /tmp/syllabi
+or against a real model (recall of the llm paths is only meaningful there):
+  PYTHONPATH=.:src python src/bench/syllabus_parse.py --provider openai --model gpt-4o-mini \
+      --api-key $OPENAI_API_KEY syllabus.pdf
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+
+import fitz  # pymupdf
+
+from services import parser
+from services.llm_metrics import llm_metrics
+
+CHAPTERS = [
+    "Vectors and Matrices", "Systems of Linear Equations", "Determinants", "Eigenvalues and Eigenvectors",
+    "Thermodynamic Systems", "Entropy and the Second Law", "Graph Traversal", "Shortest Path Algorithms",
+]
+FILLER = (
+    "This section develops the main definitions, proves the central results and works through "
+    "examples that show how the ideas are applied in exam-style problems. "
+)
+
+
+def make_samples(directory: str) -> dict[str, list[str]]:
+    """Writes an outlined, a heading-only and an unstructured pdf, returns their expected topics."""
+    os.makedirs(directory, exist_ok=True)
+    for name, outline, heading_size, bold in (("outlined.pdf", True, 20, True), ("headings.pdf", False, 20, True), ("plain.pdf", False, 11, False)):
+        doc = fitz.open()
+        toc = []
+        for n, chapter in enumerate(CHAPTERS, 1):
+            for page_no in range(5):
+                page = doc.new_page()
+                page.insert_text((72, 40), "Course Notes", fontsize=9)
+                y = 72
+                if page_no == 0:
+                    page.insert_text((72, y), f"Chapter {n}: {chapter}", fontsize=heading_size, fontname="hebo" if bold else "helv")
+                    toc.append([1, f"Chapter {n}: {chapter}", doc.page_count])
+                    y += 30
+                for _ in range(30):
+                    page.insert_text((72, y), FILLER[:90], fontsize=11)
+                    y += 20
+        if outline:
+            doc.set_toc(toc)
+        doc.save(os.path.join(directory, name))
+        doc.close()
+    expected = {name: CHAPTERS for name in ("outlined.pdf", "headings.pdf", "plain.pdf")}
+    with open(os.path.join(directory, "expected.json"), "w") as f:
+        json.dump(expected, f, indent=2)
+    return expected
+
+
+def _words(text: str) -> set[str]:
+    return set(re.findall(r"[a-z0-9]+", text.casefold())) - {"and", "the", "of", "a", "to", "in"}
+
+
+def recall(expected: list[str], topics: list) -> float:
+    """Share of expected topics matched by a parsed topic (word overlap of at least half)."""
+    if not expected:
+        return float("nan")
+    names = [_words(t["topic"] if isinstance(t, dict) else str(t)) for t in topics]
+    hits = 0
+    for topic in expected:
+        want = _words(topic)
+        if any(want and len(want & got) / len(want) >= 0.5 for got in names):
+            hits += 1
+    return hits / len(expected)
+
+
+def _parse_calls() -> int:
+    return sum(sum(s.outcomes.values()) for (_, _, function), s in llm_metrics.series.items() if function == "parse")
+
+
+async def _structure_only(path: str) -> list:
+    page_count = await asyncio.to_thread(parser._page_count, path)
+    return await parser._outline_sections(path, page_count) or await parser._heading_sections(path, page_count) or []
+
+
+async def run(args: argparse.Namespace):
+    expected_by_file = make_samples(args.make_samples) if args.make_samples else {}
+    if args.expected:
+        with open(args.expected) as f:
+            expected_by_file.update(json.load(f))
+    llm_config = {"provider": args.provider, "model": args.model, "api_key": args.api_key}
+    modes = {
+        "text": lambda path: parser.parse_pdf_topics(path, llm_config, structured=False),
+        "structured": lambda path: parser.parse_pdf_topics(path, llm_config, structured=True),
+        "structure": _structure_only,
+    }
+
+    print(f"{'file':<24}{'mode':<12}{'pages':>7}{'seconds':>9}{'llm calls':>11}{'topics':>8}{'recall':>8}")
+    for path in args.pdfs:
+        name = os.path.basename(path)
+        expected = expected_by_file.get(name)
+        if expected is None:
+            expected = [title for level, title, _ in fitz.open(path).get_toc() if level == 1]
+        pages = fitz.open(path).page_count
+        for mode, parse in modes.items():
+            calls = _parse_calls()
+            started = time.perf_counter()
+            topics = await parse(path)
+            elapsed = time.perf_counter() - started
+            print(f"{name:<24}{mode:<12}{pages:>7}{elapsed:>9.2f}{_parse_calls() - calls:>11}{len(topics):>8}{recall(expected, topics):>8.2f}")
+    parser.shutdown_pool()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="benchmark syllabus parsing strategies")
+    arg_parser.add_argument("pdfs", nargs="*")
+    arg_parser.add_argument("--make-samples", metavar="DIR", help="write synthetic sample pdfs (and expected.json) to DIR first")
+    arg_parser.add_argument("--expected", help='json file {"file.pdf": ["topic", ...]}')
+    arg_parser.add_argument("--provider", default="mock")
+    arg_parser.add_argument("--model", default="mock")
+    arg_parser.add_argument("--api-key", default="")
+    args = arg_parser.parse_args()
+    if args.make_samples and not args.pdfs:
+        args.pdfs = [os.path.join(args.make_samples, name) for name in ("outlined.pdf", "headings.pdf", "plain.pdf")]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
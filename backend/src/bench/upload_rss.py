@@ -0,0 +1,126 @@
+"""
+peak server rss while several large uploads are in flight.
+
+- starts the backend with uvicorn and the mock provider enabled (or measures --pid of
+  one that is already running, which needs MOCK_LLM_ENABLED=1 for /syllabus)
+- posts N concurrent uploads of a --size-mb file to /syllabus or /voice_ask for each
+  --concurrency level, sampling the server's VmRSS from /proc every 10 ms (linux only)
+- reports baseline, peak and peak growth per concurrent upload; with streamed uploads
+  the growth stays around UPLOAD_CHUNK_SIZE per upload instead of the file size
+
+run:
+  DATABASE_URL=... PYTHONPATH=.:src python src/bench/upload_rss.py --size-mb 50 --concurrency 1,4,8
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+import fitz  # pymupdf
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_file(size_mb: float) -> str:
+    """A one-page pdf padded with an incompressible embedded file, so it really is size_mb on the wire."""
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Unit 1: Upload benchmarking")
+    doc.embfile_add("padding.bin", os.urandom(int(size_mb * 1024 * 1024)))
+    path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def sample_peak(pid: int, stop: asyncio.Event) -> float:
+    peak = 0.0
+    while not stop.is_set():
+        peak = max(peak, rss_mb(pid))
+        await asyncio.sleep(0.01)
+    return max(peak, rss_mb(pid))
+
+
+async def upload(client: httpx.AsyncClient, endpoint: str, path: str) -> int:
+    username = f"rss_{uuid.uuid4().hex[:8]}"
+    with open(path, "rb") as f:
+        if endpoint == "voice":
+            response = await client.post("/voice_ask", params={"username": username}, files={"file": ("clip.webm", f, "audio/webm")})
+        else:
+            data = {"username": username, "llm_provider": "mock", "llm_api_key": "-", "llm_model": "mock"}
+            response = await client.post("/syllabus", data=data, files={"pdf": ("syllabus.pdf", f, "application/pdf")})
+    return response.status_code
+
+
+async def run(args: argparse.Namespace, pid: int):
+    path = make_file(args.size_mb)
+    try:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=300) as client:
+            print(f"file {os.path.getsize(path) / 1024 / 1024:.1f} MB -> /{'voice_ask' if args.endpoint == 'voice' else 'syllabus'}\n")
+            print(f"{'uploads':>8}{'baseline MB':>13}{'peak MB':>10}{'MB/upload':>11}{'seconds':>9}  statuses")
+            for level in [int(n) for n in args.concurrency.split(",")]:
+                await asyncio.sleep(1)  # let background work from the previous level settle
+                baseline = rss_mb(pid)
+                stop = asyncio.Event()
+                sampler = asyncio.create_task(sample_peak(pid, stop))
+                started = time.perf_counter()
+                statuses = await asyncio.gather(*[upload(client, args.endpoint, path) for _ in range(level)])
+                elapsed = time.perf_counter() - started
+                stop.set()
+                peak = await sampler
+                print(f"{level:>8}{baseline:>13.1f}{peak:>10.1f}{(peak - baseline) / level:>11.1f}{elapsed:>9.2f}  {sorted(set(statuses))}")
+    finally:
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="peak rss of the backend under concurrent uploads")
+    parser.add_argument("--size-mb", type=float, default=50)
+    parser.add_argument("--concurrency", default="1,4,8", help="comma-separated numbers of concurrent uploads")
+    parser.add_argument("--endpoint", choices=("syllabus", "voice"), default="syllabus")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--pid", type=int, help="measure an already running server (with --base-url) instead of starting one")
+    parser.add_argument("--base-url")
+    args = parser.parse_args()
+
+    if args.pid:
+        args.base_url = args.base_url or "http://localhost:8000"
+        asyncio.run(run(args, args.pid))
+        return
+
+    args.base_url = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "MOCK_LLM_ENABLED": "1", "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.path.join(BACKEND_DIR, "src"), os.environ.get("PYTHONPATH")]))}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                if httpx.get(f"{args.base_url}/health").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        else:
+            sys.exit("backend did not start")
+        asyncio.run(run(args, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
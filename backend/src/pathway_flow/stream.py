@@ -1,8 +1,15 @@
+import asyncio
 import datetime
 import json
 import os
 
 
+def _append_line(path: str, record: dict):
+    # one write per record, so concurrent appends don't interleave
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
 async def stream_topic_event(username: str, topic: str, score: float):
     log_path = "data/topic_attempts.jsonl"
     os.makedirs(os.path.dirname(log_path), exist_ok=True)
@@ -10,14 +17,12 @@ async def stream_topic_event(username: str, topic: str, score: float):
     now = datetime.datetime.now(datetime.timezone.utc)
     ts = now.replace(microsecond=(now.microsecond // 1) * 1)
     timestamp = ts.isoformat()
-    with open(log_path, "a") as f:
-        f.write(json.dumps({
-            "username": username,
-            "topic": topic,
-            "score": score,
-            "timestamp": timestamp
-        })) 
-        f.write("\n")
+    await asyncio.to_thread(_append_line, log_path, {
+        "username": username,
+        "topic": topic,
+        "score": score,
+        "timestamp": timestamp
+    })
 
 
 async def stream_content_event(username: str, topic: str, content: str):
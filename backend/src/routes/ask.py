@@ -6,16 +6,22 @@ handles the /ask endpoint.
 - detects the topic from the question
 - logs the interaction (user, topic, timestamp)
 - streams the event to pathway for topic tracking
+- /explain/stream forwards tokens as NDJSON frames while the llm generates
+- /explain/related returns related topics when /explain was called with defer_related_topics
 """
 
+import os
+import json
 from fastapi import APIRouter, HTTPException, UploadFile
-from services.llm import explain_concept
+from fastapi.responses import StreamingResponse
+from services.llm import explain_concept, explain_concept_stream, suggest_related_topics
 from services.omnidimension import voice_ask
 from services.event_logger import log_user_event
+from services.uploads import save_upload, UploadTooLarge, UPLOAD_MAX_BYTES_AUDIO
 router = APIRouter()
 from fastapi import Form
-from models import AskRequest
-from services.llm import LLMProviderError
+from models import AskRequest, RelatedTopicsRequest
+from services.llm import LLMProviderError, LLMOverloadedError
 
 @router.post("/explain")
 async def explain_route(request_data: AskRequest):
@@ -31,7 +37,9 @@ async def explain_route(request_data: AskRequest):
             system_prompt=request_data.system_prompt,
             temperature=request_data.temperature,
             max_tokens=request_data.max_tokens,
-            llm_config=request_data.llm_config
+            llm_config=request_data.llm_config,
+            defer_related=request_data.defer_related_topics,
+            fused=request_data.fused
         )
         
         log_user_event(request_data.username, "explain", request_data.topic, {"question": request_data.question, "response": result.get("content")})
@@ -42,6 +50,8 @@ async def explain_route(request_data: AskRequest):
         status_code = 500
         if "API Key is missing" in detail_msg or "authentication" in detail_msg or "invalid_api_key" in detail_msg.lower():
             status_code = 401 # Unauthorized for API key issues
+        elif isinstance(e, LLMOverloadedError):
+            status_code = 503 # Provider queue full, client should back off and retry
         raise HTTPException(status_code=status_code, detail=detail_msg)
     except ValueError as e: # For validation errors within explain_concept
         raise HTTPException(status_code=400, detail=str(e))
@@ -49,15 +59,70 @@ async def explain_route(request_data: AskRequest):
         # Catch any other unexpected errors
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@router.post("/explain/related")
+async def explain_related_route(request_data: RelatedTopicsRequest):
+    """
+    Related topics for a topic returned by /explain. When the explanation was requested with
+    defer_related_topics, this joins the suggestion already running in the background.
+    """
+    related_topics = await suggest_related_topics(request_data.topic, request_data.username, request_data.llm_config)
+    return {"topic": request_data.topic, "related_topics": related_topics}
+
+@router.post("/explain/stream")
+async def explain_stream_route(request_data: AskRequest):
+    """
+    Same as /explain, but streams the explanation as newline-delimited JSON frames
+    (topic, token..., done | error) so the client can render it as it is generated.
+    """
+    frames = explain_concept_stream(
+        question=request_data.question,
+        username=request_data.username,
+        topic=request_data.topic or "",
+        system_prompt=request_data.system_prompt,
+        temperature=request_data.temperature,
+        max_tokens=request_data.max_tokens,
+        llm_config=request_data.llm_config
+    )
+    # Pull the first frame before responding so validation/config errors still map to HTTP status codes
+    try:
+        first_frame = await anext(frames)
+    except LLMProviderError as e:
+        detail_msg = str(e)
+        status_code = 500
+        if "API Key is missing" in detail_msg or "authentication" in detail_msg or "invalid_api_key" in detail_msg.lower():
+            status_code = 401
+        elif isinstance(e, LLMOverloadedError):
+            status_code = 503 # Provider queue full, client should back off and retry
+        raise HTTPException(status_code=status_code, detail=detail_msg)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def body():
+        final = None
+        yield json.dumps(first_frame) + "\n"
+        async for frame in frames:
+            if frame["type"] == "done":
+                final = frame
+            yield json.dumps(frame) + "\n"
+        if final is not None:
+            log_user_event(request_data.username, "explain", request_data.topic, {"question": request_data.question, "response": final.get("content"), "streamed": True})
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
 @router.post("/voice_ask")
 async def voice_ask_route(file: UploadFile, username: str, topic: str = ""):
     """
     accept voice input, transcribe, and explain using llm
     """
     try:
-        audio_data = await file.read()
-        result = await voice_ask(audio_data, username, topic)
-        log_user_event(username, "voice_ask", topic, {"file": file.filename})
+        upload = await save_upload(file, UPLOAD_MAX_BYTES_AUDIO, suffix=os.path.splitext(file.filename or "")[1])
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        result = await voice_ask(upload.path, username, topic)
+        log_user_event(username, "voice_ask", topic, {"file": file.filename, "bytes": upload.size})
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+    finally:
+        os.remove(upload.path)
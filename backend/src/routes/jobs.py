@@ -0,0 +1,31 @@
+"""
+status of background jobs (e.g. syllabus parsing).
+
+- GET /jobs/{job_id}          current status, stage, progress, result or error
+- GET /jobs/{job_id}/events   the same as server-sent events, one per change, until done
+"""
+
+import json
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from services.jobs import job_queue
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def body():
+        async for job in job_queue.events(job_id):
+            yield f"event: job\ndata: {json.dumps(job)}\n\n"
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
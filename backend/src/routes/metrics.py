@@ -0,0 +1,61 @@
+"""
+handles the /metrics endpoint.
+
+- reports runtime stats for the backend's shared resources
+- pooled llm provider clients (connections, idle/active, requests)
+- in-flight llm call coalescing (calls, executed, coalesced)
+- two-tier llm response cache (hits/misses per tier, bytes, evictions)
+- quiz bank refill worker and stock per (topic, difficulty)
+- background job workers (submitted, deduplicated, succeeded, failed, queued)
+- syllabus parses by source (pdf outline, heading fonts, llm over raw text)
+- shared syllabus parse cache hit rate, size and evictions
+- llm scheduler limits, queue depth and wait times per (provider, model, key)
+- prompt context tokens sent vs the old full-json serialization, per call type
+- provider prompt caching: prompt vs cached tokens, gemini cachedContents handles
+- llm call histograms per (provider, model, function): queue wait, time to first token,
+  latency, prompt/completion tokens, estimated cost, outcomes, response cache hits
+- database connection pools: in use, idle, overflow, checkout wait and timeouts
+- per-(user, topic) llm context cache hits, misses and invalidations
+- local topic classifier lookups and detect_topic llm calls avoided
+- llm routing retries, failovers, hedges, circuit breaker state per (provider, model)
+  and the model each call type was routed to
+"""
+
+from fastapi import APIRouter
+from services.llm_clients import get_registry
+from services.singleflight import singleflight_stats
+from services.llm_cache import llm_cache
+from services.quiz_bank import quiz_bank_stats
+from services.llm_scheduler import scheduler
+from services.llm_routing import router as llm_router
+from services.context_builder import context_builder
+from services.prompt_cache import prompt_cache_stats
+from services.llm_metrics import llm_metrics
+from services.topic_classifier import topic_classifier
+from services.user_context import user_context_cache
+from services.db_pool import pool_stats
+from services.jobs import job_queue
+from services.parser import parse_stats
+from services.syllabus_cache import syllabus_cache
+
+router = APIRouter()
+
+@router.get("/metrics")
+def get_metrics():
+    return {
+        "llm_clients": get_registry().stats(),
+        "llm_coalescing": singleflight_stats(),
+        "llm_cache": llm_cache.stats(),
+        "quiz_bank": quiz_bank_stats(),
+        "jobs": job_queue.stats(),
+        "syllabus_parse": parse_stats,
+        "syllabus_cache": syllabus_cache.stats(),
+        "llm_scheduler": scheduler.stats(),
+        "llm_routing": llm_router.stats(),
+        "llm_context": context_builder.stats(),
+        "llm_prompt_cache": prompt_cache_stats(),
+        "llm_calls": llm_metrics.stats(),
+        "topic_classifier": topic_classifier.stats(),
+        "user_context": user_context_cache.stats(),
+        "db_pool": pool_stats.stats(),
+    }
@@ -1,13 +1,13 @@
 import os
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from google.oauth2 import id_token
 from google.auth.transport import requests
 from sqlalchemy import select
-from sqlalchemy.orm import Session, session
+from sqlalchemy.orm import Session
 
 from utils.jwt import create_access_token
-from db import SessionLocal
+from db import get_db
 from db_models import User
 
 router = APIRouter(prefix="/oauth")
@@ -16,7 +16,7 @@ class GoogleAuthRequest(BaseModel):
     token: str
 
 @router.post("/google")
-def signin_with_google(payload: GoogleAuthRequest):
+def signin_with_google(payload: GoogleAuthRequest, session: Session = Depends(get_db)):
     try:
         # Verify the token
         id_info = id_token.verify_oauth2_token(
@@ -29,7 +29,6 @@ def signin_with_google(payload: GoogleAuthRequest):
         # Use the part before @ as username, fallback to Google name or email
         username = email.split("@")[0] if email else (google_name or "googleuser")
         stmt = select(User).where(User.username==username)
-        session = SessionLocal()
         user = session.execute(stmt).scalar_one_or_none()
         if not user:
             user = User(username=username, email=email)
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, HTTPException, Body, Request
-from services.quiz_utils import evaluate_quiz_answer
+from services.quiz_utils import evaluate_quiz_answer, get_feedback_job
 from services.event_logger import log_user_event
 import logging
 import json
 
-from services.llm import generate_quiz as llm_generate_quiz, LLMProviderError
+from services.llm import LLMProviderError, LLMOverloadedError
+from services.quiz_bank import next_question
 from src.models import QuizCreateRequest, QuizEvaluateRequest, BackendLLMConfig
 
 router = APIRouter()
@@ -12,7 +13,8 @@ router = APIRouter()
 @router.post("/quiz")
 async def create_quiz_question(request_data: QuizCreateRequest):
     """
-    Generate a single, LLM-driven quiz question for a given topic and difficulty.
+    Serve a single quiz question for a given topic and difficulty from the pre-generated
+    quiz bank, skipping questions this user has already seen. The bank is refilled via the LLM.
     """
     try:
         topic_for_llm = request_data.topic if request_data.topic is not None else ""
@@ -21,7 +23,8 @@ async def create_quiz_question(request_data: QuizCreateRequest):
             logging.error(f"Invalid llm_config received: {request_data.llm_config}")
             raise HTTPException(status_code=400, detail="Invalid LLM configuration format.")
 
-        quiz_question_response = await llm_generate_quiz(
+        quiz_question_response = await next_question(
+            username=request_data.username,
             topic=topic_for_llm,
             difficulty=request_data.difficulty,
             llm_config=request_data.llm_config,
@@ -37,6 +40,8 @@ async def create_quiz_question(request_data: QuizCreateRequest):
         status_code = 500
         if "API Key is missing" in detail_msg or "authentication" in detail_msg or "invalid_api_key" in detail_msg.lower():
             status_code = 401
+        elif isinstance(e, LLMOverloadedError):
+            status_code = 503 # Provider queue full, client should back off and retry
         raise HTTPException(status_code=status_code, detail=detail_msg)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -48,20 +53,35 @@ async def create_quiz_question(request_data: QuizCreateRequest):
 @router.post("/quiz/evaluate")
 async def evaluate_answer(request_data: QuizEvaluateRequest):
     """
-    Evaluate a single quiz question's answer using optional LLM evaluation.
+    Evaluate a single quiz question's answer. MCQ answers are scored immediately without the LLM;
+    free-text answers are scored by the LLM judge.
     """
     try:
-        
         return await evaluate_quiz_answer(
             username=request_data.username,
             topic=request_data.topic,
             question_index=request_data.question_index,
             user_answer=request_data.user_answer,
-            question=request_data.question,
+            question=request_data.question.model_dump(),
             num_questions=request_data.num_questions,
             difficulty=request_data.difficulty,
-            llm_config=request_data.llm_config
+            llm_config=request_data.llm_config,
+            detailed_feedback=request_data.detailed_feedback
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logging.exception(f"Error evaluating quiz answer: {e}")
-        raise HTTPException(status_code=500, detail=f"Internal server error evaluating quiz: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error evaluating quiz: {str(e)}")
+
+
+@router.get("/quiz/feedback/{job_id}")
+async def get_quiz_feedback(job_id: str):
+    """
+    Poll the LLM-written feedback requested with detailed_feedback on /quiz/evaluate.
+    status is one of: pending, done, error.
+    """
+    job = await get_feedback_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Feedback job not found or expired.")
+    return {"job_id": job_id, **job}
@@ -1,12 +1,12 @@
-from fastapi import APIRouter, UploadFile, Form
-from services.parser import parse_pdf_topics
-from pathway_flow.stream import stream_content_event
-from db import SessionLocal
-from db_models import UserSyllabus, Topic, User
-import tempfile, os, json
-import asyncio
+from fastapi import APIRouter, UploadFile, Form, HTTPException
+from sqlalchemy import select
+from db import AsyncSessionLocal
+from db_models import UserSyllabus
+import os, json
 from pydantic import BaseModel
-from services.event_logger import log_user_event
+from services.jobs import job_queue, JobQueueFull
+from services.syllabus_ingest import JOB_KIND, idempotency_key
+from services.uploads import save_upload, UploadTooLarge, UPLOAD_MAX_BYTES_PDF
 
 router = APIRouter()
 
@@ -15,15 +15,14 @@ class LLMConfig(BaseModel):
     api_key: str
     model: str
 
-def get_user_syllabus(username: str) -> list[str]:
-    db = SessionLocal()
-    record = db.query(UserSyllabus).filter_by(username=username).first()
-    db.close()
-    if record and record.topics_text:
-        return json.loads(record.topics_text)
+async def get_user_syllabus(username: str) -> list[str]:
+    async with AsyncSessionLocal() as db:
+        topics_text = await db.scalar(select(UserSyllabus.topics_text).filter_by(username=username))
+    if topics_text:
+        return json.loads(topics_text)
     return []
 
-@router.post("/syllabus")
+@router.post("/syllabus", status_code=202)
 async def upload_syllabus(
     pdf: UploadFile, 
     username: str = Form(...),
@@ -31,46 +30,25 @@ async def upload_syllabus(
     llm_api_key: str = Form(...),
     llm_model: str = Form(...)
 ):
+    """Queues the syllabus for parsing and returns the job; follow it via GET /jobs/{job_id}."""
     llm_config = {
         "provider": llm_provider,
         "api_key": llm_api_key,
         "model": llm_model
     }
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(await pdf.read())
-        tmp_path = tmp.name
-
-    topics = await parse_pdf_topics(tmp_path, llm_config)
-    os.remove(tmp_path)
-
-    db = SessionLocal()
     try:
-        existing = db.query(UserSyllabus).filter_by(username=username).first()
-        if existing:
-            existing.topics_text = json.dumps(topics)
-        else:
-            db.add(UserSyllabus(username=username, topics_text=json.dumps(topics)))
-        db.commit()
-
-        # --- Add topics to Topic table for this user (if not already present) ---
-        user = db.query(User).filter(User.username == username).first()
-        if user:
-            for t in topics:
-                topic_name = t["topic"] if isinstance(t, dict) and "topic" in t else (t if isinstance(t, str) else None)
-                if topic_name:
-                    exists = db.query(Topic).filter_by(username=user.username, topic_name=topic_name).first()
-                    if not exists:
-                        db.add(Topic(username=user.username, topic_name=topic_name))
-            db.commit()
-    finally:
-        db.close()
+        upload = await save_upload(pdf, UPLOAD_MAX_BYTES_PDF, suffix=".pdf")
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-    # Log user event for syllabus upload and topics
-    log_user_event(username, "syllabus_uploaded", None, {"topics": topics})
-
-    # stream all topics and content to Pathway
-    for t in topics:
-        if isinstance(t, dict) and "topic" in t and "content" in t:
-            await stream_content_event(username, t["topic"], t["content"])
-
-    return {"topics": topics}
+    key = idempotency_key(username, upload.sha256, llm_config)
+    payload = {"path": upload.path, "file_sha256": upload.sha256, "username": username, "llm_config": llm_config}
+    try:
+        job, created = await job_queue.submit(JOB_KIND, username, key, payload)
+    except JobQueueFull as e:
+        os.remove(upload.path)
+        raise HTTPException(status_code=503, detail=str(e))
+    if not created:
+        # same file already queued or running
+        os.remove(upload.path)
+    return {"job_id": job["id"], "status": job["status"]}
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from typing import List
-from db import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
 from db_models import User, Topic
 from pydantic import BaseModel
+from services.topic_classifier import topic_classifier
 
 router = APIRouter()
 
@@ -10,31 +13,24 @@ class TopicCreate(BaseModel):
     topic: str
 
 @router.get("/topics/{username}", response_model=List[str])
-def get_user_topics(username: str):
-    session = SessionLocal()
-    try:
-        user = session.query(User).filter_by(username=username).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found.")
-        topics = session.query(Topic).filter_by(username=username).all()
-        return [t.topic_name for t in topics]
-    finally:
-        session.close()
+async def get_user_topics(username: str, session: AsyncSession = Depends(get_async_db)):
+    user = (await session.execute(select(User.id).filter_by(username=username))).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found.")
+    topics = await session.scalars(select(Topic.topic_name).filter_by(username=username))
+    return list(topics)
 
 @router.post("/topics/{username}")
-def add_user_topic(username: str, topic_data: TopicCreate):
-    session = SessionLocal()
-    try:
-        user = session.query(User).filter_by(username=username).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found.")
-        # Check if topic already exists for user
-        existing = session.query(Topic).filter_by(username=username, topic_name=topic_data.topic).first()
-        if existing:
-            return {"message": "Topic already exists"}
-        topic = Topic(username=username, topic_name=topic_data.topic)
-        session.add(topic)
-        session.commit()
-        return {"message": "Topic added"}
-    finally:
-        session.close()
+async def add_user_topic(username: str, topic_data: TopicCreate, session: AsyncSession = Depends(get_async_db)):
+    user = (await session.execute(select(User.id).filter_by(username=username))).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found.")
+    # Check if topic already exists for user
+    existing = (await session.execute(select(Topic.id).filter_by(username=username, topic_name=topic_data.topic))).first()
+    if existing:
+        return {"message": "Topic already exists"}
+    topic = Topic(username=username, topic_name=topic_data.topic)
+    session.add(topic)
+    await session.commit()
+    topic_classifier.invalidate(username)
+    return {"message": "Topic added"}
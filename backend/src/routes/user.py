@@ -1,9 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, EmailStr
-from db import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
 from db_models import User, UserSyllabus, UserTopicProgress
 from sqlalchemy.exc import SQLAlchemyError
+import asyncio
 import logging
+from services.llm_routing import user_overrides
 from src.utils.jwt import hash_password, verify_password
 
 router = APIRouter()
@@ -23,43 +27,41 @@ def root():
     return {"msg": "exam whisperer backend running"}
 
 @router.post("/user/register")
-def register_user(req: UserCreateRequest):
-    db = SessionLocal()
+async def register_user(req: UserCreateRequest, db: AsyncSession = Depends(get_async_db)):
     try:
         logging.info(f"Attempting to register user: name={req.name}, email={req.email}")
-        if db.query(User).filter(User.username == req.name).first():
+        if (await db.execute(select(User.id).filter(User.username == req.name))).first():
             logging.warning(f"Registration failed: Username already registered: {req.name}")
             raise HTTPException(status_code=400, detail="Username already registered.")
-        if db.query(User).filter(User.email == req.email).first():
+        if (await db.execute(select(User.id).filter(User.email == req.email))).first():
             logging.warning(f"Registration failed: Email already registered: {req.email}")
             raise HTTPException(status_code=400, detail="Email already registered.")
+        # bcrypt is deliberately slow, keep it off the event loop
+        password_hash = await asyncio.to_thread(hash_password, req.password)
         user = User(
             username=req.name,
             email=req.email,
-            password_hash=hash_password(req.password),
+            password_hash=password_hash,
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         logging.info(f"User registered successfully: id={user.id}, username={user.username}, email={user.email}")
         return {"id": user.id, "username": user.username, "email": user.email}
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         logging.error(f"DB error during registration: {e}")
         raise HTTPException(status_code=500, detail=f"DB error: {e}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logging.error(f"Unexpected error during registration: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
-    finally:
-        db.close()
 
 @router.post("/user/login")
-def login_user(req: UserLoginRequest):
-    db = SessionLocal()
+async def login_user(req: UserLoginRequest, db: AsyncSession = Depends(get_async_db)):
     try:
-        user = db.query(User).filter(User.username == req.name).first()
-        if not user or not user.password_hash or not verify_password(req.password, user.password_hash):
+        user = (await db.execute(select(User).filter(User.username == req.name))).scalars().first()
+        if not user or not user.password_hash or not await asyncio.to_thread(verify_password, req.password, user.password_hash):
             logging.warning(f"Login failed for username: {req.name}")
             raise HTTPException(status_code=401, detail="Invalid username or password.")
         logging.info(f"User logged in: id={user.id}, username={user.username}")
@@ -67,49 +69,39 @@ def login_user(req: UserLoginRequest):
     except Exception as e:
         logging.error(f"Login error: {e}")
         raise HTTPException(status_code=500, detail=f"Login error: {e}")
-    finally:
-        db.close()
 
 @router.post("/user/config")
-def update_user_config(username: str, llm_provider: str = None, llm_api_key: str = None, llm_model: str = None):
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found.")
-        if llm_provider is not None:
-            user.llm_provider = llm_provider
-        if llm_api_key is not None:
-            user.llm_api_key = llm_api_key
-        if llm_model is not None:
-            user.llm_model = llm_model
-        db.commit()
-        db.refresh(user)
-        return {"id": user.id, "username": user.username, "email": user.email, "llm_provider": user.llm_provider, "llm_model": user.llm_model}
-    finally:
-        db.close()
+async def update_user_config(username: str, llm_provider: str = None, llm_api_key: str = None, llm_model: str = None, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).filter(User.username == username))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found.")
+    if llm_provider is not None:
+        user.llm_provider = llm_provider
+    if llm_api_key is not None:
+        user.llm_api_key = llm_api_key
+    if llm_model is not None:
+        user.llm_model = llm_model
+    await db.commit()
+    user_overrides.invalidate(username)
+    return {"id": user.id, "username": user.username, "email": user.email, "llm_provider": user.llm_provider, "llm_model": user.llm_model}
 
 @router.get("/user/{username}")
-def get_user(username: str):
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found.")
-        # Fetch topics and progress
-        syllabus = db.query(UserSyllabus).filter(UserSyllabus.username == username).first()
-        progress = db.query(UserTopicProgress).filter(UserTopicProgress.username == username).all()
-        return {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "llm_provider": user.llm_provider,
-            "llm_model": user.llm_model,
-            "topics": syllabus.topics_text if syllabus else None,
-            "progress": [
-                {"topic": p.topic, "latest_score": p.latest_score, "average_score": p.average_score, "last_attempt": p.last_attempt.isoformat(), "trend": p.trend, "status": p.status}
-                for p in progress
-            ]
-        }
-    finally:
-        db.close()
+async def get_user(username: str, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).filter(User.username == username))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found.")
+    # Fetch topics and progress
+    syllabus = (await db.execute(select(UserSyllabus.topics_text).filter(UserSyllabus.username == username))).first()
+    progress = (await db.execute(select(UserTopicProgress).filter(UserTopicProgress.username == username))).scalars().all()
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "llm_provider": user.llm_provider,
+        "llm_model": user.llm_model,
+        "topics": syllabus.topics_text if syllabus else None,
+        "progress": [
+            {"topic": p.topic, "latest_score": p.latest_score, "average_score": p.average_score, "last_attempt": p.last_attempt.isoformat(), "trend": p.trend, "status": p.status}
+            for p in progress
+        ]
+    }
@@ -0,0 +1,200 @@
+"""
+builds the user-context block that goes into llm prompts.
+
+- rough token estimate (~4 chars per token) instead of a tokenizer dependency
+- syllabus topics ranked by word overlap with the current topic
+- quiz history newest first, boosted by word overlap with the current question
+  (query); notes truncated
+- greedy fill up to a per-call-type token budget, rendered as compact text
+  instead of json.dumps(indent=2)
+- split into a slowly changing part (syllabus, notes) and a per-attempt part
+  (progress, quiz history) so prompts can keep a stable, cacheable prefix
+- counts estimated prompt tokens saved against the old serialization for /metrics
+"""
+
+import os
+import re
+import json
+import math
+from typing import Any, Optional
+
+NO_CONTEXT = "[No context available]"
+
+DEFAULT_BUDGETS = {"explain": 500, "related": 200, "judge": 120, "feedback": 200}
+DEFAULT_BUDGET = 300
+# notes are free text and can be huge; never let them take more than this share of the budget
+NOTES_SHARE = 0.4
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"the", "a", "an", "of", "and", "or", "to", "in", "on", "for", "with", "is", "what", "how", "why", "are"}
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def context_budget(call_type: str) -> int:
+    return int(os.getenv(f"LLM_CONTEXT_BUDGET_{call_type.upper()}", DEFAULT_BUDGETS.get(call_type, DEFAULT_BUDGET)))
+
+
+def _words(text: str) -> set[str]:
+    return {w for w in _WORD.findall(text.casefold()) if w not in _STOPWORDS}
+
+
+def _relevance(text: str, query_words: set[str], topic: str) -> float:
+    if topic and topic.casefold() in text.casefold():
+        return 1.0
+    words = _words(text)
+    if not words or not query_words:
+        return 0.0
+    return len(words & query_words) / len(query_words)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[: max_chars - 1].rstrip() + "…"
+
+
+def _syllabus_line(item: Any) -> str:
+    if isinstance(item, dict):
+        name = item.get("topic", "")
+        desc = item.get("content") or item.get("description") or ""
+        return f"- {name}: {_truncate(desc, 40)}" if desc else f"- {name}"
+    return f"- {item}"
+
+
+_CORRECT = {"yes", "y", "true", "1", "correct"}
+_WRONG = {"no", "n", "false", "0", "wrong", "incorrect"}
+# how much a past question sharing every word with the current one outranks recency
+QUERY_BOOST = 0.5
+
+
+def _verdict(row: dict) -> str:
+    """user_quiz_history.correct is a string ('yes' / 'no', or the correct answer's text)."""
+    correct = row.get("correct")
+    score = row.get("score")
+    if isinstance(correct, bool):
+        return "correct" if correct else "wrong"
+    flag = str(correct).strip().casefold() if correct is not None else ""
+    if flag in _CORRECT:
+        return "correct"
+    if flag in _WRONG:
+        return "wrong"
+    if isinstance(score, (int, float)):
+        return "correct" if score >= 0.5 else "wrong"
+    if not flag:
+        return "unscored"
+    # the correct answer's text: compare it with what the user answered
+    answer = " ".join(str(row.get("answer") or "").casefold().split())
+    return "correct" if answer == " ".join(flag.split()) else f"wrong, expected: {_truncate(str(correct), 15)}"
+
+
+def _quiz_line(row: dict) -> str:
+    verdict = _verdict(row)
+    score = row.get("score")
+    verdict += f" ({score:.2f})" if isinstance(score, (int, float)) else ""
+    return f"- Q: {_truncate(row.get('question') or '', 30)} | A: {_truncate(str(row.get('answer') or ''), 15)} | {verdict}"
+
+
+def _progress_line(prefs: dict) -> str:
+    fields = [f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in prefs.items() if v is not None and k != "last_attempt"]
+    return "Progress: " + ", ".join(fields) if fields else ""
+
+
+class ContextBuilder:
+    def __init__(self):
+        self.counters: dict[str, dict[str, int]] = {}
+
+    def build(self, user_context: Optional[dict], topic: str, call_type: str, query: str = "") -> str:
+        """Renders user_context for a prompt within the call type's token budget."""
+        static, dynamic = self.build_segments(user_context, topic, call_type, query)
+        return "\n".join(part for part in (static, dynamic) if part) or NO_CONTEXT
+
+    def build_segments(self, user_context: Optional[dict], topic: str, call_type: str, query: str = "") -> tuple[str, str]:
+        """
+        Like build, but returns (static, dynamic): syllabus and notes, which only change when the
+        user uploads or edits them, and progress and quiz history, which change on every attempt.
+        Syllabus ranking only looks at the topic (not the question) so the static part stays
+        byte-identical across questions on the same topic; the question (query) only reorders
+        the quiz history in the dynamic part.
+        """
+        if not user_context:
+            return "", ""
+        budget = context_budget(call_type)
+        topic_words = _words(topic)
+        query_words = _words(query)
+
+        # (section, priority, line); higher priority is kept first when the budget runs out
+        items: list[tuple[str, float, str]] = []
+        progress = _progress_line(user_context.get("preferences") or {})
+        if progress:
+            items.append(("progress", 3.0, progress))
+        notes = (user_context.get("notes") or "").strip()
+        if notes:
+            items.append(("notes", 2.0, "Notes: " + _truncate(notes, int(budget * NOTES_SHARE))))
+        for i, row in enumerate(user_context.get("quiz_history") or []):
+            boost = QUERY_BOOST * _relevance(row.get("question") or "", query_words, "")
+            items.append(("quiz", 1.5 - i * 0.1 + boost, _quiz_line(row)))
+        for item in user_context.get("syllabus_topics") or []:
+            line = _syllabus_line(item)
+            score = _relevance(line, topic_words, topic)
+            if score == 0 and isinstance(item, dict):
+                # unrelated topics are still useful for "what next", but only by name
+                line = f"- {item.get('topic', '')}"
+            items.append(("syllabus", score, line))
+
+        kept: dict[str, list[str]] = {}
+        used = 0
+        for section, _, line in sorted(items, key=lambda it: it[1], reverse=True):
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                continue
+            kept.setdefault(section, []).append(line)
+            used += cost
+
+        static, dynamic = [], []
+        if "syllabus" in kept:
+            static.append("Syllabus topics (most relevant first):\n" + "\n".join(kept["syllabus"]))
+        if "notes" in kept:
+            static.extend(kept["notes"])
+        if "progress" in kept:
+            dynamic.extend(kept["progress"])
+        if "quiz" in kept:
+            dynamic.append("Recent quiz answers:\n" + "\n".join(kept["quiz"]))
+        segments = "\n".join(static), "\n".join(dynamic)
+
+        self._record(call_type, user_context, "\n".join(segments))
+        return segments
+
+    def _record(self, call_type: str, user_context: dict, rendered: str):
+        baseline = estimate_tokens(json.dumps(user_context, indent=2, default=str))
+        sent = estimate_tokens(rendered)
+        counters = self.counters.setdefault(call_type, {"calls": 0, "baseline_tokens": 0, "sent_tokens": 0})
+        counters["calls"] += 1
+        counters["baseline_tokens"] += baseline
+        counters["sent_tokens"] += sent
+
+    def stats(self) -> dict:
+        per_type = {
+            call_type: {**c, "saved_tokens": c["baseline_tokens"] - c["sent_tokens"], "budget": context_budget(call_type)}
+            for call_type, c in self.counters.items()
+        }
+        baseline = sum(c["baseline_tokens"] for c in self.counters.values())
+        sent = sum(c["sent_tokens"] for c in self.counters.values())
+        return {
+            "saved_tokens": baseline - sent,
+            "saved_ratio": round(1 - sent / baseline, 3) if baseline else 0.0,
+            "by_call_type": per_type,
+        }
+
+
+context_builder = ContextBuilder()
+
+
+def build_context(user_context: Optional[dict], topic: str, call_type: str, query: str = "") -> str:
+    return context_builder.build(user_context, topic, call_type, query)
+
+
+def build_context_segments(user_context: Optional[dict], topic: str, call_type: str, query: str = "") -> tuple[str, str]:
+    return context_builder.build_segments(user_context, topic, call_type, query)
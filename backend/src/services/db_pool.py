@@ -0,0 +1,64 @@
+"""
+connection pool gauges for /metrics.
+
+- one entry per engine: "sync" (SessionLocal, threads) and "async" (AsyncSessionLocal,
+  request path)
+- gauges: connections in use, idle, overflow in use, capacity (pool size + max overflow)
+  and utilization, read from the pool when /metrics is called
+- checkout wait histogram and timeout counter, fed by db.checkout_observers on every
+  checkout; a rising wait p99 or any timeouts mean the pool is the bottleneck
+  (tune DB_POOL_SIZE / DB_MAX_OVERFLOW, or find the leak)
+"""
+
+import threading
+
+from db import engine, async_engine, checkout_observers, DB_MAX_OVERFLOW
+from services.llm_metrics import Histogram
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _engines() -> dict:
+    # looked up on every call, engine.dispose() replaces the pool object
+    return {"sync": engine.pool, "async": async_engine.sync_engine.pool}
+
+
+class PoolStats:
+    def __init__(self):
+        self.waits = {name: Histogram(WAIT_BUCKETS) for name in ("sync", "async")}
+        self.timeouts = {name: 0 for name in ("sync", "async")}
+        # sync checkouts happen on worker threads
+        self.lock = threading.Lock()
+
+    def observe(self, pool, waited: float, timed_out: bool):
+        name = "async" if pool is async_engine.sync_engine.pool else "sync"
+        with self.lock:
+            self.waits[name].observe(waited)
+            if timed_out:
+                self.timeouts[name] += 1
+
+    def stats(self) -> dict:
+        result = {}
+        for name, pool in _engines().items():
+            entry = {"pool": type(pool).__name__}
+            if hasattr(pool, "checkedout"):
+                size, in_use = pool.size(), pool.checkedout()
+                capacity = size + DB_MAX_OVERFLOW
+                entry.update({
+                    "size": size,
+                    "max_overflow": DB_MAX_OVERFLOW,
+                    "in_use": in_use,
+                    "idle": pool.checkedin(),
+                    "overflow_in_use": max(pool.overflow(), 0),
+                    "capacity": capacity,
+                    "utilization": round(in_use / capacity, 3) if capacity else None,
+                })
+            with self.lock:
+                entry["checkout_wait_seconds"] = self.waits[name].snapshot()
+                entry["checkout_timeouts"] = self.timeouts[name]
+            result[name] = entry
+        return result
+
+
+pool_stats = PoolStats()
+checkout_observers.append(pool_stats.observe)
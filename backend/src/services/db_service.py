@@ -2,18 +2,19 @@ from db import SessionLocal
 from sqlalchemy.exc import SQLAlchemyError
 from db_models import UserTopicProgress
 from datetime import datetime
+from services.user_context import user_context_cache
 
 def upsert_user_topic_progress(record: dict):
     """
     Upsert one progress record via SQLAlchemy ORM.
-    `record` keys: user_id, topic, latest_score, average_score,
+    `record` keys: username, topic, latest_score, average_score,
                 last_attempt (ISO string), trend, status
     """
     session = SessionLocal()
     try:
         obj = session.get(
             UserTopicProgress,
-            (record["user_id"], record["topic"])
+            (record["username"], record["topic"])
         )
         # parse timestamp string to datetime
         last_attempt = record["last_attempt"]
@@ -30,7 +31,7 @@ def upsert_user_topic_progress(record: dict):
         else:
             # insert new
             obj = UserTopicProgress(
-                user_id       = record["user_id"],
+                username      = record["username"],
                 topic         = record["topic"],
                 latest_score  = record["latest_score"],
                 average_score = record["average_score"],
@@ -41,6 +42,7 @@ def upsert_user_topic_progress(record: dict):
             session.add(obj)
 
         session.commit()
+        user_context_cache.invalidate(record["username"], record["topic"])
     except SQLAlchemyError as e:
         session.rollback()
         print("DB upsert error:", e)
@@ -0,0 +1,394 @@
+"""
+background jobs for long-running requests (syllabus parsing).
+
+- every job is a row in the jobs table (status, stage, progress, result, error),
+  so GET /jobs/{id} can answer without touching the worker
+- an in-process pool of JOB_WORKERS asyncio workers runs them; handlers are
+  registered per kind and report progress through JobContext.progress
+- submitting an idempotency key again returns the existing job only while it is
+  queued or running; finished jobs (and ones whose worker is gone) are rerun, reusing
+  results is up to the handler (e.g. the syllabus parse cache). The reset is a
+  conditional update, so concurrent resubmits rerun it once
+- job inputs (temp files, llm config with the api key) are only kept in memory by
+  the worker that accepted the job, so each job is tied to that worker: it records
+  worker_id and renews lease_expires_at every JOB_LEASE_SECONDS / 3 while the job
+  is queued or running there
+- jobs whose lease expired (their worker stopped or crashed) are marked failed by
+  whichever worker sweeps next, never jobs another live worker is still running
+- short jobs (e.g. quiz feedback) can be spawned as their own task instead of waiting
+  behind the worker pool; kinds registered with a retention have their finished rows
+  deleted after it
+- SSE listeners get pushed updates for jobs of their own worker; for jobs running
+  in another worker the row is polled every JOB_EVENTS_POLL_INTERVAL seconds
+"""
+
+import os
+import json
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from db import SessionLocal
+from db_models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# SSE clients get the current state at least this often, even without progress events
+JOB_EVENTS_HEARTBEAT = float(os.getenv("JOB_EVENTS_HEARTBEAT", "15"))
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+ACTIVE_STATUSES = ("queued", "running")
+
+# unique per process, several uvicorn workers share the jobs table
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _as_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "username": job.username,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": job.progress,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+# --- db helpers (blocking, called via asyncio.to_thread) ---
+
+def _lease() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+
+
+def _claim(kind: str, username: str, idempotency_key: str) -> tuple[dict, bool]:
+    """
+    Creates a queued job for the key owned by this worker, or returns the existing one
+    while it is still queued or running. Finished jobs, and active ones whose worker's
+    lease ran out, are taken over and rerun.
+    """
+    db = SessionLocal()
+    try:
+        for _ in range(3):
+            job = db.query(Job).filter_by(idempotency_key=idempotency_key).first()
+            if job is not None:
+                now = datetime.utcnow()
+                leased = job.lease_expires_at is not None and job.lease_expires_at >= now
+                if job.status in ACTIVE_STATUSES and leased:
+                    return _as_dict(job), False
+                # only one concurrent resubmit wins the takeover
+                taken = (
+                    db.query(Job)
+                    .filter(Job.id == job.id, Job.status == job.status, Job.updated_at == job.updated_at)
+                    .update({
+                        "status": "queued", "stage": None, "progress": 0.0, "result": None, "error": None,
+                        "worker_id": WORKER_ID, "lease_expires_at": _lease(), "updated_at": now,
+                    }, synchronize_session=False)
+                )
+                db.commit()
+                db.expire_all()
+                if taken:
+                    return _as_dict(db.get(Job, job.id)), True
+                continue
+            job = Job(
+                id=uuid.uuid4().hex, kind=kind, username=username, idempotency_key=idempotency_key,
+                status="queued", progress=0.0, worker_id=WORKER_ID, lease_expires_at=_lease(),
+            )
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError:
+                # the same work was submitted concurrently, return that job
+                db.rollback()
+                continue
+            return _as_dict(job), True
+        raise RuntimeError(f"could not claim job for key {idempotency_key}")
+    finally:
+        db.close()
+
+
+def _update(job_id: str, **fields) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is None:
+            return None
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.updated_at = datetime.utcnow()
+        db.commit()
+        return _as_dict(job)
+    finally:
+        db.close()
+
+
+def _load(job_id: str) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        return _as_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def _renew_leases() -> int:
+    """Extends the lease of every active job this worker holds."""
+    db = SessionLocal()
+    try:
+        count = (
+            db.query(Job)
+            .filter(Job.worker_id == WORKER_ID, Job.status.in_(ACTIVE_STATUSES))
+            .update({"lease_expires_at": _lease()}, synchronize_session=False)
+        )
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+def _fail_expired(owned: bool = False) -> int:
+    """
+    Fails active jobs whose worker stopped renewing their lease (stopped or crashed),
+    or with owned=True this worker's own active jobs (on shutdown).
+    """
+    if owned:
+        stale = Job.worker_id == WORKER_ID
+    else:
+        stale = or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < datetime.utcnow())
+    db = SessionLocal()
+    try:
+        count = (
+            db.query(Job)
+            .filter(Job.status.in_(ACTIVE_STATUSES), stale)
+            .update({"status": "failed", "error": "interrupted by a server restart, please resubmit", "updated_at": datetime.utcnow()}, synchronize_session=False)
+        )
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+def _delete_finished(kind: str, retention_seconds: float) -> int:
+    db = SessionLocal()
+    try:
+        count = (
+            db.query(Job)
+            .filter(
+                Job.kind == kind,
+                Job.status.in_(TERMINAL_STATUSES),
+                Job.updated_at < datetime.utcnow() - timedelta(seconds=retention_seconds),
+            )
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+# --- worker pool ---
+
+class JobContext:
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self.queue = queue
+        self.job_id = job_id
+
+    async def progress(self, fraction: float, stage: str):
+        await self.queue._set(self.job_id, progress=round(min(max(fraction, 0.0), 1.0), 3), stage=stage)
+
+
+Handler = Callable[[JobContext, dict], Awaitable[dict]]
+
+
+class JobQueue:
+    def __init__(self):
+        self.handlers: dict[str, Handler] = {}
+        self.retention: dict[str, float] = {}
+        self.spawned: set[asyncio.Task] = set()
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: list[asyncio.Task] = []
+        self.leases: Optional[asyncio.Task] = None
+        # ids of jobs queued or running in this process
+        self.local: set[str] = set()
+        self.listeners: dict[str, set[asyncio.Queue]] = {}
+        self.counters = {"submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "rejected": 0, "expired": 0}
+
+    def register(self, kind: str, handler: Handler, retention_seconds: Optional[float] = None):
+        """retention_seconds: delete finished jobs of this kind after that long (None keeps them)."""
+        self.handlers[kind] = handler
+        if retention_seconds is not None:
+            self.retention[kind] = retention_seconds
+
+    def start(self):
+        if self.workers:
+            return
+        self.queue = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(JOB_WORKERS)]
+        self.leases = asyncio.create_task(self._lease_loop())
+
+    async def stop(self):
+        tasks = self.workers + list(self.spawned) + ([self.leases] if self.leases else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.leases = None
+        # their inputs die with this process, don't make clients wait for the lease to run out
+        try:
+            await asyncio.to_thread(_fail_expired, True)
+        except Exception as e:
+            logger.error(f"[jobs] could not fail unfinished jobs on shutdown: {e}")
+        self.local.clear()
+
+    async def _lease_loop(self):
+        """Keeps this worker's leases alive and fails the jobs of workers that are gone."""
+        while True:
+            try:
+                await asyncio.to_thread(_renew_leases)
+                expired = await asyncio.to_thread(_fail_expired)
+                if expired:
+                    self.counters["expired"] += expired
+                    logger.warning(f"[jobs] marked {expired} jobs of stopped workers as failed")
+                for kind, retention_seconds in self.retention.items():
+                    await asyncio.to_thread(_delete_finished, kind, retention_seconds)
+            except Exception as e:
+                logger.error(f"[jobs] lease renewal failed: {e}")
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+
+    async def submit(self, kind: str, username: str, idempotency_key: str, payload: dict) -> tuple[dict, bool]:
+        """
+        Queues a job, or returns the existing queued/running one for this idempotency key.
+        Returns (job, created); when created is False the caller still owns anything in payload.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"no handler registered for job kind {kind!r}")
+        if self.queue is None:
+            raise JobQueueFull("job workers are not running")
+        if self.queue.full():
+            self.counters["rejected"] += 1
+            raise JobQueueFull("too many jobs queued, try again shortly")
+        job, created = await asyncio.to_thread(_claim, kind, username, idempotency_key)
+        if not created:
+            self.counters["deduplicated"] += 1
+            return job, False
+        try:
+            self.queue.put_nowait((job["id"], kind, payload))
+            self.local.add(job["id"])
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            await self._set(job["id"], status="failed", error="job queue is full, please resubmit")
+            raise JobQueueFull("too many jobs queued, try again shortly")
+        self.counters["submitted"] += 1
+        return job, True
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(_load, job_id)
+
+    async def events(self, job_id: str) -> AsyncIterator[dict]:
+        """
+        Yields the job's state now and after every change, until it succeeds or fails.
+        Changes are pushed for jobs of this worker and polled from the row for jobs of
+        other workers; either way the state is repeated every JOB_EVENTS_HEARTBEAT seconds.
+        """
+        listener: asyncio.Queue = asyncio.Queue()
+        self.listeners.setdefault(job_id, set()).add(listener)
+        loop = asyncio.get_running_loop()
+        try:
+            job = await self.get(job_id)
+            while job is not None:
+                yield job
+                if job["status"] in TERMINAL_STATUSES:
+                    return
+                sent, sent_at = job, loop.time()
+                while job == sent:
+                    wait = JOB_EVENTS_HEARTBEAT if job_id in self.local else JOB_EVENTS_POLL_INTERVAL
+                    try:
+                        job = await asyncio.wait_for(listener.get(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        job = await self.get(job_id)
+                        if job is None or loop.time() - sent_at >= JOB_EVENTS_HEARTBEAT:
+                            break
+        finally:
+            listeners = self.listeners.get(job_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    self.listeners.pop(job_id, None)
+
+    async def _set(self, job_id: str, **fields):
+        job = await asyncio.to_thread(_update, job_id, **fields)
+        if job is not None:
+            for listener in self.listeners.get(job_id, ()):
+                listener.put_nowait(job)
+
+    async def spawn(self, kind: str, username: str, idempotency_key: str, payload: dict) -> tuple[dict, bool]:
+        """Like submit, but runs the job right away as its own task (for short jobs that shouldn't queue)."""
+        if kind not in self.handlers:
+            raise ValueError(f"no handler registered for job kind {kind!r}")
+        job, created = await asyncio.to_thread(_claim, kind, username, idempotency_key)
+        if not created:
+            self.counters["deduplicated"] += 1
+            return job, False
+        self.local.add(job["id"])
+        task = asyncio.create_task(self._run(job["id"], kind, payload))
+        self.spawned.add(task)
+        task.add_done_callback(self.spawned.discard)
+        self.counters["submitted"] += 1
+        return job, True
+
+    async def _run(self, job_id: str, kind: str, payload: dict):
+        try:
+            await self._set(job_id, status="running", stage="started")
+            result = await self.handlers[kind](JobContext(self, job_id), payload)
+            await self._set(job_id, status="succeeded", stage="done", progress=1.0, result=json.dumps(result))
+            self.counters["succeeded"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[jobs] {kind} job {job_id} failed: {e}")
+            self.counters["failed"] += 1
+            try:
+                await self._set(job_id, status="failed", error=str(e))
+            except Exception as db_error:
+                logger.error(f"[jobs] could not record failure of job {job_id}: {db_error}")
+        finally:
+            self.local.discard(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id, kind, payload = await self.queue.get()
+            try:
+                await self._run(job_id, kind, payload)
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "workers": len(self.workers),
+            "spawned": len(self.spawned),
+            "worker_id": WORKER_ID,
+            "local_jobs": len(self.local),
+            "sse_listeners": sum(len(v) for v in self.listeners.values()),
+        }
+
+
+job_queue = JobQueue()
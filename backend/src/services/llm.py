@@ -1,13 +1,24 @@
-import os, json, logging
+import os, re, json, time, logging, asyncio
 import httpx
 from pathlib import Path
 from cachetools import TTLCache
-from pydantic import BaseModel
-from typing import Optional
-from models import BackendLLMConfig
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator, Optional
+from models import BackendLLMConfig, QuizQuestion
+from services.llm_clients import get_registry
+from services.singleflight import SingleFlight
+from services.llm_cache import llm_cache, make_key
+from services.context_builder import build_context_segments, estimate_tokens
+from services.llm_metrics import llm_metrics, call_usage, note_usage, maybe_log_prompt
+from services.mock_llm import mock_stream, MockLLMError, MOCK_LLM_ENABLED
+from services.prompt_cache import prompt_usage, gemini_cached_contents, OLLAMA_KEEP_ALIVE
+from services.llm_routing import router, AllCircuitsOpenError
+from services.llm_scheduler import scheduler, queue_deadline, LLMOverloaded
 
 # Removed parse_quiz_text as generate_quiz now directly outputs JSON from LLM
-from services.tracker import get_user_context, log_topic_attempt
+from services.tracker import log_topic_attempt
+from services.user_context import user_context_cache
+from services.topic_classifier import topic_classifier
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -18,111 +29,285 @@ class VoiceProcessingError(Exception):
 class LLMProviderError(Exception):
     pass
 
+class LLMRateLimitError(LLMProviderError):
+    """Provider answered 429 / quota exceeded."""
+
+class LLMTimeoutError(LLMProviderError):
+    """Provider did not answer in time."""
+
+class LLMOverloadedError(LLMProviderError):
+    """Call rejected by the scheduler before reaching the provider (queue full or deadline)."""
+
+class LLMUnavailableError(LLMProviderError):
+    """Provider endpoint failed (5xx, connection refused/reset); counts against its circuit breaker."""
+
+# errors worth retrying / failing over on, and the subset that says the endpoint itself is unhealthy
+TRANSIENT_ERRORS = (LLMRateLimitError, LLMTimeoutError, LLMUnavailableError)
+ENDPOINT_ERRORS = (LLMTimeoutError, LLMUnavailableError)
+
+def _error_class(e: Exception) -> type[LLMProviderError]:
+    """Picks the LLMProviderError subclass for a provider exception so the scheduler can react to throttling."""
+    if isinstance(e, LLMProviderError):
+        return type(e)
+    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else getattr(e, "status_code", None)
+    if status == 429:
+        return LLMRateLimitError
+    if isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError)) or isinstance(e.__cause__, httpx.TimeoutException):
+        return LLMTimeoutError
+    if (status is not None and status >= 500) or isinstance(e, httpx.TransportError) or isinstance(e.__cause__, httpx.TransportError):
+        return LLMUnavailableError
+    return LLMProviderError
+
 
 
 # --- Caching and Knowledge Base Path ---
-cache = TTLCache(maxsize=256, ttl=600)
+# LLM responses are cached in services.llm_cache (in-process LRU in front of a shared sqlite store)
 session_context = TTLCache(maxsize=1000, ttl=1800)
 LATEST_KB = Path("data/latest_content.jsonl")
 
+# --- In-flight Coalescing (concurrent identical calls share one LLM round-trip) ---
+explain_flight = SingleFlight("explain_concept")
+related_flight = SingleFlight("suggest_related_topics")
+detect_flight = SingleFlight("detect_topic")
+quiz_flight = SingleFlight("generate_quiz")
+
 # --- LLM Backends (Provider-Specific Implementations - Defined FIRST to avoid NameError) ---
 
-async def _openai_chat(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None) -> str:
+async def _openai_chat(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, json_mode: bool = False, prefix: str = "") -> str:
     """Handles chat completions with OpenAI models."""
     if not api_key:
         raise LLMProviderError("OpenAI API Key is missing.")
     try:
-        from openai import AsyncOpenAI
-        openai_client = AsyncOpenAI(api_key=api_key)
-        
+        openai_client = (await get_registry().get("openai", api_key)).sdk
+
+        # OpenAI caches long shared prefixes on its own, so the static prefix just has to come first
         messages_payload = []
         if system_message:
             messages_payload.append(system_message)
-        messages_payload.append({"role": "user", "content": prompt})
+        messages_payload.append({"role": "user", "content": prefix + prompt})
 
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
         res = await openai_client.chat.completions.create(
             model=model,
             messages=messages_payload,
             temperature=temperature,
             max_tokens=max_tokens,
-            timeout=60 # Add timeout for network requests
+            timeout=60, # Add timeout for network requests
+            **extra
         )
+        _record_openai_usage(model, res.usage)
         return res.choices[0].message.content.strip()
     except Exception as e:
         logging.error(f"OpenAI call failed: {e}")
-        raise LLMProviderError(f"OpenAI API call failed: {e}")
+        raise _error_class(e)(f"OpenAI API call failed: {e}")
+
+def _record_openai_usage(model: str, usage) -> None:
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt_usage.record("openai", model, usage.prompt_tokens, getattr(details, "cached_tokens", None))
+    note_usage(usage.prompt_tokens, getattr(usage, "completion_tokens", None))
+
+def _record_gemini_usage(model: str, raw: dict) -> None:
+    usage = raw.get("usageMetadata")
+    if usage:
+        prompt_usage.record("gemini", model, usage.get("promptTokenCount"), usage.get("cachedContentTokenCount"))
+        note_usage(usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+
+def _gemini_payload(prompt: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, json_mode: bool = False, prefix: str = "", cached_content: Optional[str] = None) -> dict:
+    generation_config = {
+        "temperature": temperature,
+        "maxOutputTokens": max_tokens
+    }
+    if json_mode:
+        generation_config["responseMimeType"] = "application/json"
+    if cached_content:
+        # system prompt and prefix already live in the cachedContents handle
+        return {
+            "cachedContent": cached_content,
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": generation_config
+        }
+    payload = {
+        "contents": [{"role": "user", "parts": [{"text": prefix + prompt}]}],
+        "generationConfig": generation_config
+    }
+    if system_message:
+        payload["systemInstruction"] = {"parts": [{"text": system_message["content"]}]}
+    return payload
+
+async def _gemini_request(client: httpx.AsyncClient, prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict], json_mode: bool, prefix: str) -> dict:
+    system_text = system_message["content"] if system_message else ""
+    cached_content = await gemini_cached_contents.handle(client, api_key, model, system_text, prefix)
+    return _gemini_payload(prompt, temperature, max_tokens, system_message, json_mode, prefix, cached_content)
 
-async def _gemini_chat(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None) -> str:
+async def _gemini_chat(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, json_mode: bool = False, prefix: str = "") -> str:
     """Handles chat completions with Google Gemini models."""
     if not api_key:
         raise LLMProviderError("Gemini API Key is missing.")
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
-        
-        contents = []
-        if system_message:
-            contents.append({"role": "user", "parts": [{"text": system_message["content"]}]})
-            contents.append({"role": "model", "parts": [{"text": "Okay, I understand."}]})
-        contents.append({"role": "user", "parts": [{"text": prompt}]})
-
-        payload = {
-            "contents": contents,
-            "generationConfig": {
-                "temperature": temperature,
-                "maxOutputTokens": max_tokens
-            }
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, timeout=60)
-            response.raise_for_status() 
-            raw = response.json()
-            if "candidates" not in raw or not raw["candidates"]:
-                raise LLMProviderError("Gemini response missing candidates.")
-            return raw["candidates"][0]["content"]["parts"][0]["text"].strip()
+        client = (await get_registry().get("gemini", api_key)).http
+        payload = await _gemini_request(client, prompt, api_key, model, temperature, max_tokens, system_message, json_mode, prefix)
+
+        response = await client.post(f"/models/{model}:generateContent", params={"key": api_key}, json=payload)
+        if response.status_code in (400, 403, 404) and "cachedContent" in payload:
+            # the handle expired or was deleted under us; retry once with the prompt inline
+            gemini_cached_contents.forget(payload["cachedContent"])
+            payload = _gemini_payload(prompt, temperature, max_tokens, system_message, json_mode, prefix)
+            response = await client.post(f"/models/{model}:generateContent", params={"key": api_key}, json=payload)
+        response.raise_for_status()
+        raw = response.json()
+        _record_gemini_usage(model, raw)
+        if "candidates" not in raw or not raw["candidates"]:
+            raise LLMProviderError("Gemini response missing candidates.")
+        return raw["candidates"][0]["content"]["parts"][0]["text"].strip()
     except httpx.HTTPStatusError as e:
         logging.error(f"Gemini HTTP error: {e.response.status_code} - {e.response.text}")
-        raise LLMProviderError(f"Gemini API HTTP Error: {e.response.status_code} - {e.response.text}")
+        raise _error_class(e)(f"Gemini API HTTP Error: {e.response.status_code} - {e.response.text}")
     except Exception as e:
         logging.error(f"Gemini call failed: {e}")
-        raise LLMProviderError(f"Gemini API call failed: {e}")
+        raise _error_class(e)(f"Gemini API call failed: {e}")
+
+def _ollama_payload(prompt: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, json_mode: bool = False, prefix: str = "") -> dict:
+    messages_payload = []
+    if system_message:
+        messages_payload.append({"role": "system", "content": system_message["content"]})
+    messages_payload.append({"role": "user", "content": prefix + prompt})
+    payload = {
+        "model": model,
+        "messages": messages_payload,
+        "temperature": temperature,
+        "stream": True,
+        # keep the model loaded so the kv cache of the shared prefix is reused by the next call
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_predict": max_tokens} # Ollama uses num_predict for max_tokens
+    }
+    if json_mode:
+        payload["format"] = "json"
+    return payload
 
-async def _ollama_chat(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None) -> str:
+async def _ollama_chat(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, json_mode: bool = False, prefix: str = "") -> str:
     """Handles chat completions with Ollama models (local or remote)."""
-    # Ollama often doesn't use an API key in the same way, but the parameter is passed for consistency.
+    # Ollama always answers as a stream of NDJSON lines, so the blocking call just drains the stream.
+    chunks = [chunk async for chunk in _ollama_stream(prompt, api_key, model, temperature, max_tokens, system_message, json_mode, prefix)]
+    return "".join(chunks).strip()
+
+# --- Streaming LLM Backends (yield text deltas as the provider produces them) ---
+
+async def _openai_stream(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, prefix: str = "") -> AsyncIterator[str]:
+    """Streams chat completion deltas from OpenAI models."""
+    if not api_key:
+        raise LLMProviderError("OpenAI API Key is missing.")
     try:
+        openai_client = (await get_registry().get("openai", api_key)).sdk
         messages_payload = []
         if system_message:
-            messages_payload.append({"role": "system", "content": system_message["content"]})
-        messages_payload.append({"role": "user", "content": prompt})
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://localhost:11434/api/chat", # Default Ollama endpoint
-                json={
-                    "model": model,
-                    "messages": messages_payload,
-                    "temperature": temperature,
-                    "options": {"num_predict": max_tokens} # Ollama uses num_predict for max_tokens
-                },
-                timeout=120 # Increased timeout for local models that might be slow to start
-            )
+            messages_payload.append(system_message)
+        messages_payload.append({"role": "user", "content": prefix + prompt})
+
+        stream = await openai_client.chat.completions.create(
+            model=model,
+            messages=messages_payload,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=60
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                _record_openai_usage(model, chunk.usage)
+    except Exception as e:
+        logging.error(f"OpenAI stream failed: {e}")
+        raise _error_class(e)(f"OpenAI API call failed: {e}")
+
+async def _gemini_stream(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, prefix: str = "") -> AsyncIterator[str]:
+    """Streams text parts from Gemini's streamGenerateContent (server-sent events)."""
+    if not api_key:
+        raise LLMProviderError("Gemini API Key is missing.")
+    try:
+        client = (await get_registry().get("gemini", api_key)).http
+        payload = await _gemini_request(client, prompt, api_key, model, temperature, max_tokens, system_message, False, prefix)
+        async with client.stream(
+            "POST",
+            f"/models/{model}:streamGenerateContent",
+            params={"key": api_key, "alt": "sse"},
+            json=payload,
+        ) as response:
+            if response.is_error:
+                await response.aread()
+                if "cachedContent" in payload:
+                    gemini_cached_contents.forget(payload["cachedContent"])
+            response.raise_for_status()
+            usage = {}
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[len("data:"):].strip())
+                # every chunk repeats usageMetadata; the last one has the final counts
+                usage = data if "usageMetadata" in data else usage
+                for candidate in data.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+            _record_gemini_usage(model, usage)
+    except httpx.HTTPStatusError as e:
+        logging.error(f"Gemini HTTP error: {e.response.status_code} - {e.response.text}")
+        raise _error_class(e)(f"Gemini API HTTP Error: {e.response.status_code} - {e.response.text}")
+    except Exception as e:
+        logging.error(f"Gemini stream failed: {e}")
+        raise _error_class(e)(f"Gemini API call failed: {e}")
+
+async def _ollama_stream(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, json_mode: bool = False, prefix: str = "") -> AsyncIterator[str]:
+    """Streams message deltas from Ollama's NDJSON /api/chat response."""
+    # Ollama often doesn't use an API key in the same way, but the parameter is passed for consistency.
+    try:
+        # Base URL comes from OLLAMA_BASE_URL (default http://localhost:11434); the pool's
+        # read timeout is longer for local models that might be slow to start
+        client = (await get_registry().get("ollama")).http
+        payload = _ollama_payload(prompt, model, temperature, max_tokens, system_message, json_mode, prefix)
+        async with client.stream("POST", "/api/chat", json=payload) as response:
+            if response.is_error:
+                await response.aread()
             response.raise_for_status()
-            full_response = ""
             async for chunk_line in response.aiter_lines():
                 if chunk_line.strip():
                     data = json.loads(chunk_line)
-                    if "content" in data.get("message", {}):
-                        full_response += data["message"]["content"]
+                    if data.get("message", {}).get("content"):
+                        yield data["message"]["content"]
                     if data.get("done"): # Check for 'done' status to break loop
+                        # ollama only reports evaluated prompt tokens; a reused prefix shows up as a smaller count
+                        prompt_usage.record("ollama", model, data.get("prompt_eval_count"), None)
+                        note_usage(data.get("prompt_eval_count"), data.get("eval_count"))
                         break
-            return full_response.strip()
     except httpx.HTTPStatusError as e:
         logging.error(f"Ollama HTTP error: {e.response.status_code} - {e.response.text}")
-        raise LLMProviderError(f"Ollama API HTTP Error: {e.response.status_code} - {e.response.text}")
+        raise _error_class(e)(f"Ollama API HTTP Error: {e.response.status_code} - {e.response.text}")
     except Exception as e:
         logging.error(f"Ollama call failed: {e}")
-        raise LLMProviderError(f"Ollama API call failed: {e}")
+        raise _error_class(e)(f"Ollama API call failed: {e}")
+
+async def _mock_chat(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, json_mode: bool = False, prefix: str = "") -> str:
+    """Canned in-process responses for load tests (see services.mock_llm); never leaves the process."""
+    chunks = [chunk async for chunk in _mock_stream(prompt, api_key, model, temperature, max_tokens, system_message, prefix)]
+    return "".join(chunks).strip()
+
+async def _mock_stream(prompt: str, api_key: str, model: str, temperature: float, max_tokens: int, system_message: Optional[dict] = None, prefix: str = "") -> AsyncIterator[str]:
+    try:
+        async for chunk in mock_stream(prefix + prompt, system_message["content"] if system_message else "", max_tokens):
+            yield chunk
+    except MockLLMError as e:
+        raise LLMUnavailableError(f"Mock provider failed: {e}")
+
+def _strip_code_fences(raw: str) -> str:
+    """Removes ```json ... ``` wrappers that models like to put around JSON output."""
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = re.sub(r"^```[a-zA-Z]*\n?", "", raw)
+        raw = re.sub(r"\n?```$", "", raw.strip())
+    return raw
 
 # --- Core LLM Routing Function (Uses helper functions defined above) ---
 async def _call_llm(
@@ -130,11 +315,81 @@ async def _call_llm(
     llm_config: Optional[BackendLLMConfig],
     temperature: float = 0.7,
     max_tokens: int = 500,
-    system_message: Optional[dict] = None
+    system_message: Optional[dict] = None,
+    json_mode: bool = False,
+    queue_timeout: Optional[float] = None,
+    call_type: str = "default",
+    prefix: str = "",
+    username: Optional[str] = None
+) -> str:
+    """
+    Routes LLM calls to the selected provider (OpenAI, Gemini, Ollama, or the load-test mock when MOCK_LLM_ENABLED=1).
+    json_mode asks the provider for a JSON object response where it supports it.
+    prefix is the static start of the user message (instructions, syllabus, notes); the provider
+    sees prefix + prompt, but keeping it byte-identical across calls lets provider prompt caches reuse it.
+    The call_type's routing policy (see services.llm_routing) adds retries with jittered backoff,
+    failover to secondary targets, hedging past p95 and a per-(provider, model) circuit breaker.
+    It can also send the call type to a different model (e.g. a small local one for detect/judge);
+    username lets a user's saved provider/model take precedence there.
+    """
+    if llm_config is None or not llm_config.provider or not llm_config.model:
+        raise LLMProviderError("LLM configuration (provider, model) is incomplete or missing.")
+
+    async def attempt(target: BackendLLMConfig) -> str:
+        return await _call_provider(prompt, target, temperature, max_tokens, system_message, json_mode, queue_timeout, prefix, call_type)
+
+    try:
+        return await router.execute(call_type, llm_config, attempt, TRANSIENT_ERRORS, ENDPOINT_ERRORS, username=username)
+    except AllCircuitsOpenError as e:
+        raise LLMUnavailableError(f"No healthy {llm_config.provider} target: {e}")
+
+# outcome label per error class, for llm_metrics
+_OUTCOMES = {
+    LLMRateLimitError: "rate_limited",
+    LLMTimeoutError: "timeout",
+    LLMUnavailableError: "unavailable",
+    LLMOverloadedError: "overloaded",
+}
+
+def _record_call(
+    llm_config: BackendLLMConfig,
+    call_type: str,
+    outcome: str,
+    latency: Optional[float],
+    queue_wait: Optional[float],
+    ttft: Optional[float],
+    full_prompt: str,
+    result: Optional[str]
+) -> None:
+    # prefer the provider's own token counts; estimate when it didn't report them
+    usage = call_usage.get() or {}
+    prompt_tokens = usage.get("prompt_tokens", estimate_tokens(full_prompt))
+    completion_tokens = usage.get("completion_tokens", estimate_tokens(result) if result else None)
+    llm_metrics.record_call(
+        llm_config.provider, llm_config.model, call_type, outcome,
+        latency=latency, queue_wait=queue_wait, ttft=ttft,
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+    )
+    if outcome == "ok":
+        maybe_log_prompt(llm_config.provider, llm_config.model, call_type, full_prompt, result)
+
+async def _call_provider(
+    prompt: str,
+    llm_config: BackendLLMConfig,
+    temperature: float,
+    max_tokens: int,
+    system_message: Optional[dict],
+    json_mode: bool,
+    queue_timeout: Optional[float],
+    prefix: str = "",
+    call_type: str = "default"
 ) -> str:
     """
-    Routes LLM calls to the selected provider (OpenAI, Gemini, Ollama).
+    One attempt against one provider/model.
     Ensures LLM configuration is valid before making the call.
+    Calls pass through the per-(provider, model, key) scheduler; queue_timeout bounds how long
+    the call may wait for a slot (defaults to LLM_QUEUE_DEADLINE) before LLMOverloadedError.
+    Every attempt is recorded in llm_metrics under call_type.
     """
     # Patch: Only require api_key for OpenAI and Gemini, not for Ollama
     if llm_config is None or not llm_config.provider or not llm_config.model:
@@ -145,90 +400,316 @@ async def _call_llm(
     providers = {
         "openai": _openai_chat,
         "gemini": _gemini_chat,
-        "ollama": _ollama_chat
+        "ollama": _ollama_chat,
     }
+    if MOCK_LLM_ENABLED:
+        providers["mock"] = _mock_chat
 
     selected_provider_func = providers.get(llm_config.provider)
     if not selected_provider_func:
         raise LLMProviderError(f"Unsupported LLM provider: {llm_config.provider}")
 
+    limiter = scheduler.limiter(llm_config.provider, llm_config.model, llm_config.api_key)
+    usage_token = call_usage.set({})
+    outcome, result, queue_wait, started = "ok", None, None, None
     try:
-        result = await selected_provider_func(
-            prompt,
-            api_key=llm_config.api_key,
-            model=llm_config.model,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            system_message=system_message
-        )
+        async with limiter.slot(queue_deadline(queue_timeout)) as waited:
+            queue_wait = waited
+            started = time.monotonic()
+            try:
+                result = await selected_provider_func(
+                    prompt,
+                    api_key=llm_config.api_key,
+                    model=llm_config.model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    system_message=system_message,
+                    json_mode=json_mode,
+                    prefix=prefix
+                )
+            except (LLMRateLimitError, LLMTimeoutError) as e:
+                limiter.on_throttle(timeout=isinstance(e, LLMTimeoutError))
+                raise
+            except Exception:
+                limiter.on_failure()
+                raise
+            limiter.on_success(time.monotonic() - started)
         if result is None or not result.strip():
             raise LLMProviderError("LLM returned an empty response.")
         return result
+    except LLMOverloaded as e:
+        outcome = "overloaded"
+        logging.warning(f"[llm_scheduler] rejected {llm_config.provider} call: {e}")
+        raise LLMOverloadedError(f"{llm_config.provider.capitalize()} is overloaded, try again shortly: {e}")
+    except asyncio.CancelledError:
+        # e.g. the losing half of a hedged request
+        outcome = "cancelled"
+        raise
     except Exception as e:
+        error_class = _error_class(e)
+        outcome = _OUTCOMES.get(error_class, "error")
         logging.error(f"Error calling {llm_config.provider} LLM: {e}")
-        raise LLMProviderError(f"Error calling {llm_config.provider}: {e}")
+        raise error_class(f"Error calling {llm_config.provider}: {e}")
+    finally:
+        latency = time.monotonic() - started if started is not None else None
+        _record_call(llm_config, call_type, outcome, latency, queue_wait, None, prefix + prompt, result)
+        call_usage.reset(usage_token)
 
-# --- Main Explain Concept API Function ---
-async def explain_concept(
-    question: str,
-    username: str,
-    topic: str = "",
-    system_prompt: str = "You are Exam Whisperer, a helpful AI tutor.",
+async def _stream_llm(
+    prompt: str,
+    llm_config: Optional[BackendLLMConfig],
     temperature: float = 0.7,
     max_tokens: int = 500,
-    llm_config: Optional[BackendLLMConfig] = None
-) -> dict:
-    """Explains a concept using the configured LLM, incorporating user context and topic detection."""
-    logging.info(f"[explain_concept] question={question!r}, username={username!r}, topic={topic!r}, llm_config={llm_config}")
+    system_message: Optional[dict] = None,
+    prefix: str = "",
+    call_type: str = "explain"
+) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of _call_llm: yields text deltas from the selected provider as they arrive.
+    Recorded in llm_metrics like _call_provider, plus time to first token.
+    """
+    if llm_config is None or not llm_config.provider or not llm_config.model:
+        raise LLMProviderError("LLM configuration (provider, model) is incomplete or missing.")
+    if llm_config.provider in ("openai", "gemini") and not llm_config.api_key:
+        raise LLMProviderError(f"{llm_config.provider.capitalize()} API Key is missing.")
 
-    if not question.strip():
-        raise ValueError("Question cannot be empty.")
+    providers = {
+        "openai": _openai_stream,
+        "gemini": _gemini_stream,
+        "ollama": _ollama_stream,
+    }
+    if MOCK_LLM_ENABLED:
+        providers["mock"] = _mock_stream
 
-    # Cache key needs to handle Optional llm_config gracefully, by providing defaults if None
-    cache_key_parts = (username, topic, question, system_prompt, temperature, max_tokens)
+    selected_provider_func = providers.get(llm_config.provider)
+    if not selected_provider_func:
+        raise LLMProviderError(f"Unsupported LLM provider: {llm_config.provider}")
+
+    limiter = scheduler.limiter(llm_config.provider, llm_config.model, llm_config.api_key)
+    # not reset: an async generator can't rely on being resumed in the context it was started in
+    call_usage.set({})
+    outcome, parts, queue_wait, started, ttft = "ok", [], None, None, None
+    try:
+        # the slot is held for the whole stream, since that is how long the provider is busy
+        async with limiter.slot(queue_deadline()) as waited:
+            queue_wait = waited
+            started = time.monotonic()
+            try:
+                async for delta in selected_provider_func(
+                    prompt,
+                    api_key=llm_config.api_key,
+                    model=llm_config.model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    system_message=system_message,
+                    prefix=prefix
+                ):
+                    if ttft is None:
+                        ttft = time.monotonic() - started
+                    parts.append(delta)
+                    yield delta
+            except (LLMRateLimitError, LLMTimeoutError) as e:
+                limiter.on_throttle(timeout=isinstance(e, LLMTimeoutError))
+                raise
+            except LLMProviderError:
+                limiter.on_failure()
+                raise
+            limiter.on_success(time.monotonic() - started)
+    except LLMOverloaded as e:
+        outcome = "overloaded"
+        logging.warning(f"[llm_scheduler] rejected {llm_config.provider} stream: {e}")
+        raise LLMOverloadedError(f"{llm_config.provider.capitalize()} is overloaded, try again shortly: {e}")
+    except (asyncio.CancelledError, GeneratorExit):
+        # client went away mid-stream
+        outcome = "cancelled"
+        raise
+    except LLMProviderError as e:
+        outcome = _OUTCOMES.get(type(e), "error")
+        raise
+    finally:
+        latency = time.monotonic() - started if started is not None else None
+        _record_call(llm_config, call_type, outcome, latency, queue_wait, ttft, prefix + prompt, "".join(parts))
+
+# --- Main Explain Concept API Function ---
+def _provider_model(llm_config: Optional[BackendLLMConfig]) -> tuple[str, str]:
+    # Cache keys need to handle Optional llm_config gracefully, by providing defaults if None
     if llm_config:
-        cache_key = cache_key_parts + (llm_config.provider, llm_config.model)
-    else:
-        cache_key = cache_key_parts + ("default_provider", "default_model") # Use string defaults for cache key
-    
-    if cache_key in cache:
-        logging.info(f"[explain_concept] cache hit for key={cache_key}")
-        return cache[cache_key]
+        return (llm_config.provider, llm_config.model)
+    return ("default_provider", "default_model")
+
+def _explain_cache_key(question: str, username: str, topic: str, system_prompt: str, temperature: float, max_tokens: int, llm_config: Optional[BackendLLMConfig]) -> str:
+    return make_key("explain", username, topic, question, system_prompt, temperature, max_tokens, *_provider_model(llm_config))
 
-    # Topic detection uses LLM, so llm_config is passed
-    topic = (topic.strip() if topic else None) or (await detect_topic(question, llm_config)).strip()
+def _context_blocks(user_context: Optional[dict], topic: str, call_type: str, query: str = "") -> tuple[str, str]:
+    """
+    Splits the rendered user context into (static block for the prompt prefix, dynamic block for the prompt).
+    Prompts are laid out most static first: instructions, syllabus, notes, then progress/history, then the question.
+    """
+    static, dynamic = build_context_segments(user_context, topic, call_type, query)
+    if not static and not dynamic:
+        static = "[No context available]"
+    return (f"{static}\n" if static else ""), (f"{dynamic}\n" if dynamic else "")
+
+async def _build_explain_prompt(
+    question: str,
+    username: str,
+    topic: str,
+    system_prompt: str,
+    max_tokens: int,
+    llm_config: Optional[BackendLLMConfig]
+) -> tuple[str, str, str, dict, dict]:
+    """Resolves the topic and builds (topic, prefix, prompt, system_message, user_context) for an explanation."""
+    topic = (topic.strip() if topic else None) or (await resolve_topic(question, username, llm_config)).strip()
     logging.info(f"[explain_concept] detected topic: {topic}")
     
-    # Assuming get_user_context exists and is imported
-    user_context = get_user_context(username, topic)
-    logging.info(f"[explain_concept] user_context: {user_context}")
+    # cached per (username, topic); a miss reads it through the async session
+    user_context = await user_context_cache.get(username, topic)
+    static_context, dynamic_context = _context_blocks(user_context, topic, "explain", question)
 
     prior_question = session_context.get(username)
-    logging.info(f"[explain_concept] prior_question: {prior_question}")
+    logging.debug(f"[explain_concept] prior_question: {prior_question}")
 
     system_message = {"role": "system", "content": system_prompt}
 
-    prompt_parts = []
-    if prior_question:
-        prompt_parts.append(f"Previously, the user asked: '{prior_question}'. Use this as context if the current question depends on it.\n")
-
-    prompt_parts.extend([
-        f"Current question: {question}",
-        "",
+    if max_tokens:
+        length = f"Ensure your response is around {max_tokens * 0.8 / 4:.0f}-{max_tokens / 4:.0f} words to fit within {max_tokens} tokens."
+    else:
+        length = "Explain the concept clearly and concisely in 100-150 words."
+    prefix = "\n".join([
         "You MUST use the following context to craft your explanation.",
         "Only use external knowledge if the context is insufficient.",
-        f"Context:\n{json.dumps(user_context, indent=2) or '[No context available]'}",
+        "Explain the concept clearly and concisely and ENSURE that the answer is formatted in markdown.",
+        length,
         "",
-        "Explain the concept clearly and concisely and ENSURE that the answer is formatted in markdown."
+        "Context:",
+        static_context
     ])
 
-    if max_tokens:
-        prompt_parts.append(f"Ensure your response is around {max_tokens * 0.8 / 4:.0f}-{max_tokens / 4:.0f} words to fit within {max_tokens} tokens.")
-    else:
-        prompt_parts.append("Explain the concept clearly and concisely in 100-150 words.")
+    prompt_parts = [dynamic_context]
+    if prior_question:
+        prompt_parts.append(f"Previously, the user asked: '{prior_question}'. Use this as context if the current question depends on it.\n")
+    prompt_parts.append(f"Current question: {question}")
 
     prompt = "\n".join(prompt_parts)
-    logging.info(f"[explain_concept] prompt: {prompt}")
+    return topic, prefix, prompt, system_message, user_context
+
+# Background tasks are referenced here so they are not garbage collected before they finish
+_background_tasks: set[asyncio.Task] = set()
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def _start_side_steps(username: str, topic: str, user_context: dict, llm_config: Optional[BackendLLMConfig]) -> tuple[asyncio.Task, asyncio.Task]:
+    """
+    Starts the steps that only depend on the topic and user context, so they run
+    while the main explanation is being generated: attempt logging and related topics.
+    """
+    log_task = _spawn(log_topic_attempt(username, topic, score=0.3, source="ask"))
+    related_task = _spawn(suggest_related_topics(topic, username, llm_config, user_context=user_context))
+    return log_task, related_task
+
+async def _cache_related_when_done(cache_key: str, result: dict, related_task: asyncio.Task):
+    """Deferred mode: fold the related topics into the cached explanation once they are ready."""
+    try:
+        related_topics = await related_task
+    except Exception as e:
+        logging.error(f"[explain_concept] deferred related topics failed: {e}")
+        return
+    await llm_cache.set(cache_key, {**result, "related_topics": related_topics, "related_topics_pending": False})
+
+async def _finish_explain(
+    explanation: str,
+    topic: str,
+    cache_key: str,
+    log_task: asyncio.Task,
+    related_task: asyncio.Task,
+    defer_related: bool = False
+) -> dict:
+    """Post-completion steps shared by the blocking and streaming paths: join side steps, cache."""
+    try:
+        await log_task
+    except Exception as e:
+        logging.error(f"[explain_concept] log_topic_attempt failed: {e}")
+
+    result = {
+        "content": explanation.strip() if explanation else "",
+        "topic": topic or "Unknown",
+        "related_topics": [],
+        "confidence": 0.95
+    }
+    if defer_related and not related_task.done():
+        # The client fetches these later from /explain/related, which joins the same in-flight call
+        _spawn(_cache_related_when_done(cache_key, result, related_task))
+        return {**result, "related_topics_pending": True}
+
+    result["related_topics"] = await related_task
+    logging.info(f"[explain_concept] related_topics: {result['related_topics']}")
+    await llm_cache.set(cache_key, result)
+    return result
+
+async def explain_concept(
+    question: str,
+    username: str,
+    topic: str = "",
+    system_prompt: str = "You are Exam Whisperer, a helpful AI tutor.",
+    temperature: float = 0.7,
+    max_tokens: int = 500,
+    llm_config: Optional[BackendLLMConfig] = None,
+    defer_related: bool = False,
+    fused: bool = False
+) -> dict:
+    """
+    Explains a concept using the configured LLM, incorporating user context and topic detection.
+    With defer_related=True the response does not wait for related topics (see /explain/related).
+    With fused=True topic, explanation and related topics come from a single structured LLM call,
+    falling back to the multi-call path if the response cannot be parsed.
+    """
+    logging.info(f"[explain_concept] username={username!r}, topic={topic!r}, provider={_provider_model(llm_config)}")
+
+    if not question.strip():
+        raise ValueError("Question cannot be empty.")
+
+    if fused:
+        fused_key = make_key("fused", username, topic, question, system_prompt, temperature, max_tokens, *_provider_model(llm_config))
+        cached = await llm_cache.get(fused_key)
+        if cached is not None:
+            logging.info(f"[explain_concept] fused cache hit for key={fused_key}")
+            return cached
+        result = await explain_flight.do(
+            fused_key,
+            lambda: _explain_fused_miss(question, username, topic, system_prompt, temperature, max_tokens, llm_config, fused_key)
+        )
+        if result is not None:
+            return result
+        logging.info("[explain_concept] fused response unusable, falling back to multi-call path")
+
+    cache_key = _explain_cache_key(question, username, topic, system_prompt, temperature, max_tokens, llm_config)
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"[explain_concept] cache hit for key={cache_key}")
+        return cached
+
+    return await explain_flight.do(
+        (cache_key, defer_related),
+        lambda: _explain_concept_miss(question, username, topic, system_prompt, temperature, max_tokens, llm_config, cache_key, defer_related)
+    )
+
+async def _explain_concept_miss(
+    question: str,
+    username: str,
+    topic: str,
+    system_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    llm_config: Optional[BackendLLMConfig],
+    cache_key: str,
+    defer_related: bool = False
+) -> dict:
+    topic, prefix, prompt, system_message, user_context = await _build_explain_prompt(question, username, topic, system_prompt, max_tokens, llm_config)
+    log_task, related_task = _start_side_steps(username, topic, user_context, llm_config)
 
     try:
         explanation = await _call_llm(
@@ -236,24 +717,17 @@ async def explain_concept(
             llm_config=llm_config,
             temperature=temperature,
             max_tokens=max_tokens,
-            system_message=system_message
+            system_message=system_message,
+            call_type="explain",
+            prefix=prefix
         )
 
-        await log_topic_attempt(username, topic, score=0.3, source="ask")
-
-        related_topics = await suggest_related_topics(topic, username, llm_config)
-        logging.info(f"[explain_concept] related_topics: {related_topics}")
-        result = {
-            "content": explanation.strip() if explanation else "",
-            "topic": topic or "Unknown",
-            "related_topics": related_topics,
-            "confidence": 0.95
-        }
-        cache[cache_key] = result
-        logging.info(f"[explain_concept] result: {result}")
+        result = await _finish_explain(explanation, topic, cache_key, log_task, related_task, defer_related)
+        logging.debug(f"[explain_concept] result: {result}")
         return result
     except LLMProviderError as e:
         logging.error(f"[explain_concept] LLMProviderError: {e}")
+        related_task.cancel()
         return {
             "content": f"Error: Failed to get explanation from AI provider. Please check your API key and try again. Details: {str(e)}",
             "topic": topic or "Unknown",
@@ -264,20 +738,168 @@ async def explain_concept(
         logging.exception(f"[explain_concept] Unexpected error: {e}")
         raise
 
+FUSED_KEYS = ("topic", "explanation", "related_topics")
+
+async def _explain_fused_miss(
+    question: str,
+    username: str,
+    topic: str,
+    system_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    llm_config: Optional[BackendLLMConfig],
+    cache_key: str
+) -> Optional[dict]:
+    """
+    One round-trip instead of three: asks for topic, markdown explanation and related topics
+    as one JSON object. Returns None when the provider fails or the JSON is unusable.
+    """
+    topic = topic.strip() if topic else ""
+    if not topic:
+        # The fused call detects the topic itself; a confident local match just gives it better context
+        match = await topic_classifier.classify(username, question, replaces_llm_call=False)
+        topic = match.topic if match else ""
+    # Without a known topic only the topic-independent parts of the context (syllabus) are available
+    user_context = await user_context_cache.get(username, topic)
+    prior_question = session_context.get(username)
+    static_context, dynamic_context = _context_blocks(user_context, topic, "explain", question)
+
+    prefix = "\n".join([
+        "You MUST use the following context to craft your explanation.",
+        "Only use external knowledge if the context is insufficient.",
+        "Respond ONLY with a JSON object with these keys:",
+        '- "topic": the topic name',
+        '- "explanation": a clear, concise explanation of the concept formatted in markdown'
+        + (f", around {max_tokens * 0.8 / 4:.0f}-{max_tokens / 4:.0f} words" if max_tokens else ", 100-150 words"),
+        '- "related_topics": a list of 2-3 related academic topics to study next',
+        "",
+        "Context:",
+        static_context
+    ])
+    prompt_parts = [dynamic_context]
+    if prior_question:
+        prompt_parts.append(f"Previously, the user asked: '{prior_question}'. Use this as context if the current question depends on it.\n")
+    prompt_parts.extend([
+        f"Topic: {topic}" if topic else "Topic: detect the most relevant academic topic (e.g., 'linear algebra', 'organic chemistry').",
+        f"Current question: {question}",
+    ])
+    prompt = "\n".join(prompt_parts)
+
+    try:
+        raw = await _call_llm(
+            prompt,
+            llm_config=llm_config,
+            temperature=temperature,
+            # leave room for the JSON envelope and the related topics
+            max_tokens=(max_tokens or 500) + 150,
+            system_message={"role": "system", "content": system_prompt},
+            json_mode=True,
+            call_type="explain",
+            prefix=prefix
+        )
+        data = json.loads(_strip_code_fences(raw))
+    except (LLMProviderError, json.JSONDecodeError) as e:
+        logging.error(f"[explain_concept] fused call failed: {e}")
+        return None
+
+    if not isinstance(data, dict) or not all(k in data for k in FUSED_KEYS):
+        logging.error(f"[explain_concept] fused response missing keys: {raw!r}")
+        return None
+    explanation = data["explanation"] if isinstance(data["explanation"], str) else ""
+    related_topics = [t for t in data["related_topics"] if isinstance(t, str)] if isinstance(data["related_topics"], list) else []
+    topic = topic or (str(data["topic"]).strip() if data["topic"] else "")
+    if not explanation.strip() or not topic:
+        return None
+
+    await log_topic_attempt(username, topic, score=0.3, source="ask")
+    result = {
+        "content": explanation.strip(),
+        "topic": topic,
+        "related_topics": related_topics,
+        "confidence": 0.95
+    }
+    await llm_cache.set(cache_key, result)
+    return result
+
+async def explain_concept_stream(
+    question: str,
+    username: str,
+    topic: str = "",
+    system_prompt: str = "You are Exam Whisperer, a helpful AI tutor.",
+    temperature: float = 0.7,
+    max_tokens: int = 500,
+    llm_config: Optional[BackendLLMConfig] = None
+) -> AsyncIterator[dict]:
+    """
+    Streaming variant of explain_concept. Yields frames:
+    - {"type": "topic", "topic": ...} once the topic is known
+    - {"type": "token", "content": ...} for each text delta from the provider
+    - {"type": "done", "content", "topic", "related_topics", "confidence"} after the stream completes
+    - {"type": "error", "detail": ...} if the provider fails mid-stream
+    Caching and attempt logging happen once the stream has completed.
+    """
+    logging.info(f"[explain_concept_stream] question={question!r}, username={username!r}, topic={topic!r}")
+
+    if not question.strip():
+        raise ValueError("Question cannot be empty.")
+
+    cache_key = _explain_cache_key(question, username, topic, system_prompt, temperature, max_tokens, llm_config)
+    result = await llm_cache.get(cache_key)
+    if result is not None:
+        yield {"type": "topic", "topic": result["topic"]}
+        yield {"type": "token", "content": result["content"]}
+        yield {"type": "done", **result}
+        return
+
+    topic, prefix, prompt, system_message, user_context = await _build_explain_prompt(question, username, topic, system_prompt, max_tokens, llm_config)
+    yield {"type": "topic", "topic": topic or "Unknown"}
+    log_task, related_task = _start_side_steps(username, topic, user_context, llm_config)
+
+    parts = []
+    try:
+        async for delta in _stream_llm(
+            prompt,
+            llm_config=llm_config,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            system_message=system_message,
+            prefix=prefix
+        ):
+            parts.append(delta)
+            yield {"type": "token", "content": delta}
+    except LLMProviderError as e:
+        logging.error(f"[explain_concept_stream] LLMProviderError: {e}")
+        related_task.cancel()
+        yield {"type": "error", "detail": f"Failed to get explanation from AI provider. Details: {str(e)}"}
+        return
+
+    explanation = "".join(parts)
+    if not explanation.strip():
+        related_task.cancel()
+        yield {"type": "error", "detail": "LLM returned an empty response."}
+        return
+
+    result = await _finish_explain(explanation, topic, cache_key, log_task, related_task)
+    yield {"type": "done", **result}
+
 # --- LLM Judge Score ---
-async def llm_judge_score(question: str, correct_answer: str, user_answer: str, context: dict, llm_config: Optional[BackendLLMConfig]) -> float:
+async def llm_judge_score(question: str, correct_answer: str, user_answer: str, context: dict, llm_config: Optional[BackendLLMConfig], topic: str = "", username: Optional[str] = None) -> float:
     """Judges the correctness of a user's answer using an LLM, returning a score from 0-1."""
+    static_context, dynamic_context = _context_blocks(context, topic, "judge", question)
+    prefix = (
+        "You're evaluating a student's free-text answer to a quiz question.\n"
+        "Return a float between 0 and 1 indicating how close the user's answer is to the correct one.\n"
+        "0 means completely wrong, 1 means correct, values like 0.4 mean partially correct or guessed.\n"
+        "Respond ONLY with the score.\n\n"
+        f"Student context:\n{static_context}"
+    )
     prompt = (
-        f"You're evaluating a student's MCQ answer.\n\n"
+        f"{dynamic_context}\n"
         f"Question: {question}\n"
         f"Correct answer: {correct_answer}\n"
-        f"User's answer: {user_answer}\n\n"
-        f"Student context:\n{json.dumps(context, indent=2)}\n\n"
-        f"Return a float between 0 and 1 indicating how close the user's answer is to the correct one.\n"
-        f"0 means completely wrong, 1 means correct, values like 0.4 mean partially correct or guessed.\n"
-        f"Respond ONLY with the score."
+        f"User's answer: {user_answer}"
     )
-    score_str = await _call_llm(prompt, llm_config=llm_config, temperature=0.2, max_tokens=10)
+    score_str = await _call_llm(prompt, llm_config=llm_config, temperature=0.2, max_tokens=10, call_type="judge", prefix=prefix, username=username)
     try:
         return float(score_str.strip())
     except Exception:
@@ -285,30 +907,34 @@ async def llm_judge_score(question: str, correct_answer: str, user_answer: str,
         return 0.0
 
 # --- Related Topics Suggestion ---
-async def suggest_related_topics(topic: str, username: str, llm_config: Optional[BackendLLMConfig]) -> list[str]:
-    """Suggests related academic topics using the configured LLM."""
-    # Cache key needs to handle Optional llm_config gracefully
-    cache_key_parts = (username, "related_topics", topic)
-    if llm_config:
-        cache_key = cache_key_parts + (llm_config.provider, llm_config.model)
-    else:
-        cache_key = cache_key_parts + ("default_provider", "default_model")
-    
-    if cache_key in cache:
-        return cache[cache_key]
+async def suggest_related_topics(topic: str, username: str, llm_config: Optional[BackendLLMConfig], user_context: Optional[dict] = None) -> list[str]:
+    """
+    Suggests related academic topics using the configured LLM.
+    Pass user_context when the caller already has it to skip a second lookup.
+    """
+    cache_key = make_key("related", username, topic, 0.7, 100, *_provider_model(llm_config))
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    user_context = get_user_context(username, topic)
-    prompt = (
-        f"Given the topic '{topic}' and the user's context below, suggest 2-3 related academic topics "
+    return await related_flight.do(cache_key, lambda: _suggest_related_topics_miss(topic, username, llm_config, cache_key, user_context))
+
+async def _suggest_related_topics_miss(topic: str, username: str, llm_config: Optional[BackendLLMConfig], cache_key: str, user_context: Optional[dict] = None) -> list[str]:
+    if user_context is None:
+        user_context = await user_context_cache.get(username, topic)
+    static_context, dynamic_context = _context_blocks(user_context, topic, "related")
+    prefix = (
+        "Given a topic and the user's context below, suggest 2-3 related academic topics "
         "to study next. Return only the topic names as a JSON list.\n\n"
-        f"User context:\n{json.dumps(user_context, indent=2) or '[No context available]'}"
+        f"User context:\n{static_context}"
     )
+    prompt = f"{dynamic_context}\nTopic: {topic}"
     try:
-        response = await _call_llm(prompt, llm_config=llm_config, temperature=0.7, max_tokens=100)
+        response = await _call_llm(prompt, llm_config=llm_config, temperature=0.7, max_tokens=100, call_type="related", prefix=prefix, username=username)
         related_topics = json.loads(response) if response.strip() else []
         if not isinstance(related_topics, list):
             related_topics = []
-        cache[cache_key] = related_topics
+        await llm_cache.set(cache_key, related_topics)
         return related_topics
     except (json.JSONDecodeError, LLMProviderError):
         logging.error(f"[suggest_related_topics] Failed to suggest topics or LLM error.")
@@ -319,57 +945,132 @@ async def generate_quiz(topic: str, difficulty: str = "medium", llm_config: Opti
     """
     Generates a single, structured MCQ quiz question in JSON format via LLM.
     This function is intended to be called by the quiz router.
+    Concurrent requests for the same topic/difficulty/model share one generation.
     """
-    raw_llm_response = None
     if not topic.strip():
         raise ValueError("Topic cannot be empty for quiz generation.")
 
-    prompt = (
-        f"Generate a {difficulty} level multiple choice quiz question on the topic: '{topic}'.\n"
-        "Provide exactly ONE question with 4 options (A, B, C, D). "
+    flight_key = (topic, difficulty) + _provider_model(llm_config)
+    return await quiz_flight.do(flight_key, lambda: _generate_quiz_once(topic, difficulty, llm_config))
+
+QUIZ_SYSTEM_MESSAGE = {"role": "system", "content": "You are a quiz master. Generate well-structured and clear quiz questions in JSON format."}
+
+def _validate_quiz_question(quiz_data: dict, raw_llm_response: str) -> dict:
+    """Checks one generated question against the QuizQuestion schema; raises ValueError if it does not fit."""
+    required_keys = ['question', 'options', 'correctAnswerId', 'feedback']
+    if not isinstance(quiz_data, dict) or not all(k in quiz_data for k in required_keys):
+        missing = required_keys if not isinstance(quiz_data, dict) else [k for k in required_keys if k not in quiz_data]
+        raise ValueError(f"LLM response missing required quiz keys: {', '.join(missing)} - Raw: {raw_llm_response}")
+    if not isinstance(quiz_data['options'], list) or not all(isinstance(opt, dict) and 'id' in opt and 'text' in opt for opt in quiz_data['options']):
+        raise ValueError(f"LLM options not in expected format: {raw_llm_response}")
+    if quiz_data['correctAnswerId'] not in {opt['id'] for opt in quiz_data['options']}:
+        raise ValueError(f"LLM correctAnswerId does not match any option: {raw_llm_response}")
+    try:
+        return QuizQuestion(**quiz_data).model_dump()
+    except ValidationError as e:
+        raise ValueError(f"LLM quiz question failed validation: {e}")
+
+async def _generate_quiz_once(topic: str, difficulty: str, llm_config: Optional[BackendLLMConfig]) -> dict:
+    raw_llm_response = None
+
+    prefix = (
+        "Provide exactly ONE multiple choice quiz question with 4 options (A, B, C, D). "
         "Also include the correct answer's option ID (e.g., 'A', 'B', 'C', 'D') and a concise feedback/explanation for the correct answer.\n"
         "Return the output as a JSON object with the following keys: 'question', 'options' (list of {id: string, text: string}), 'correctAnswerId' (string), 'feedback' (string).\n"
         "Example: {'question': '...', 'options': [{'id': 'A', 'text': '...'}], 'correctAnswerId': 'A', 'feedback': '...'}\n"
-        "Ensure option IDs are single uppercase letters (A, B, C, D)."
+        "Ensure option IDs are single uppercase letters (A, B, C, D).\n\n"
     )
+    prompt = f"Generate a {difficulty} level question on the topic: '{topic}'."
     try:
         raw_llm_response = await _call_llm(
             prompt,
             llm_config=llm_config,
             temperature=0.7,
             max_tokens=300,
-            system_message={"role": "system", "content": "You are a quiz master. Generate well-structured and clear quiz questions in JSON format."}
+            system_message=QUIZ_SYSTEM_MESSAGE,
+            call_type="quiz",
+            prefix=prefix
         )
-        logging.info(f"[generate_quiz] Raw LLM response: {raw_llm_response}")
+        logging.debug(f"[generate_quiz] Raw LLM response: {raw_llm_response}")
 
         # Clean up LLM response if wrapped in triple backticks
-        if isinstance(raw_llm_response, str) and raw_llm_response.strip().startswith("```"):
-            import re
-            raw_llm_response = re.sub(r"^```[a-zA-Z]*\n?", "", raw_llm_response.strip())
-            raw_llm_response = re.sub(r"\n?```$", "", raw_llm_response.strip())
-        quiz_data = json.loads(raw_llm_response)
-
-        required_keys = ['question', 'options', 'correctAnswerId', 'feedback']
-        if not all(k in quiz_data for k in required_keys):
-            raise ValueError(f"LLM response missing required quiz keys: {', '.join(k for k in required_keys if k not in quiz_data)} - Raw: {raw_llm_response}")
-        if not isinstance(quiz_data['options'], list) or not all(isinstance(opt, dict) and 'id' in opt and 'text' in opt for opt in quiz_data['options']):
-            raise ValueError(f"LLM options not in expected format: {raw_llm_response}")
-
-        return quiz_data # Directly return the parsed JSON
+        raw_llm_response = _strip_code_fences(raw_llm_response)
+        return _validate_quiz_question(json.loads(raw_llm_response), raw_llm_response)
     except (json.JSONDecodeError, LLMProviderError, ValueError) as e:
         logging.error(f"[generate_quiz] Failed to parse quiz or LLM error: {e} - Raw LLM Response: {raw_llm_response}")
         raise LLMProviderError(f"Failed to generate valid quiz: {e}")
 
+async def generate_quiz_batch(topic: str, difficulty: str = "medium", count: int = 5, llm_config: Optional[BackendLLMConfig] = None) -> list[dict]:
+    """
+    Generates up to `count` distinct MCQ questions in one LLM call. Used to refill the quiz bank.
+    Invalid items are dropped; raises LLMProviderError if none survive validation.
+    """
+    if not topic.strip():
+        raise ValueError("Topic cannot be empty for quiz generation.")
+
+    raw_llm_response = None
+    prefix = (
+        "Each question has 4 options (A, B, C, D), the correct answer's option ID and a concise feedback/explanation for the correct answer.\n"
+        "Cover different aspects of the topic; do not repeat questions.\n"
+        "Return the output as a JSON object with a single key 'questions' holding a list of objects with the keys: "
+        "'question', 'options' (list of {id: string, text: string}), 'correctAnswerId' (string), 'feedback' (string).\n"
+        "Ensure option IDs are single uppercase letters (A, B, C, D).\n\n"
+    )
+    prompt = f"Generate {count} distinct {difficulty} level multiple choice quiz questions on the topic: '{topic}'."
+    try:
+        raw_llm_response = await _call_llm(
+            prompt,
+            llm_config=llm_config,
+            temperature=0.8,
+            max_tokens=300 * count,
+            system_message=QUIZ_SYSTEM_MESSAGE,
+            json_mode=True,
+            call_type="quiz",
+            prefix=prefix
+        )
+        data = json.loads(_strip_code_fences(raw_llm_response))
+    except (json.JSONDecodeError, LLMProviderError) as e:
+        logging.error(f"[generate_quiz_batch] Failed to parse quiz batch or LLM error: {e} - Raw LLM Response: {raw_llm_response}")
+        raise LLMProviderError(f"Failed to generate valid quiz: {e}")
+
+    items = data.get("questions", []) if isinstance(data, dict) else data
+    questions = []
+    for item in items if isinstance(items, list) else []:
+        try:
+            questions.append(_validate_quiz_question(item, raw_llm_response))
+        except ValueError as e:
+            logging.warning(f"[generate_quiz_batch] dropping invalid question: {e}")
+    if not questions:
+        raise LLMProviderError(f"Failed to generate valid quiz: no valid questions in response - Raw: {raw_llm_response}")
+    return questions
+
 # --- Topic Detection ---
-async def detect_topic(question: str, llm_config: Optional[BackendLLMConfig]) -> str:
+async def resolve_topic(question: str, username: str, llm_config: Optional[BackendLLMConfig]) -> str:
+    """Matches the question against the user's syllabus first and only asks the LLM below the confidence threshold."""
+    match = await topic_classifier.classify(username, question)
+    if match is not None:
+        logging.debug(f"[resolve_topic] local match {match.topic!r} ({match.confidence})")
+        return match.topic
+    return await detect_topic(question, llm_config, username)
+
+async def detect_topic(question: str, llm_config: Optional[BackendLLMConfig], username: Optional[str] = None) -> str:
     """Detects the most relevant topic for a given question using an LLM."""
+    cache_key = make_key("topic", question, 0.1, 50, *_provider_model(llm_config))
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    return await detect_flight.do(cache_key, lambda: _detect_topic_once(question, llm_config, cache_key, username))
+
+async def _detect_topic_once(question: str, llm_config: Optional[BackendLLMConfig], cache_key: str, username: Optional[str] = None) -> str:
     prompt = (
         "Analyze the academic question below and return the most relevant topic or subject "
         "it belongs to (e.g., 'linear algebra', 'organic chemistry', 'mughal history', etc).\n"
         "Respond ONLY with the topic name.\n\n"
         f"question: {question}"
     )
-    return (await _call_llm(prompt, llm_config=llm_config, temperature=0.1, max_tokens=50)).strip()
+    topic = (await _call_llm(prompt, llm_config=llm_config, temperature=0.1, max_tokens=50, call_type="detect", username=username)).strip()
+    await llm_cache.set(cache_key, topic)
+    return topic
 
 
 # --- Optional: get user's last saved KB content on a topic ---
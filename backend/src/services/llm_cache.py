@@ -0,0 +1,210 @@
+"""
+two-tier cache for llm responses.
+
+- tier 1: in-process lru (per worker, fast)
+- tier 2: sqlite file on local disk, shared by every uvicorn worker and kept across deploys
+- keys are a sha256 of the normalized prompt inputs, provider, model and sampling params
+- ttl per call type (explanations vs related topics vs topic detection)
+- size-based eviction of least recently used rows
+- hit/miss/byte counters for /metrics
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from cachetools import LRUCache
+
+from services.llm_metrics import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_EVICT_EVERY = 50  # writes between size checks
+
+# seconds; explanations embed user progress so they go stale fastest
+TTL_BY_KIND = {
+    "explain": int(os.getenv("LLM_CACHE_TTL_EXPLAIN", "3600")),
+    "related": int(os.getenv("LLM_CACHE_TTL_RELATED", "86400")),
+    "topic": int(os.getenv("LLM_CACHE_TTL_TOPIC", "604800")),
+}
+# the fused explain call (topic + explanation + related in one response) carries the same
+# explanation as "explain", so it must expire with it
+TTL_BY_KIND["fused"] = TTL_BY_KIND["explain"]
+DEFAULT_TTL = 600
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(part: Any) -> Any:
+    if isinstance(part, str):
+        return _WHITESPACE.sub(" ", part).strip()
+    if isinstance(part, float):
+        return round(part, 4)
+    if isinstance(part, (list, tuple)):
+        return [_normalize(p) for p in part]
+    return part
+
+
+def make_key(kind: str, *parts: Any) -> str:
+    """Stable hash of (kind, normalized parts). Parts should include provider, model and sampling params."""
+    payload = json.dumps([kind, _normalize(list(parts))], sort_keys=True, default=str)
+    return f"{kind}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class LLMCache:
+    def __init__(self, path: Path = LLM_CACHE_PATH, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory: LRUCache = LRUCache(maxsize=memory_entries)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "bytes_read": 0,
+            "bytes_written": 0,
+            "evictions": 0,
+            "disk_errors": 0,
+        }
+
+    # --- sqlite tier (blocking, always called via asyncio.to_thread) ---
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_expires_at ON llm_cache (expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def _disk_get(self, key: str) -> Optional[tuple[float, str]]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[1], row[0]
+
+    def _disk_set(self, key: str, kind: str, value: str, expires_at: float):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, kind, value, size, created_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, value, len(value), now, expires_at, now),
+            )
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= LLM_CACHE_EVICT_EVERY:
+                self._writes_since_evict = 0
+                self._evict(db, now)
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        """Drops expired rows, then least recently used rows until the store is under 90% of max_bytes."""
+        evicted = db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total > self.max_bytes:
+            target = int(self.max_bytes * 0.9)
+            freed = 0
+            doomed = []
+            for key, size in db.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC"):
+                if total - freed <= target:
+                    break
+                doomed.append((key,))
+                freed += size
+            db.executemany("DELETE FROM llm_cache WHERE key = ?", doomed)
+            evicted += len(doomed)
+        self.counters["evictions"] += evicted
+
+    def _disk_stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        return {"entries": entries, "bytes": size}
+
+    # --- public async api ---
+
+    async def get(self, key: str) -> Optional[Any]:
+        kind = key.split(":", 1)[0]
+        entry = self.memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self.counters["memory_hits"] += 1
+                llm_metrics.record_cache(kind, hit=True)
+                return value
+            self.memory.pop(key, None)
+        try:
+            row = await asyncio.to_thread(self._disk_get, key)
+        except sqlite3.Error as e:
+            self.counters["disk_errors"] += 1
+            logger.error(f"[llm_cache] disk read failed: {e}")
+            row = None
+        if row is None:
+            self.counters["misses"] += 1
+            llm_metrics.record_cache(kind, hit=False)
+            return None
+        expires_at, raw = row
+        self.counters["disk_hits"] += 1
+        llm_metrics.record_cache(kind, hit=True)
+        self.counters["bytes_read"] += len(raw)
+        value = json.loads(raw)
+        self.memory[key] = (expires_at, value)
+        return value
+
+    async def set(self, key: str, value: Any):
+        kind = key.split(":", 1)[0]
+        expires_at = time.time() + TTL_BY_KIND.get(kind, DEFAULT_TTL)
+        self.memory[key] = (expires_at, value)
+        raw = json.dumps(value)
+        self.counters["writes"] += 1
+        self.counters["bytes_written"] += len(raw)
+        try:
+            await asyncio.to_thread(self._disk_set, key, kind, raw, expires_at)
+        except sqlite3.Error as e:
+            self.counters["disk_errors"] += 1
+            logger.error(f"[llm_cache] disk write failed: {e}")
+
+    def stats(self) -> dict:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        try:
+            disk = self._disk_stats()
+        except sqlite3.Error:
+            disk = {}
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk": {**disk, "max_bytes": self.max_bytes, "path": str(self.path)},
+            "ttl_seconds": TTL_BY_KIND,
+        }
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,208 @@
+"""
+long-lived, pooled http clients for the llm providers.
+
+- one connection pool (httpx.AsyncClient) per (provider, base_url), shared by every
+  api key: gemini sends the key per request, openai gets a thin sdk wrapper per key
+  on top of the shared pool
+- the sdk wrappers are kept in an LRU of LLM_SDK_CLIENTS_MAX entries; they own no
+  sockets, so per-user keys can't grow the number of pools or connections
+- keep-alive connection pools, http/2 where the provider supports it
+- created on app startup, closed on shutdown
+- exposes pool stats for the /metrics endpoint
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import httpx
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+POOL_CONNECT_TIMEOUT = float(os.getenv("LLM_POOL_CONNECT_TIMEOUT", "10"))
+SDK_CLIENTS_MAX = int(os.getenv("LLM_SDK_CLIENTS_MAX", "1024"))
+
+DEFAULT_BASE_URLS = {
+    "openai": OPENAI_BASE_URL,
+    "gemini": GEMINI_BASE_URL,
+    "ollama": OLLAMA_BASE_URL,
+}
+
+# ollama is plain http on localhost, h2 only makes sense over tls
+HTTP2_PROVIDERS = {"openai", "gemini"}
+
+# read timeouts match what the provider calls used before pooling
+READ_TIMEOUTS = {
+    "openai": 60.0,
+    "gemini": 60.0,
+    "ollama": 120.0,
+}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@dataclass
+class ClientHandle:
+    http: httpx.AsyncClient
+    sdk: Any = None  # AsyncOpenAI bound to the caller's key, for openai
+
+
+class _PooledClient:
+    def __init__(self, provider: str, base_url: str, http: httpx.AsyncClient):
+        self.provider = provider
+        self.base_url = base_url
+        self.http = http
+        # api_key -> sdk wrapper around self.http; dropping one never closes the shared pool
+        self.sdks: LRUCache = LRUCache(maxsize=SDK_CLIENTS_MAX)
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.requests = 0
+
+    def sdk_for(self, api_key: Optional[str]):
+        if self.provider != "openai":
+            return None
+        sdk = self.sdks.get(api_key or "")
+        if sdk is None:
+            from openai import AsyncOpenAI
+            sdk = AsyncOpenAI(api_key=api_key, base_url=self.base_url, http_client=self.http)
+            self.sdks[api_key or ""] = sdk
+        return sdk
+
+    def touch(self):
+        self.last_used = time.time()
+        self.requests += 1
+
+    def pool_stats(self) -> dict:
+        # httpx does not expose pool state publicly, so read it defensively from httpcore
+        pool = getattr(getattr(self.http, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+        http2 = sum(1 for c in connections if "HTTP/2" in repr(c))
+        return {
+            "connections": len(connections),
+            "idle": idle,
+            "active": len(connections) - idle,
+            "http2_connections": http2,
+        }
+
+
+class LLMClientRegistry:
+    """Holds one pooled client per (provider, base_url)."""
+
+    def __init__(self):
+        self._clients: dict[tuple, _PooledClient] = {}
+        self._lock = asyncio.Lock()
+        self._http2 = _http2_available()
+        self.closed = False
+        if not self._http2:
+            logger.info("[llm_clients] h2 not installed, falling back to HTTP/1.1 for all providers")
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        )
+
+    def _build(self, provider: str, base_url: str) -> _PooledClient:
+        timeout = httpx.Timeout(READ_TIMEOUTS.get(provider, 60.0), connect=POOL_CONNECT_TIMEOUT)
+        http = httpx.AsyncClient(
+            base_url=base_url,
+            http2=self._http2 and provider in HTTP2_PROVIDERS,
+            limits=self._limits(),
+            timeout=timeout,
+        )
+        logger.info(f"[llm_clients] opened pool provider={provider} base_url={base_url}")
+        return _PooledClient(provider, base_url, http)
+
+    async def get(self, provider: str, api_key: Optional[str] = None, base_url: Optional[str] = None) -> ClientHandle:
+        """Returns the shared pool for this provider/base_url (created on first use), with an sdk bound to api_key."""
+        if self.closed:
+            raise RuntimeError("LLM client registry is closed.")
+        base_url = base_url or DEFAULT_BASE_URLS.get(provider)
+        if not base_url:
+            raise ValueError(f"No base URL configured for provider: {provider}")
+        key = (provider, base_url)
+        client = self._clients.get(key)
+        if client is None:
+            async with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._build(provider, base_url)
+                    self._clients[key] = client
+        client.touch()
+        return ClientHandle(http=client.http, sdk=client.sdk_for(api_key))
+
+    async def aclose(self):
+        """Closes every pooled client. Called on app shutdown."""
+        self.closed = True
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            try:
+                # the sdk wrappers only borrow client.http
+                client.sdks.clear()
+                await client.http.aclose()
+            except Exception as e:
+                logger.error(f"[llm_clients] failed to close {client.provider} client: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "http2_enabled": self._http2,
+            "limits": {
+                "max_connections": POOL_MAX_CONNECTIONS,
+                "max_keepalive_connections": POOL_MAX_KEEPALIVE,
+                "keepalive_expiry": POOL_KEEPALIVE_EXPIRY,
+                "max_sdk_clients": SDK_CLIENTS_MAX,
+            },
+            "clients": [
+                {
+                    "provider": provider,
+                    "base_url": base_url,
+                    "sdk_clients": len(c.sdks),
+                    "requests": c.requests,
+                    "age_seconds": round(time.time() - c.created_at, 1),
+                    "idle_seconds": round(time.time() - c.last_used, 1),
+                    **c.pool_stats(),
+                }
+                for (provider, base_url), c in self._clients.items()
+            ],
+        }
+
+
+registry: Optional[LLMClientRegistry] = None
+
+
+def init_registry() -> LLMClientRegistry:
+    global registry
+    if registry is None or registry.closed:
+        registry = LLMClientRegistry()
+    return registry
+
+
+def get_registry() -> LLMClientRegistry:
+    """Returns the app-wide registry, creating it lazily for scripts that skip app startup."""
+    return registry if registry is not None and not registry.closed else init_registry()
+
+
+async def close_registry():
+    global registry
+    if registry is not None:
+        await registry.aclose()
+        registry = None
@@ -0,0 +1,196 @@
+"""
+instrumentation for llm provider calls.
+
+- one series per (provider, model, function) where function is the call type
+  (explain, judge, detect, related, quiz, parse, feedback)
+- histograms: queue wait, time to first token (streamed calls), total latency,
+  prompt and completion tokens
+- outcome counters (ok / rate_limited / timeout / unavailable / overloaded / error)
+  and response cache hits per function
+- estimated cost per series from LLM_MODEL_PRICES (usd per million prompt/completion
+  tokens, keyed "provider/model" or "provider/*"), so model routing can be tuned
+- full prompts are logged for a sample of calls (LLM_PROMPT_LOG_SAMPLE_RATE)
+  instead of on every request
+"""
+
+import os
+import json
+import random
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_PROMPT_LOG_SAMPLE_RATE = float(os.getenv("LLM_PROMPT_LOG_SAMPLE_RATE", "0.01"))
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# usd per million (prompt, completion) tokens; list prices, override with LLM_MODEL_PRICES
+DEFAULT_MODEL_PRICES = {
+    "openai/gpt-4o": (2.5, 10.0),
+    "openai/gpt-4o-mini": (0.15, 0.6),
+    "gemini/gemini-1.5-flash": (0.075, 0.3),
+    "gemini/gemini-2.0-flash": (0.1, 0.4),
+    "ollama/*": (0.0, 0.0),
+    "mock/*": (0.0, 0.0),
+}
+
+
+def _load_prices() -> dict[str, tuple[float, float]]:
+    prices = dict(DEFAULT_MODEL_PRICES)
+    override = os.getenv("LLM_MODEL_PRICES")
+    if override:
+        try:
+            prices.update({route: (float(p[0]), float(p[1])) for route, p in json.loads(override).items()})
+        except (json.JSONDecodeError, AttributeError, TypeError, ValueError, IndexError) as e:
+            logger.error(f"[llm_metrics] ignoring invalid LLM_MODEL_PRICES: {e}")
+    return prices
+
+
+MODEL_PRICES = _load_prices()
+
+
+def call_cost(provider: str, model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Optional[float]:
+    """Estimated usd cost of one call, None when the model has no known price."""
+    price = MODEL_PRICES.get(f"{provider}/{model}") or MODEL_PRICES.get(f"{provider}/*")
+    if price is None:
+        return None
+    return ((prompt_tokens or 0) * price[0] + (completion_tokens or 0) * price[1]) / 1_000_000
+
+# token counts reported by the provider for the call running in this context (see note_usage)
+call_usage: ContextVar[Optional[dict]] = ContextVar("llm_call_usage", default=None)
+
+
+def note_usage(prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+    """Called by the provider backends with the usage fields of their response."""
+    usage = call_usage.get()
+    if usage is None:
+        return
+    if prompt_tokens is not None:
+        usage["prompt_tokens"] = prompt_tokens
+    if completion_tokens is not None:
+        usage["completion_tokens"] = completion_tokens
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (prometheus-style estimate)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+
+class CallSeries:
+    def __init__(self):
+        self.queue_wait = Histogram(SECONDS_BUCKETS)
+        self.ttft = Histogram(SECONDS_BUCKETS)
+        self.latency = Histogram(SECONDS_BUCKETS)
+        self.prompt_tokens = Histogram(TOKEN_BUCKETS)
+        self.completion_tokens = Histogram(TOKEN_BUCKETS)
+        self.outcomes: dict[str, int] = {}
+        self.cost_usd: Optional[float] = None
+
+
+class LLMMetrics:
+    def __init__(self):
+        self.series: dict[tuple[str, str, str], CallSeries] = {}
+        self.cache: dict[str, dict[str, int]] = {}
+
+    def record_call(
+        self,
+        provider: str,
+        model: str,
+        function: str,
+        outcome: str,
+        latency: Optional[float],
+        queue_wait: Optional[float] = None,
+        ttft: Optional[float] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+    ):
+        series = self.series.setdefault((provider, model, function), CallSeries())
+        series.outcomes[outcome] = series.outcomes.get(outcome, 0) + 1
+        if latency is not None:
+            series.latency.observe(latency)
+        if queue_wait is not None:
+            series.queue_wait.observe(queue_wait)
+        if ttft is not None:
+            series.ttft.observe(ttft)
+        if prompt_tokens is not None:
+            series.prompt_tokens.observe(prompt_tokens)
+        if completion_tokens is not None:
+            series.completion_tokens.observe(completion_tokens)
+        # failed and rejected calls are not billed (close enough for routing decisions)
+        cost = call_cost(provider, model, prompt_tokens, completion_tokens) if outcome == "ok" else None
+        if cost is not None:
+            series.cost_usd = (series.cost_usd or 0.0) + cost
+
+    def record_cache(self, function: str, hit: bool):
+        counters = self.cache.setdefault(function, {"hits": 0, "misses": 0})
+        counters["hits" if hit else "misses"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "calls": [
+                {
+                    "provider": provider,
+                    "model": model,
+                    "function": function,
+                    "outcomes": s.outcomes,
+                    "queue_wait_seconds": s.queue_wait.snapshot(),
+                    "ttft_seconds": s.ttft.snapshot(),
+                    "latency_seconds": s.latency.snapshot(),
+                    "prompt_tokens": s.prompt_tokens.snapshot(),
+                    "completion_tokens": s.completion_tokens.snapshot(),
+                    "cost_usd": round(s.cost_usd, 6) if s.cost_usd is not None else None,
+                    "mean_cost_usd": round(s.cost_usd / s.outcomes["ok"], 8) if s.cost_usd is not None else None,
+                }
+                for (provider, model, function), s in self.series.items()
+            ],
+            "cache": self.cache,
+            "prompt_log_sample_rate": LLM_PROMPT_LOG_SAMPLE_RATE,
+        }
+
+
+llm_metrics = LLMMetrics()
+
+
+def maybe_log_prompt(provider: str, model: str, function: str, prompt: str, response: Optional[str]):
+    """Logs the full prompt and response for a sample of calls."""
+    if LLM_PROMPT_LOG_SAMPLE_RATE > 0 and random.random() < LLM_PROMPT_LOG_SAMPLE_RATE:
+        logger.info(f"[llm_metrics] sampled {function} call {provider}/{model}\n--- prompt ---\n{prompt}\n--- response ---\n{response}")
@@ -0,0 +1,311 @@
+"""
+resilience policy for llm calls, configured per call type.
+
+- retries with exponential backoff + full jitter for transient failures
+- failover to secondary provider/model targets (e.g. gemini -> local ollama)
+- hedged duplicate request once the p95 latency of the target is exceeded
+- circuit breaker per (provider, model) so a dead endpoint is skipped, not hammered
+- optional "target" per call type, so short auxiliary calls (detect, judge, related)
+  can go to a smaller/cheaper model than the one the user picked for explanations;
+  the caller's model stays in the chain as the first fallback
+- users who saved their own provider/model (users.llm_*) keep it for routed call types
+
+LLM_ROUTING_POLICY (json) overrides the defaults, e.g.
+  {"default": {"retries": 1, "fallbacks": [{"provider": "ollama", "model": "llama3"}]},
+   "detect": {"target": {"provider": "ollama", "model": "llama3.2:1b"}},
+   "explain": {"hedge": true}}
+targets and fallbacks take their api key from "api_key_env", or reuse the caller's key
+when the provider matches.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from cachetools import TTLCache
+
+from models import BackendLLMConfig
+from db import SessionLocal
+from db_models import User
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+USER_OVERRIDE_TTL = int(os.getenv("LLM_USER_OVERRIDE_TTL", "300"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class AllCircuitsOpenError(Exception):
+    """Every target for the call type was skipped by its circuit breaker; no call was made."""
+
+
+@dataclass
+class RoutePolicy:
+    retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 4.0
+    fallbacks: list[dict] = field(default_factory=list)
+    hedge: bool = False
+    # {"provider", "model", "api_key_env"?}; None keeps the caller's model
+    target: Optional[dict] = None
+
+
+# short, cheap calls are the ones worth hedging by default
+DEFAULT_POLICIES = {
+    "default": {},
+    "detect": {"hedge": True},
+    "judge": {"hedge": True},
+}
+
+
+def _load_policies() -> dict[str, RoutePolicy]:
+    raw = dict(DEFAULT_POLICIES)
+    override = os.getenv("LLM_ROUTING_POLICY")
+    if override:
+        try:
+            for call_type, conf in json.loads(override).items():
+                raw[call_type] = {**raw.get(call_type, {}), **conf}
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.error(f"[llm_routing] ignoring invalid LLM_ROUTING_POLICY: {e}")
+    base = raw.get("default", {})
+    return {call_type: RoutePolicy(**{**base, **conf}) for call_type, conf in raw.items()}
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive endpoint failures -> half-open after cooldown (one trial call)"""
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or self.failures >= BREAKER_FAILURE_THRESHOLD:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Trial ended without telling us anything about endpoint health (e.g. bad request)."""
+        self.trial_in_flight = False
+
+
+class LatencyTracker:
+    def __init__(self):
+        self.samples: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def _load_user_override(username: str) -> Optional[BackendLLMConfig]:
+    """Blocking: the provider/model a user saved on their account, if complete."""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if user and user.llm_provider and user.llm_model:
+            return BackendLLMConfig(provider=user.llm_provider, model=user.llm_model, api_key=user.llm_api_key or "")
+        return None
+    finally:
+        db.close()
+
+
+class UserOverrides:
+    def __init__(self):
+        self.cache: TTLCache = TTLCache(maxsize=10000, ttl=USER_OVERRIDE_TTL)
+
+    async def get(self, username: str) -> Optional[BackendLLMConfig]:
+        if username not in self.cache:
+            try:
+                self.cache[username] = await asyncio.to_thread(_load_user_override, username)
+            except Exception as e:
+                logger.error(f"[llm_routing] could not load llm config for {username!r}: {e}")
+                return None
+        return self.cache[username]
+
+    def invalidate(self, username: str):
+        self.cache.pop(username, None)
+
+
+user_overrides = UserOverrides()
+
+
+class LLMRouter:
+    def __init__(self):
+        self.policies = _load_policies()
+        self.breakers: dict[tuple[str, str], CircuitBreaker] = {}
+        self.latency: dict[tuple[str, str], LatencyTracker] = {}
+        self.counters = {"calls": 0, "retries": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0, "breaker_skips": 0}
+        # call type -> "provider/model" -> calls whose first target it was
+        self.routed: dict[str, dict[str, int]] = {}
+
+    def policy(self, call_type: str) -> RoutePolicy:
+        return self.policies.get(call_type) or self.policies["default"]
+
+    def _breaker(self, cfg: BackendLLMConfig) -> CircuitBreaker:
+        return self.breakers.setdefault((cfg.provider, cfg.model), CircuitBreaker())
+
+    def _latency(self, cfg: BackendLLMConfig) -> LatencyTracker:
+        return self.latency.setdefault((cfg.provider, cfg.model), LatencyTracker())
+
+    @staticmethod
+    def _config(spec: dict, llm_config: BackendLLMConfig) -> BackendLLMConfig:
+        if spec.get("api_key_env"):
+            api_key = os.getenv(spec["api_key_env"], "")
+        else:
+            api_key = llm_config.api_key if spec["provider"] == llm_config.provider else ""
+        return BackendLLMConfig(provider=spec["provider"], model=spec["model"], api_key=api_key)
+
+    def targets(self, call_type: str, llm_config: BackendLLMConfig, user_config: Optional[BackendLLMConfig] = None) -> list[BackendLLMConfig]:
+        """Routed target (or the user's saved model) first, then the caller's model, then fallbacks."""
+        policy = self.policy(call_type)
+        candidates = [llm_config]
+        if policy.target:
+            candidates.insert(0, user_config or self._config(policy.target, llm_config))
+        candidates.extend(self._config(fb, llm_config) for fb in policy.fallbacks)
+        targets, seen = [], set()
+        for target in candidates:
+            if (target.provider, target.model) not in seen:
+                seen.add((target.provider, target.model))
+                targets.append(target)
+        return targets
+
+    async def _hedged(self, fn: Callable[[BackendLLMConfig], Awaitable[str]], cfg: BackendLLMConfig, hedge: bool) -> str:
+        delay = self._latency(cfg).p95() if hedge else None
+        first = asyncio.ensure_future(fn(cfg))
+        if delay is None:
+            return await first
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.counters["hedges"] += 1
+                tasks.add(asyncio.ensure_future(fn(cfg)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not first.done():
+                first.cancel()
+
+    async def execute(
+        self,
+        call_type: str,
+        llm_config: BackendLLMConfig,
+        fn: Callable[[BackendLLMConfig], Awaitable[str]],
+        transient: tuple[type[BaseException], ...],
+        endpoint_failure: tuple[type[BaseException], ...],
+        username: Optional[str] = None,
+    ) -> str:
+        """
+        Runs fn(target) under the call type's policy. `transient` errors are retried and fail over;
+        `endpoint_failure` errors also count against the target's circuit breaker.
+        Anything else (bad key, bad request) is raised immediately for the caller's own model.
+        When no target succeeds the last error is raised, or AllCircuitsOpenError if every
+        target was skipped by its breaker.
+        """
+        policy = self.policy(call_type)
+        self.counters["calls"] += 1
+        user_config = await user_overrides.get(username) if username and policy.target else None
+        targets = self.targets(call_type, llm_config, user_config)
+        routed = self.routed.setdefault(call_type, {})
+        route = f"{targets[0].provider}/{targets[0].model}"
+        routed[route] = routed.get(route, 0) + 1
+        last_error: Optional[BaseException] = None
+        for index, target in enumerate(targets):
+            breaker = self._breaker(target)
+            if index > 0:
+                self.counters["failovers"] += 1
+                logger.warning(f"[llm_routing] {call_type}: failing over to {target.provider}/{target.model}")
+            for attempt in range(policy.retries + 1):
+                if not breaker.allow():
+                    self.counters["breaker_skips"] += 1
+                    break
+                if attempt > 0:
+                    self.counters["retries"] += 1
+                    await asyncio.sleep(random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** (attempt - 1))))
+                started = time.monotonic()
+                try:
+                    result = await self._hedged(fn, target, policy.hedge)
+                except transient as e:
+                    last_error = e
+                    if isinstance(e, endpoint_failure):
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+                    continue
+                except Exception as e:
+                    breaker.release()
+                    last_error = e
+                    if (target.provider, target.model) == (llm_config.provider, llm_config.model):
+                        raise
+                    # a misconfigured routed/fallback target must not mask the caller's own model
+                    logger.error(f"[llm_routing] {call_type} target {target.provider}/{target.model} failed: {e}")
+                    break
+                except BaseException:
+                    breaker.release()
+                    raise
+                breaker.record_success()
+                self._latency(target).add(time.monotonic() - started)
+                return result
+        if last_error is None:
+            raise AllCircuitsOpenError(f"circuit open for every {call_type} target")
+        raise last_error
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "breakers": [
+                {"provider": p, "model": m, "state": b.state, "consecutive_failures": b.failures, "times_opened": b.times_opened}
+                for (p, m), b in self.breakers.items()
+            ],
+            "p95_seconds": {f"{p}/{m}": t.p95() for (p, m), t in self.latency.items()},
+            "routed": self.routed,
+            "policies": {k: vars(v) for k, v in self.policies.items()},
+        }
+
+
+router = LLMRouter()
@@ -0,0 +1,220 @@
+"""
+admission control in front of the llm providers.
+
+- one limiter per (provider, model, api key)
+- concurrency limit adapted with aimd: +1/limit per success, halved on 429/timeout
+- optional token-bucket rate limit (requests per second)
+- bounded fifo wait queue; callers are rejected up front when the queue is full
+  or their estimated wait exceeds the deadline, instead of piling up
+- queue depth, wait time and throttle counters for /metrics
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+DEFAULT_MAX_CONCURRENCY = {"ollama": 2, "openai": 16, "gemini": 16, "mock": 256}
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_DEADLINE = float(os.getenv("LLM_QUEUE_DEADLINE", "30"))
+# don't halve the limit again for throttles caused by the same burst
+DECREASE_COOLDOWN = 1.0
+
+
+def _max_concurrency(provider: str) -> int:
+    return int(os.getenv(f"LLM_MAX_CONCURRENCY_{provider.upper()}", DEFAULT_MAX_CONCURRENCY.get(provider, 8)))
+
+
+def _rate_limit(provider: str) -> float:
+    """requests per second, 0 means unlimited"""
+    return float(os.getenv(f"LLM_RATE_LIMIT_{provider.upper()}", "0"))
+
+
+class LLMOverloaded(Exception):
+    """Raised when a call is rejected because the provider's queue is full or too slow for the deadline."""
+
+
+class ProviderLimiter:
+    def __init__(self, provider: str, model: str, max_limit: int, rate: float, max_queue: int = LLM_MAX_QUEUE):
+        self.provider = provider
+        self.model = model
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.max_queue = max_queue
+        self.waiters: deque[asyncio.Future] = deque()
+        # token bucket
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        # ewma of call duration, used to estimate queue wait
+        self.avg_service_time = 1.0
+        self.last_decrease = 0.0
+        self.counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_deadline": 0,
+            "throttled": 0,
+            "timeouts": 0,
+            "succeeded": 0,
+            "failed": 0,
+        }
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.max_queue_depth = 0
+
+    # --- concurrency slots ---
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def _estimated_wait(self, position: int) -> float:
+        return self.avg_service_time * position / max(1, int(self.limit))
+
+    async def _acquire_slot(self, deadline: float):
+        if self._has_slot() and not self.waiters:
+            self.in_flight += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.counters["rejected_queue_full"] += 1
+            raise LLMOverloaded(f"{self.provider}/{self.model} queue is full ({self.max_queue} waiting)")
+        remaining = deadline - time.monotonic()
+        if self._estimated_wait(len(self.waiters) + 1) > remaining:
+            self.counters["rejected_deadline"] += 1
+            raise LLMOverloaded(f"{self.provider}/{self.model} estimated queue wait exceeds {remaining:.1f}s deadline")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.counters["queued"] += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=max(0.0, remaining))
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # the slot was handed over just as we timed out; give it back
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self._remove_waiter(waiter)
+            self.counters["rejected_deadline"] += 1
+            raise LLMOverloaded(f"{self.provider}/{self.model} queue wait exceeded deadline")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self._remove_waiter(waiter)
+            raise
+
+    def _remove_waiter(self, waiter: asyncio.Future):
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        # hand slots directly to waiters in fifo order so new arrivals can't jump the queue
+        while self.waiters and self._has_slot():
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    # --- token bucket ---
+
+    async def _acquire_token(self, deadline: float):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                self.counters["rejected_deadline"] += 1
+                raise LLMOverloaded(f"{self.provider}/{self.model} rate limit wait exceeds deadline")
+            await asyncio.sleep(wait)
+
+    # --- aimd feedback ---
+
+    def on_success(self, duration: float):
+        self.counters["succeeded"] += 1
+        self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * duration
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def on_throttle(self, timeout: bool = False):
+        self.counters["timeouts" if timeout else "throttled"] += 1
+        now = time.monotonic()
+        if now - self.last_decrease >= DECREASE_COOLDOWN:
+            self.last_decrease = now
+            self.limit = max(1.0, self.limit / 2)
+
+    def on_failure(self):
+        self.counters["failed"] += 1
+
+    @asynccontextmanager
+    async def slot(self, deadline: float):
+        start = time.monotonic()
+        await self._acquire_slot(deadline)
+        try:
+            await self._acquire_token(deadline)
+            waited = time.monotonic() - start
+            self.counters["admitted"] += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+            yield waited
+        finally:
+            self._release_slot()
+
+    def stats(self) -> dict:
+        admitted = self.counters["admitted"]
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "limit": round(self.limit, 2),
+            "max_limit": self.max_limit,
+            "rate_per_second": self.rate,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "avg_wait_seconds": round(self.wait_time_total / admitted, 4) if admitted else 0.0,
+            "max_wait_seconds": round(self.wait_time_max, 4),
+            "avg_service_seconds": round(self.avg_service_time, 3),
+            **self.counters,
+        }
+
+
+class LLMScheduler:
+    def __init__(self):
+        self.limiters: dict[tuple[str, str, str], ProviderLimiter] = {}
+
+    def limiter(self, provider: str, model: str, api_key: Optional[str]) -> ProviderLimiter:
+        key = (provider, model, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8])
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            limiter = ProviderLimiter(provider, model, _max_concurrency(provider), _rate_limit(provider))
+            self.limiters[key] = limiter
+        return limiter
+
+    def stats(self) -> list[dict]:
+        return [{**limiter.stats(), "key": key[2]} for key, limiter in self.limiters.items()]
+
+
+scheduler = LLMScheduler()
+
+
+def queue_deadline(timeout: Optional[float] = None) -> float:
+    return time.monotonic() + (LLM_QUEUE_DEADLINE if timeout is None else timeout)
@@ -0,0 +1,99 @@
+"""
+canned llm responses for load tests and local development.
+
+- used in-process by the "mock" provider in services.llm and over http by
+  src/bench/mock_llm_server.py (openai / ollama wire formats)
+- the in-process provider only exists when MOCK_LLM_ENABLED=1 (load tests, local dev),
+  so clients of a production backend can't select it
+- lognormal time-to-first-token, then tokens streamed at a fixed rate
+- recognizes the prompts the backend sends (topic detection, judge, related
+  topics, quiz / quiz batch, fused explain, syllabus parsing and
+  outline cleanup) and answers with valid json for them
+"""
+
+import os
+import re
+import json
+import math
+import random
+import asyncio
+from typing import AsyncIterator
+
+MOCK_LLM_ENABLED = os.getenv("MOCK_LLM_ENABLED", "0") == "1"
+MOCK_LLM_LATENCY_MEDIAN = float(os.getenv("MOCK_LLM_LATENCY_MEDIAN", "0.3"))  # seconds to first token
+MOCK_LLM_LATENCY_SIGMA = float(os.getenv("MOCK_LLM_LATENCY_SIGMA", "0.5"))  # lognormal spread, 0 = fixed
+MOCK_LLM_TOKENS_PER_SECOND = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "50"))  # 0 = all at once
+MOCK_LLM_ERROR_RATE = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))
+
+_TOPICS = ["linear algebra", "organic chemistry", "thermodynamics", "graph theory", "microeconomics"]
+_LOREM = (
+    "This concept builds on a few core ideas. First, define the terms precisely. "
+    "Then look at a small worked example and check each step against the definition. "
+    "Finally, connect it to related results you already know, since most exam questions "
+    "test whether you can move between the definition, an example and an application."
+)
+
+
+class MockLLMError(Exception):
+    """Injected failure (MOCK_LLM_ERROR_RATE), so retry/failover paths can be load tested too."""
+
+
+def first_token_delay() -> float:
+    if MOCK_LLM_LATENCY_SIGMA <= 0:
+        return MOCK_LLM_LATENCY_MEDIAN
+    return random.lognormvariate(math.log(max(MOCK_LLM_LATENCY_MEDIAN, 1e-3)), MOCK_LLM_LATENCY_SIGMA)
+
+
+def _quiz_question(topic: str, n: int) -> dict:
+    return {
+        "question": f"[{topic}] Which statement about concept #{n} is correct? ({random.getrandbits(32):08x})",
+        "options": [{"id": letter, "text": f"Statement {letter} about concept #{n}"} for letter in "ABCD"],
+        "correctAnswerId": random.choice("ABCD"),
+        "feedback": f"Concept #{n} is defined so that only this statement holds.",
+    }
+
+
+def mock_reply(prompt: str, system_text: str = "", max_tokens: int = 500) -> str:
+    """Picks a plausible answer for one of the backend's prompts."""
+    text = f"{system_text}\n{prompt}"
+    if "return the most relevant topic" in text:
+        return random.choice(_TOPICS)
+    if "section headings taken from the outline" in text:
+        headings = re.findall(r"^\d+\. (.+)$", prompt, re.MULTILINE)
+        return json.dumps({"topics": [{"topic": h.strip(), "content": f"Core ideas and worked examples of {h.strip()}."} for h in headings]})
+    if "You are an academic content parser" in text:
+        return json.dumps({"topics": [{"topic": t, "content": f"Core ideas and worked examples of {t}."} for t in random.sample(_TOPICS, 3)]})
+    if "Return a float between 0 and 1" in text:
+        return f"{random.random():.2f}"
+    if "suggest 2-3 related academic topics" in text:
+        return json.dumps(random.sample(_TOPICS, 3))
+    if "'questions'" in text:
+        # the prefix mentions other numbers ("Each question has 4 options")
+        requested = re.search(r"Generate (\d+) distinct", prompt)
+        count = int(requested.group(1)) if requested else 5
+        return json.dumps({"questions": [_quiz_question("mock", i) for i in range(count)]})
+    if "multiple choice quiz question" in text:
+        return json.dumps(_quiz_question("mock", 1))
+    if '"related_topics"' in text:
+        return json.dumps({"topic": random.choice(_TOPICS), "explanation": _LOREM, "related_topics": random.sample(_TOPICS, 2)})
+    words = _LOREM.split()
+    # roughly 0.75 words per token, like the real providers
+    return " ".join(words[i % len(words)] for i in range(max(1, int(max_tokens * 0.75 * 0.5))))
+
+
+async def mock_stream(prompt: str, system_text: str = "", max_tokens: int = 500) -> AsyncIterator[str]:
+    """Yields the reply word by word after a sampled first-token delay."""
+    await asyncio.sleep(first_token_delay())
+    if MOCK_LLM_ERROR_RATE and random.random() < MOCK_LLM_ERROR_RATE:
+        raise MockLLMError("mock provider injected failure")
+    reply = mock_reply(prompt, system_text, max_tokens)
+    chunks = reply.split(" ")
+    interval = 1 / MOCK_LLM_TOKENS_PER_SECOND if MOCK_LLM_TOKENS_PER_SECOND > 0 else 0
+    for i, chunk in enumerate(chunks):
+        yield chunk if i == 0 else " " + chunk
+        if interval:
+            await asyncio.sleep(interval)
+
+
+async def mock_complete(prompt: str, system_text: str = "", max_tokens: int = 500) -> str:
+    return "".join([chunk async for chunk in mock_stream(prompt, system_text, max_tokens)])
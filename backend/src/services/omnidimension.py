@@ -13,10 +13,12 @@ api_key = os.getenv("OMNIDIM_API_KEY")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 LATEST_KB = Path("data/latest_content.jsonl")
 
-async def voice_ask(audio_data: bytes, user_id: str, topic: str) -> dict:
+async def voice_ask(audio_path: str, user_id: str, topic: str) -> dict:
+    """audio_path is the uploaded recording on disk (see services.uploads), removed by the caller"""
     try:
-        # STT with SDK
-        # stt_response = client.speech.to_text(audio=audio_data)
+        # STT with SDK, streaming the file instead of holding it in memory
+        # with open(audio_path, "rb") as audio:
+        #     stt_response = client.speech.to_text(audio=audio)
         # question = stt_response.text.strip()
         # logging.info(f"Transcribed question: {question}")
         
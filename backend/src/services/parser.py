@@ -1,74 +1,474 @@
-import fitz  # pymupdf
+"""
+syllabus / textbook pdf -> list of {topic, content}.
+
+structure first (PARSE_STRUCTURED):
+- the pdf outline (get_toc) or, failing that, heading lines found by font size / bold
+  (page.get_text("dict"), scanned in the process pool) give the topics and an excerpt
+  of each section's text
+- the llm only cleans those up (names, one-line descriptions, dropping front matter)
+  in a few small batched calls; if it fails the raw headings are used
+
+otherwise map-reduce over the raw text:
+- map: pages are extracted in a process pool (pymupdf is cpu-bound), a range of
+  pages per task, with a bounded number of ranges in flight
+- pages are packed into chunks of at most PARSE_CHUNK_TOKENS estimated tokens and
+  each chunk's topics are extracted by its own llm call, PARSE_LLM_CONCURRENCY at a time;
+  extraction waits for a free llm slot, so only a few chunks are held in memory
+- each call asks for a json object (json_mode) with an output budget sized to its input,
+  up to PARSE_MAX_OUTPUT_TOKENS; a chunk whose output still doesn't parse (e.g. cut
+  off) is dropped and logged rather than turned into topic names line by line
+- reduce: partial topic lists are merged in document order, deduplicated by
+  normalized topic name
+"""
+
+import os
+import re
 import json
+import asyncio
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+import fitz  # pymupdf
+
 from services.llm import _call_llm
+from services.context_builder import estimate_tokens
 from models import BackendLLMConfig
 
-async def parse_pdf_topics(file_path: str, llm_config: dict) -> list[str]:
-    """extract topics from a syllabus or textbook PDF using LLM"""
-    # Convert dict to BackendLLMConfig if needed
-    if isinstance(llm_config, dict):
-        llm_config = BackendLLMConfig(**llm_config)
+logger = logging.getLogger(__name__)
+
+PARSE_PROCESS_WORKERS = int(os.getenv("PARSE_PROCESS_WORKERS", "0")) or os.cpu_count() or 1
+PARSE_PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "16"))
+PARSE_CHUNK_TOKENS = int(os.getenv("PARSE_CHUNK_TOKENS", "6000"))
+PARSE_LLM_CONCURRENCY = int(os.getenv("PARSE_LLM_CONCURRENCY", "4"))
+PARSE_MAX_PAGES = int(os.getenv("PARSE_MAX_PAGES", "1000"))
+PARSE_STRUCTURED = os.getenv("PARSE_STRUCTURED", "1") != "0"
+PARSE_MIN_SECTIONS = int(os.getenv("PARSE_MIN_SECTIONS", "3"))
+PARSE_MAX_OUTPUT_TOKENS = int(os.getenv("PARSE_MAX_OUTPUT_TOKENS", "4096"))
+# topics + one-line descriptions come to roughly this share of the input text
+OUTPUT_TOKENS_RATIO = 0.5
+MIN_OUTPUT_TOKENS = 500
+# merged descriptions of a topic found in several chunks are capped at this many characters
+MAX_CONTENT_CHARS = 1000
+SECTION_EXCERPT_CHARS = 600
+MAX_HEADING_CHARS = 100
+# a line at least this much larger than the body text is a heading candidate
+HEADING_SIZE_RATIO = 1.15
+# headings repeated more often than this are running headers/footers
+MAX_HEADING_REPEATS = 2
+
+# "Chapter 3:", "Unit IV -", "2.1", "IV." (bare roman numerals need punctuation, so "I Love" stays)
+_NUMBERING = re.compile(
+    r"^\s*(?:(?i:chapter|unit|module|section|part|lecture|week|topic)\s+(?:[0-9]+(?:\.[0-9]+)*|[IVXLC]+)|[0-9]+(?:\.[0-9]+)*|[IVXLC]+(?=[.:)]))\s*[.:)\-]?\s+"
+)
+_FRONT_MATTER = {
+    "contents", "table of contents", "preface", "foreword", "acknowledgements", "acknowledgments",
+    "index", "bibliography", "references", "glossary", "appendix", "about the author", "copyright",
+}
+
+parse_stats = {"outline": 0, "headings": 0, "text": 0}
+
+# bump when the extraction logic changes in a way that changes its output
+PARSER_VERSION = 3
+
+
+def parse_config(llm_config: dict) -> dict:
+    """Everything that determines parse_pdf_topics' output for a given file (cache key material)."""
+    return {
+        "version": PARSER_VERSION,
+        "provider": llm_config["provider"],
+        "model": llm_config["model"],
+        "structured": PARSE_STRUCTURED,
+        "min_sections": PARSE_MIN_SECTIONS,
+        "chunk_tokens": PARSE_CHUNK_TOKENS,
+        "max_output_tokens": PARSE_MAX_OUTPUT_TOKENS,
+        "max_pages": PARSE_MAX_PAGES,
+    }
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+ProgressCallback = Callable[[float], Awaitable[None]]
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PARSE_PROCESS_WORKERS)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
 
-    doc = fitz.open(file_path)
-    text_chunks = []
-    import re
 
-    def clean_llm_json(raw: str) -> str:
-        raw = raw.strip()
-        if raw.startswith("```"):
-            raw = re.sub(r"^```[a-zA-Z]*\n?", "", raw)
-            raw = re.sub(r"\n?```$", "", raw)
-        return raw
+# --- map: page extraction (runs in worker processes) ---
 
-    for i, page in enumerate(doc):
-        if i >= 5:
+def _page_count(file_path: str) -> int:
+    with fitz.open(file_path) as doc:
+        return doc.page_count
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> list[str]:
+    """Text of pages [start, stop); runs in a worker process, so it opens its own document."""
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text().strip() for i in range(start, min(stop, doc.page_count))]
+
+
+async def _iter_page_ranges(file_path: str, page_count: int):
+    """Yields page texts in document order, keeping at most one range per worker in flight."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    starts = iter(range(0, page_count, PARSE_PAGES_PER_TASK))
+    in_flight: list[asyncio.Future] = []
+    try:
+        for start in starts:
+            in_flight.append(loop.run_in_executor(pool, _extract_pages, file_path, start, start + PARSE_PAGES_PER_TASK))
+            if len(in_flight) >= PARSE_PROCESS_WORKERS:
+                break
+        while in_flight:
+            pages = await in_flight.pop(0)
+            start = next(starts, None)
+            if start is not None:
+                in_flight.append(loop.run_in_executor(pool, _extract_pages, file_path, start, start + PARSE_PAGES_PER_TASK))
+            yield pages
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+# --- structure: outline / heading fonts (runs in worker processes) ---
+
+def _outline(file_path: str) -> list[list]:
+    with fitz.open(file_path) as doc:
+        return doc.get_toc(simple=True)
+
+
+def _section_excerpts(file_path: str, sections: list[tuple[str, int]]) -> list[str]:
+    """Text following each (title, page) section start, up to SECTION_EXCERPT_CHARS."""
+    excerpts = []
+    with fitz.open(file_path) as doc:
+        for title, page in sections:
+            text = ""
+            for i in range(page, min(page + 2, doc.page_count)):
+                text += doc[i].get_text() + "\n"
+                if len(text) > 2 * SECTION_EXCERPT_CHARS:
+                    break
+            at = text.casefold().find(title.casefold())
+            if at >= 0:
+                text = text[at + len(title):]
+            excerpts.append(_WHITESPACE.sub(" ", text).strip()[:SECTION_EXCERPT_CHARS])
+    return excerpts
+
+
+def _heading_candidates(file_path: str, start: int, stop: int) -> tuple[dict[float, int], list[dict]]:
+    """
+    Font-size histogram (characters per size) of pages [start, stop) and the lines that look like
+    headings there (short, and larger than the range's body text or bold), each with an excerpt of
+    the text that follows it on the page.
+    """
+    sizes: Counter = Counter()
+    pages = []
+    with fitz.open(file_path) as doc:
+        for page_no in range(start, min(stop, doc.page_count)):
+            lines = []
+            for block in doc[page_no].get_text("dict")["blocks"]:
+                if block.get("type") != 0:
+                    continue
+                for line in block["lines"]:
+                    spans = [span for span in line["spans"] if span["text"].strip()]
+                    if not spans:
+                        continue
+                    text = " ".join(span["text"].strip() for span in spans)
+                    size = round(max(span["size"] for span in spans) * 2) / 2
+                    bold = all(span["flags"] & 16 or "bold" in span["font"].lower() for span in spans)
+                    sizes[size] += len(text)
+                    lines.append((text, size, bold))
+            pages.append((page_no, lines))
+    if not sizes:
+        return {}, []
+    body = max(sizes, key=sizes.get)
+    candidates = []
+    for page_no, lines in pages:
+        for i, (text, size, bold) in enumerate(lines):
+            if len(text) > MAX_HEADING_CHARS or not any(c.isalpha() for c in text):
+                continue
+            if size >= body * HEADING_SIZE_RATIO or bold:
+                excerpt = " ".join(following for following, _, _ in lines[i + 1:i + 40])[:SECTION_EXCERPT_CHARS]
+                candidates.append({"page": page_no, "text": text, "size": size, "bold": bold, "excerpt": excerpt})
+    return dict(sizes), candidates
+
+
+def _clean_title(title: str) -> str:
+    return _NUMBERING.sub("", title).strip(" .:-\t") or title.strip()
+
+
+def _keep_section(title: str) -> bool:
+    return bool(title) and _normalize(title) not in _FRONT_MATTER
+
+
+async def _outline_sections(file_path: str, page_count: int) -> Optional[list[dict]]:
+    """Sections from the pdf outline, at the shallowest level that has enough entries."""
+    toc = await asyncio.to_thread(_outline, file_path)
+    for level in (1, 2):
+        entries = [(title.strip(), page - 1) for lvl, title, page in toc if lvl == level and 0 < page <= page_count]
+        entries = [(title, page) for title, page in entries if _keep_section(_clean_title(title))]
+        if len(entries) >= PARSE_MIN_SECTIONS:
             break
-        text = page.get_text().strip()
-        if text:
-            text_chunks.append(text)
+    else:
+        return None
+    excerpts = await asyncio.get_running_loop().run_in_executor(_get_pool(), _section_excerpts, file_path, entries)
+    return [{"topic": _clean_title(title), "content": excerpt} for (title, _), excerpt in zip(entries, excerpts)]
 
-    doc.close()
-    full_text = "\n\n".join(text_chunks)
 
-    if not full_text:
-        return []
+async def _heading_sections(file_path: str, page_count: int) -> Optional[list[dict]]:
+    """Sections from heading lines: the largest font size used for at least PARSE_MIN_SECTIONS headings, else bold lines."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    results = await asyncio.gather(*[
+        loop.run_in_executor(pool, _heading_candidates, file_path, start, start + PARSE_PAGES_PER_TASK)
+        for start in range(0, page_count, PARSE_PAGES_PER_TASK)
+    ])
+    sizes: Counter = Counter()
+    candidates = []
+    for range_sizes, range_candidates in results:
+        sizes.update(range_sizes)
+        candidates.extend(range_candidates)
+    if not sizes:
+        return None
+    body = max(sizes, key=sizes.get)
+
+    repeats = Counter(_normalize(c["text"]) for c in candidates)
+    candidates = [
+        c for c in candidates
+        if repeats[_normalize(c["text"])] <= MAX_HEADING_REPEATS and _keep_section(_clean_title(c["text"]))
+    ]
+    by_size = Counter(c["size"] for c in candidates if c["size"] >= body * HEADING_SIZE_RATIO)
+    level = next((size for size in sorted(by_size, reverse=True) if by_size[size] >= PARSE_MIN_SECTIONS), None)
+    if level is not None:
+        headings = [c for c in candidates if c["size"] == level]
+    else:
+        headings = [c for c in candidates if c["bold"] and c["size"] < body * HEADING_SIZE_RATIO]
+    if len(headings) < PARSE_MIN_SECTIONS:
+        return None
+    return [{"topic": _clean_title(c["text"]), "content": c["excerpt"]} for c in headings]
 
-    prompt = (
+
+def _cleanup_prompt(sections: list[dict]) -> str:
+    listing = "\n\n".join(f"{i + 1}. {s['topic']}\nExcerpt: {s['content']}" for i, s in enumerate(sections))
+    return (
+        "You are an academic content parser.\n"
+        "Below are section headings taken from the outline of a syllabus or textbook, each with an excerpt of its text.\n"
+        "Turn them into a list of academic topics: give each a clean topic name (no numbering such as 'Chapter 3') "
+        "and a short syllabus-style description based on its excerpt. Skip front and back matter "
+        "(contents, preface, exercises, index, references) and merge near-duplicate headings.\n"
+        "Return only a valid JSON object in this format:\n"
+        '{"topics": [{"topic": "Docker", "content": "A platform used for containerizing applications and managing their deployment."}, ...]}\n\n'
+        f"{listing}"
+    )
+
+
+async def _cleanup_sections(sections: list[dict], llm_config: BackendLLMConfig, on_progress: Optional[ProgressCallback]) -> list[dict]:
+    """Batches the sections into a few small llm calls; batches the llm can't handle keep their raw headings."""
+    batches, batch, batch_tokens = [], [], 0
+    for section in sections:
+        tokens = estimate_tokens(section["topic"]) + estimate_tokens(section["content"])
+        if batch and batch_tokens + tokens > PARSE_CHUNK_TOKENS:
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(section)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+
+    slots = asyncio.Semaphore(PARSE_LLM_CONCURRENCY)
+    done = 0
+
+    async def run(index: int, batch: list[dict]) -> list:
+        nonlocal done
+        async with slots:
+            cleaned = await _extract_chunk_topics(index, _cleanup_prompt(batch), llm_config, prompt_ready=True)
+        done += 1
+        if on_progress:
+            await on_progress(0.5 + 0.5 * done / len(batches))
+        if cleaned and all(isinstance(entry, dict) for entry in cleaned):
+            return cleaned
+        return [{"topic": s["topic"], "content": s["content"][:300]} for s in batch]
+
+    return merge_topics(await asyncio.gather(*[run(i, b) for i, b in enumerate(batches)]))
+
+
+# --- per-chunk llm extraction ---
+
+def clean_llm_json(raw: str) -> str:
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = re.sub(r"^```[a-zA-Z]*\n?", "", raw)
+        raw = re.sub(r"\n?```$", "", raw)
+    return raw.strip()
+
+
+def _chunk_prompt(text: str) -> str:
+    return (
         "You are an academic content parser.\n"
         "Extract a list of major academic topics from the following text. For each topic, include a short summary or syllabus-style description.\n"
         "The topics should be suitable for a university syllabus or textbook.\n"
-        "Return only valid JSON in this format:\n"
-        '[{"topic": "Docker", "content": "A platform used for containerizing applications and managing their deployment."}, ...]\n'
-        "If no topics are found, return an empty list.\n\n"
-        f"{full_text}"
+        "Return only a valid JSON object in this format:\n"
+        '{"topics": [{"topic": "Docker", "content": "A platform used for containerizing applications and managing their deployment."}, ...]}\n'
+        'If no topics are found, return {"topics": []}.\n\n'
+        f"{text}"
     )
 
 
+def _output_budget(prompt: str) -> int:
+    return min(PARSE_MAX_OUTPUT_TOKENS, max(MIN_OUTPUT_TOKENS, int(estimate_tokens(prompt) * OUTPUT_TOKENS_RATIO)))
 
+
+def _parse_topics(index: int, raw: str) -> list:
+    """The chunk's {topic, content} entries; [] (and a log line) when the output is unusable."""
+    try:
+        parsed = json.loads(raw)
+    except json.JSONDecodeError as e:
+        # usually the output hit max_tokens; half a json array is not a topic list
+        logger.warning(f"[parser] chunk {index}: LLM did not return valid JSON ({e}), dropping it: {raw[-80:]!r}")
+        return []
+    if isinstance(parsed, dict):
+        parsed = parsed.get("topics")
+    if isinstance(parsed, list) and all(isinstance(x, dict) and "topic" in x and "content" in x for x in parsed):
+        return parsed
+    logger.warning(f"[parser] chunk {index}: LLM JSON is not a topic list, dropping it")
+    return []
+
+
+async def _extract_chunk_topics(index: int, text: str, llm_config: BackendLLMConfig, prompt_ready: bool = False) -> list:
+    prompt = text if prompt_ready else _chunk_prompt(text)
     try:
-        raw = clean_llm_json(await _call_llm(prompt, llm_config))
-        if raw.startswith("```"):
-            import re
-            raw = re.sub(r"^```[a-zA-Z]*\n?", "", raw).strip()
-            raw = re.sub(r"\n?```$", "", raw).strip()
-
-
-        try:
-            parsed = json.loads(raw)
-            if isinstance(parsed, list) and all("topic" in x and "content" in x for x in parsed):
-                return parsed
-        except json.JSONDecodeError:
-            print("⚠️ LLM did not return valid JSON, fallback to topic list")
-            
-            # fallback: split on line or commas
-            lines = raw.split("\n")
-            candidates = [l.strip() for l in lines if l.strip()]
-            if len(candidates) < 3:
-                candidates = [x.strip() for x in raw.split(",") if x.strip()]
-
-            return candidates
+        raw = await _call_llm(prompt, llm_config, max_tokens=_output_budget(prompt), json_mode=True, call_type="parse")
     except Exception as e:
-        print("❌ Error in parse_pdf_topics:", e)
+        logger.error(f"[parser] chunk {index} failed: {e}")
+        return []
+    return _parse_topics(index, clean_llm_json(raw))
+
+
+# --- reduce ---
+
+def _normalize(name: str) -> str:
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", name.casefold())).strip()
 
-    return []
 
+def merge_topics(partials: list[list]) -> list:
+    """Concatenates per-chunk topic lists in order, merging entries whose names normalize the same."""
+    merged: dict[str, dict | str] = {}
+    for partial in partials:
+        for entry in partial:
+            name = entry["topic"] if isinstance(entry, dict) else entry
+            if not isinstance(name, str) or not _normalize(name):
+                continue
+            key = _normalize(name)
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = {"topic": name.strip(), "content": str(entry.get("content") or "").strip()} if isinstance(entry, dict) else name.strip()
+            elif isinstance(entry, dict) and isinstance(existing, dict):
+                content = str(entry.get("content") or "").strip()
+                if content and content not in existing["content"]:
+                    existing["content"] = (f"{existing['content']} {content}".strip())[:MAX_CONTENT_CHARS]
+            elif isinstance(entry, dict):
+                # a structured entry beats a bare topic name
+                merged[key] = {"topic": name.strip(), "content": str(entry.get("content") or "").strip()}
+    return list(merged.values())
+
+
+async def _map_reduce_topics(file_path: str, page_count: int, llm_config: BackendLLMConfig, on_progress: Optional[ProgressCallback]) -> list:
+    slots = asyncio.Semaphore(PARSE_LLM_CONCURRENCY)
+    tasks: list[asyncio.Task] = []
+    pages_done = 0
+
+    async def submit(text: str):
+        # backpressure: stop extracting until an llm slot frees up
+        await slots.acquire()
+        index = len(tasks)
+
+        async def run():
+            try:
+                return await _extract_chunk_topics(index, text, llm_config)
+            finally:
+                slots.release()
+
+        tasks.append(asyncio.create_task(run()))
+
+    try:
+        chunk: list[str] = []
+        chunk_tokens = 0
+        async for pages in _iter_page_ranges(file_path, page_count):
+            for text in pages:
+                pages_done += 1
+                tokens = estimate_tokens(text)
+                if not tokens:
+                    continue
+                if chunk and chunk_tokens + tokens > PARSE_CHUNK_TOKENS:
+                    await submit("\n\n".join(chunk))
+                    chunk, chunk_tokens = [], 0
+                chunk.append(text)
+                chunk_tokens += tokens
+            if on_progress:
+                await on_progress(0.5 * pages_done / page_count)
+        if chunk:
+            await submit("\n\n".join(chunk))
+
+        partials = []
+        for i, task in enumerate(tasks):
+            partials.append(await task)
+            if on_progress:
+                await on_progress(0.5 + 0.5 * (i + 1) / len(tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    topics = merge_topics(partials)
+    logger.info(f"[parser] {page_count} pages -> {len(tasks)} chunks -> {len(topics)} topics")
+    return topics
+
+
+async def parse_pdf_topics(
+    file_path: str,
+    llm_config: dict,
+    on_progress: Optional[ProgressCallback] = None,
+    structured: Optional[bool] = None
+) -> list:
+    """extract topics from a syllabus or textbook PDF, from its structure when it has one, else from the text using the LLM"""
+    # Convert dict to BackendLLMConfig if needed
+    if isinstance(llm_config, dict):
+        llm_config = BackendLLMConfig(**llm_config)
+    structured = PARSE_STRUCTURED if structured is None else structured
+
+    try:
+        page_count = await asyncio.to_thread(_page_count, file_path)
+    except Exception as e:
+        logger.error(f"[parser] could not open PDF: {e}")
+        return []
+    if page_count > PARSE_MAX_PAGES:
+        logger.warning(f"[parser] PDF has {page_count} pages, only the first {PARSE_MAX_PAGES} are parsed")
+        page_count = PARSE_MAX_PAGES
+
+    try:
+        if structured:
+            for source, find_sections in (("outline", _outline_sections), ("headings", _heading_sections)):
+                sections = await find_sections(file_path, page_count)
+                if sections:
+                    parse_stats[source] += 1
+                    if on_progress:
+                        await on_progress(0.5)
+                    topics = await _cleanup_sections(sections, llm_config, on_progress)
+                    logger.info(f"[parser] {page_count} pages -> {len(sections)} {source} sections -> {len(topics)} topics")
+                    return topics
+        parse_stats["text"] += 1
+        return await _map_reduce_topics(file_path, page_count, llm_config, on_progress)
+    except Exception as e:
+        logger.error(f"[parser] error in parse_pdf_topics: {e}")
+        return []
@@ -0,0 +1,126 @@
+"""
+provider-side prompt caching.
+
+- prompts are sent as a static prefix (system prompt, instructions, syllabus, notes)
+  followed by the per-request part, so providers can reuse the prefix
+- openai caches long shared prefixes automatically; nothing to manage
+- gemini: explicit cachedContents handles for long prefixes, created once per
+  (key, model, system prompt, prefix) and reused until they expire
+- ollama: keep_alive keeps the model (and its kv cache of the last prefix) loaded
+- prompt / cached token counts from provider usage fields, for /metrics
+"""
+
+import os
+import time
+import hashlib
+import logging
+from typing import Optional
+
+import httpx
+from cachetools import TTLCache
+
+from services.context_builder import estimate_tokens
+from services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# gemini rejects cachedContents below a model-specific minimum, so only try for long prefixes
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+# after a failed create, don't retry the same prefix for this long
+GEMINI_CACHE_RETRY_AFTER = 600
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+gemini_cache_flight = SingleFlight("gemini_cached_content")
+
+
+class PromptUsage:
+    def __init__(self):
+        self.counters: dict[tuple[str, str], dict[str, int]] = {}
+
+    def record(self, provider: str, model: str, prompt_tokens: Optional[int], cached_tokens: Optional[int]):
+        if prompt_tokens is None:
+            return
+        counters = self.counters.setdefault((provider, model), {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        counters["calls"] += 1
+        counters["prompt_tokens"] += prompt_tokens
+        counters["cached_tokens"] += cached_tokens or 0
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "provider": provider,
+                "model": model,
+                **c,
+                "cached_ratio": round(c["cached_tokens"] / c["prompt_tokens"], 3) if c["prompt_tokens"] else 0.0,
+            }
+            for (provider, model), c in self.counters.items()
+        ]
+
+
+prompt_usage = PromptUsage()
+
+
+class GeminiCachedContents:
+    def __init__(self):
+        # key -> (cachedContents name or None after a failure, valid until)
+        self.handles: TTLCache = TTLCache(maxsize=1000, ttl=GEMINI_CACHE_TTL)
+        self.counters = {"created": 0, "reused": 0, "create_errors": 0, "rejected": 0, "too_short": 0}
+
+    @staticmethod
+    def _key(api_key: str, model: str, system_text: str, prefix: str) -> str:
+        raw = "\x00".join([api_key, model, system_text, prefix])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def handle(self, client: httpx.AsyncClient, api_key: str, model: str, system_text: str, prefix: str) -> Optional[str]:
+        """Returns a cachedContents name holding system_text + prefix, or None to send the prompt inline."""
+        if not prefix or estimate_tokens(system_text + prefix) < GEMINI_CACHE_MIN_TOKENS:
+            self.counters["too_short"] += 1
+            return None
+        key = self._key(api_key, model, system_text, prefix)
+        entry = self.handles.get(key)
+        # leave a minute of slack so a handle doesn't expire between lookup and use
+        if entry is not None and entry[1] - 60 > time.time():
+            if entry[0] is not None:
+                self.counters["reused"] += 1
+            return entry[0]
+        return await gemini_cache_flight.do(key, lambda: self._create(client, key, api_key, model, system_text, prefix))
+
+    async def _create(self, client: httpx.AsyncClient, key: str, api_key: str, model: str, system_text: str, prefix: str) -> Optional[str]:
+        body = {
+            "model": f"models/{model}",
+            "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+            "ttl": f"{GEMINI_CACHE_TTL}s",
+        }
+        if system_text:
+            body["systemInstruction"] = {"parts": [{"text": system_text}]}
+        try:
+            response = await client.post("/cachedContents", params={"key": api_key}, json=body)
+            response.raise_for_status()
+            name = response.json()["name"]
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            logger.warning(f"[prompt_cache] gemini cachedContents create failed, sending prompt inline: {e}")
+            self.counters["create_errors"] += 1
+            self.handles[key] = (None, time.time() + GEMINI_CACHE_RETRY_AFTER)
+            return None
+        self.counters["created"] += 1
+        self.handles[key] = (name, time.time() + GEMINI_CACHE_TTL)
+        return name
+
+    def forget(self, name: str):
+        """Drops a handle the provider no longer accepts (expired or deleted early)."""
+        for key, (handle, _) in list(self.handles.items()):
+            if handle == name:
+                del self.handles[key]
+        self.counters["rejected"] += 1
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {**self.counters, "live_handles": sum(1 for name, until in self.handles.values() if name and until > now)}
+
+
+gemini_cached_contents = GeminiCachedContents()
+
+
+def prompt_cache_stats() -> dict:
+    return {"usage": prompt_usage.stats(), "gemini_cached_contents": gemini_cached_contents.stats(), "ollama_keep_alive": OLLAMA_KEEP_ALIVE}
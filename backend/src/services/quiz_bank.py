@@ -0,0 +1,232 @@
+"""
+pre-generated quiz question bank.
+
+- stores validated QuizQuestion objects per (normalized topic, difficulty) in postgres
+- questions from the load-test mock provider go to a separate "mock:" bank, never
+  served to users of real providers
+- /quiz serves from the bank, skipping questions the user has already seen
+- a background worker refills a (topic, difficulty) to a low-water mark,
+  asking the llm for several questions per call (generate_quiz_batch)
+- if the bank is empty for a user the request waits for one refill
+"""
+
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+
+from db import SessionLocal
+from db_models import QuizBankQuestion, QuizBankSeen
+from models import BackendLLMConfig
+from services.llm import generate_quiz_batch, LLMProviderError
+from services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+QUIZ_BANK_LOW_WATER = int(os.getenv("QUIZ_BANK_LOW_WATER", "3"))
+QUIZ_BANK_BATCH_SIZE = int(os.getenv("QUIZ_BANK_BATCH_SIZE", "5"))
+QUIZ_BANK_WORKERS = int(os.getenv("QUIZ_BANK_WORKERS", "2"))
+QUIZ_BANK_QUEUE_SIZE = int(os.getenv("QUIZ_BANK_QUEUE_SIZE", "100"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+refill_flight = SingleFlight("quiz_bank_refill")
+
+
+def normalize_topic(topic: str) -> str:
+    """'  Linear  Algebra!' -> 'linear algebra' so near-identical topics share a bank"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", topic.casefold())).strip()
+
+
+def bank_key(topic: str, llm_config: Optional[BackendLLMConfig]) -> str:
+    """normalize_topic, namespaced for the mock provider (normalized topics never contain ':')"""
+    topic_key = normalize_topic(topic)
+    if llm_config is not None and llm_config.provider == "mock":
+        return f"mock:{topic_key}"
+    return topic_key
+
+
+def _question_hash(question: dict) -> str:
+    options = sorted(_WHITESPACE.sub(" ", opt["text"].casefold()).strip() for opt in question["options"])
+    text = _WHITESPACE.sub(" ", question["question"].casefold()).strip()
+    return hashlib.sha256(json.dumps([text, options]).encode("utf-8")).hexdigest()
+
+
+# --- db helpers (blocking, called via asyncio.to_thread) ---
+
+def _unseen_query(username: str, topic_key: str, difficulty: str):
+    seen = select(QuizBankSeen.question_id).where(QuizBankSeen.username == username)
+    return (
+        select(QuizBankQuestion)
+        .where(QuizBankQuestion.topic_key == topic_key, QuizBankQuestion.difficulty == difficulty)
+        .where(QuizBankQuestion.id.not_in(seen))
+    )
+
+
+def _take_unseen(username: str, topic_key: str, difficulty: str) -> tuple[Optional[dict], int]:
+    """Claims the oldest unseen question for this user. Returns (question, unseen questions left)."""
+    db = SessionLocal()
+    try:
+        for _ in range(3):
+            query = _unseen_query(username, topic_key, difficulty)
+            row = db.execute(query.order_by(QuizBankQuestion.id).limit(1)).scalar_one_or_none()
+            if row is None:
+                return None, 0
+            remaining = db.execute(select(func.count()).select_from(query.subquery())).scalar_one() - 1
+            db.add(QuizBankSeen(username=username, question_id=row.id))
+            try:
+                db.commit()
+            except IntegrityError:
+                # a concurrent request for the same user claimed it first
+                db.rollback()
+                continue
+            return {**json.loads(row.payload), "id": row.id}, remaining
+        return None, 0
+    finally:
+        db.close()
+
+
+def _store(topic_key: str, difficulty: str, questions: list[dict]) -> int:
+    """Inserts new questions, skipping ones already in the bank. Returns how many were added."""
+    db = SessionLocal()
+    added = 0
+    try:
+        for question in questions:
+            row = QuizBankQuestion(
+                topic_key=topic_key,
+                difficulty=difficulty,
+                question_hash=_question_hash(question),
+                payload=json.dumps(question),
+            )
+            db.add(row)
+            try:
+                db.commit()
+                added += 1
+            except IntegrityError:
+                db.rollback()
+        return added
+    finally:
+        db.close()
+
+
+def _stock_levels() -> list[dict]:
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(QuizBankQuestion.topic_key, QuizBankQuestion.difficulty, func.count())
+            .group_by(QuizBankQuestion.topic_key, QuizBankQuestion.difficulty)
+        ).all()
+        return [{"topic": t, "difficulty": d, "questions": n} for t, d, n in rows]
+    finally:
+        db.close()
+
+
+# --- refill worker ---
+
+class QuizBankRefiller:
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: list[asyncio.Task] = []
+        self.pending: set[tuple[str, str]] = set()
+        self.counters = {"refills": 0, "questions_added": 0, "refill_errors": 0, "dropped_requests": 0}
+
+    def start(self):
+        if self.workers:
+            return
+        self.queue = asyncio.Queue(maxsize=QUIZ_BANK_QUEUE_SIZE)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(QUIZ_BANK_WORKERS)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def request(self, topic: str, difficulty: str, llm_config: BackendLLMConfig):
+        """Queues a background refill unless one is already pending for this (topic, difficulty)."""
+        key = (bank_key(topic, llm_config), difficulty)
+        if key in self.pending or self.queue is None:
+            return
+        try:
+            self.queue.put_nowait((topic, difficulty, llm_config))
+            self.pending.add(key)
+        except asyncio.QueueFull:
+            self.counters["dropped_requests"] += 1
+
+    async def _worker(self):
+        while True:
+            topic, difficulty, llm_config = await self.queue.get()
+            try:
+                await refill(topic, difficulty, llm_config)
+            except Exception as e:
+                logger.error(f"[quiz_bank] background refill failed for {topic!r}/{difficulty}: {e}")
+            finally:
+                self.pending.discard((bank_key(topic, llm_config), difficulty))
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "pending": len(self.pending),
+            "low_water": QUIZ_BANK_LOW_WATER,
+            "batch_size": QUIZ_BANK_BATCH_SIZE,
+        }
+
+
+refiller = QuizBankRefiller()
+
+
+async def refill(topic: str, difficulty: str, llm_config: BackendLLMConfig) -> int:
+    """Generates one batch for (topic, difficulty) and stores it. Concurrent refills of the same key share one call."""
+    topic_key = bank_key(topic, llm_config)
+
+    async def run():
+        try:
+            questions = await generate_quiz_batch(topic, difficulty, QUIZ_BANK_BATCH_SIZE, llm_config)
+        except LLMProviderError:
+            refiller.counters["refill_errors"] += 1
+            raise
+        added = await asyncio.to_thread(_store, topic_key, difficulty, questions)
+        refiller.counters["refills"] += 1
+        refiller.counters["questions_added"] += added
+        logger.info(f"[quiz_bank] refilled {topic_key!r}/{difficulty}: +{added}")
+        return added
+
+    return await refill_flight.do((topic_key, difficulty), run)
+
+
+async def next_question(username: str, topic: str, difficulty: str, llm_config: BackendLLMConfig) -> dict:
+    """
+    Serves an unseen question for this user from the bank, refilling synchronously only if the
+    bank has nothing left for them, and in the background once they drop below the low-water mark.
+    """
+    if not topic.strip():
+        raise ValueError("Topic cannot be empty for quiz generation.")
+    topic_key = bank_key(topic, llm_config)
+
+    question, remaining = await asyncio.to_thread(_take_unseen, username, topic_key, difficulty)
+    if question is None:
+        await refill(topic, difficulty, llm_config)
+        question, remaining = await asyncio.to_thread(_take_unseen, username, topic_key, difficulty)
+        if question is None:
+            raise LLMProviderError("Failed to generate valid quiz: no new questions available for this topic.")
+
+    if remaining < QUIZ_BANK_LOW_WATER:
+        refiller.request(topic, difficulty, llm_config)
+    return question
+
+
+def quiz_bank_stats() -> dict:
+    try:
+        stock = _stock_levels()
+    except Exception as e:
+        stock = {"error": str(e)}
+    return {**refiller.stats(), "stock": stock}
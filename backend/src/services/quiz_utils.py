@@ -1,108 +1,186 @@
-import json
+import os
+import uuid
+import asyncio
 import logging
 from pathlib import Path
 from cachetools import TTLCache
 from typing import Optional
 from services.llm import llm_judge_score, _call_llm, BackendLLMConfig, LLMProviderError
-from services.tracker import get_user_context
+from services.user_context import user_context_cache
+from services.context_builder import build_context_segments
 from services.event_logger import log_user_event
+from services.jobs import job_queue, JobContext
 from pathway_flow.stream import stream_topic_event
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 cache = TTLCache(maxsize=1000, ttl=3600)
 
+# --- Background LLM feedback jobs (polled via /quiz/feedback/{job_id}) ---
+# stored in the shared jobs table, so any worker can answer the poll
+FEEDBACK_JOB_KIND = "quiz_feedback"
+FEEDBACK_JOB_RETENTION = int(os.getenv("FEEDBACK_JOB_RETENTION", "900"))
+FEEDBACK_STATUSES = {"queued": "pending", "running": "pending", "succeeded": "done", "failed": "error"}
+
+async def get_feedback_job(job_id: str) -> Optional[dict]:
+    job = await job_queue.get(job_id)
+    if job is None or job["kind"] != FEEDBACK_JOB_KIND:
+        return None
+    status = FEEDBACK_STATUSES[job["status"]]
+    if status == "error":
+        return {"status": status, "feedback": None, "detail": job["error"]}
+    return {"status": status, "feedback": (job["result"] or {}).get("feedback")}
+
+async def _generate_feedback(
+    username: str,
+    topic: str,
+    question_text: str,
+    user_answer_text: str,
+    correct_answer_text: str,
+    llm_config: Optional[BackendLLMConfig],
+    user_context: Optional[dict] = None
+) -> str:
+    if user_context is None:
+        user_context = await user_context_cache.get(username, topic)
+    static_context, dynamic_context = build_context_segments(user_context, topic, "feedback", question_text)
+    # most static first so providers can reuse the cached prefix across answers
+    feedback_prefix = (
+        "Explain why the user's answer is incorrect and why the correct answer is correct. "
+        "Use user context if helpful. Keep it concise (50-100 words).\n\n"
+        f"User context:\n{static_context or '[No context available]'}\n"
+    )
+    feedback_prompt = (
+        f"{dynamic_context}\n"
+        f"Topic: {topic}\n"
+        f"Question: {question_text}\n"
+        f"User's answer: {user_answer_text}\n"
+        f"Correct answer: {correct_answer_text}"
+    )
+    feedback = await _call_llm(feedback_prompt, llm_config=llm_config, temperature=0.7, max_tokens=200, call_type="feedback", prefix=feedback_prefix, username=username) # Use LLM Config for feedback
+    return feedback.strip()
+
+async def _feedback_job(ctx: JobContext, payload: dict) -> dict:
+    return {"feedback": await _generate_feedback(**payload)}
+
+job_queue.register(FEEDBACK_JOB_KIND, _feedback_job, retention_seconds=FEEDBACK_JOB_RETENTION)
+
+async def _start_feedback_job(**kwargs) -> str:
+    """Runs _generate_feedback in the background and returns a job id the client can poll."""
+    job, _ = await job_queue.spawn(FEEDBACK_JOB_KIND, kwargs["username"], uuid.uuid4().hex, kwargs)
+    return job["id"]
+
 async def evaluate_quiz_answer(
-    user_id: str,
+    username: str,
     topic: str,
     question_index: int,
     user_answer: str,
     question: dict,
     num_questions: int = 1,
     difficulty: str = "medium",
-    llm_config: Optional[BackendLLMConfig] = None
+    llm_config: Optional[BackendLLMConfig] = None,
+    detailed_feedback: bool = False
 ) -> dict:
     """
     Evaluate a single question's answer and return correctness + feedback.
     Also logs to Pathway for real-time adaptation.
+
+    MCQ answers (an option ID) are scored deterministically and answered immediately with the
+    question's pre-generated feedback; with detailed_feedback an LLM explanation is generated in
+    the background and exposed through feedback_job_id. Free-text answers are scored by the LLM judge.
     """
     correct_answer_id = question.get("correctAnswerId")
     options = question.get("options", [])
-    
+
     # Map correct answer ID to text for judging
     correct_answer_text = next((opt['text'] for opt in options if opt['id'] == correct_answer_id), None)
     user_answer_text = next((opt['text'] for opt in options if opt['id'] == user_answer), None)
 
     if correct_answer_id is None or not options or correct_answer_text is None:
         raise ValueError("Invalid question object: missing correct answer ID or options.")
-    if user_answer_text is None:
-        raise ValueError("User answer ID not found in options.")
+    if user_answer_text is None and not user_answer.strip():
+        raise ValueError("User answer cannot be empty.")
 
-    is_correct = (user_answer == correct_answer_id)
-    user_context = get_user_context(username=user_id, topic=topic)
-
-    # Use LLM to generate more nuanced feedback if needed, passing llm_config
-    feedback_prompt = (
-        f"Topic: {topic}\n"
-        f"Question: {question['question']}\n" # Use 'question' key from structured question
-        f"User's answer: {user_answer_text}\n"
-        f"Correct answer: {correct_answer_text}\n"
-        f"User context: {json.dumps(user_context, indent=2) or '[No context available]'}\n\n"
-        "Explain why the user's answer is incorrect and why the correct answer is correct. "
-        "Use user context if helpful. Keep it concise (50-100 words)."
-    )
-    
+    is_mcq = user_answer_text is not None
+    feedback_job_id = None
     try:
-        feedback = await _call_llm(feedback_prompt, llm_config=llm_config, temperature=0.7, max_tokens=200) # Use LLM Config for feedback
-        
-        score = await llm_judge_score(
-            question=question["question"], # Use 'question' key from structured question
-            correct_answer=correct_answer_text,
-            user_answer=user_answer_text,
-            context=user_context,
-            llm_config=llm_config
-        )
-        
-        # Log to Pathway for real-time adaptation
-        await stream_topic_event(user_id, topic, score)
-        # Log user event for quiz evaluation
-        log_user_event(user_id, "quiz_evaluate", topic, {
-            "question": question["question"],
-            "user_answer": user_answer_text,
-            "correct_answer": correct_answer_text,
-            "is_correct": is_correct,
-            "score": score,
-            "feedback": feedback.strip(),
-            "question_index": question_index,
-            "difficulty": difficulty
-        })
-
-        return {
-            "correct": is_correct,
-            "feedback": feedback.strip(),
-            "correct_answer": {
-                "id": correct_answer_id,
-                "text": correct_answer_text
-            },
-            "user_answer": {
-                "id": user_answer,
-                "text": user_answer_text
-            }
-        }
+        if is_mcq:
+            # Fast path: correctness is a comparison of option IDs, no LLM on the request path
+            is_correct = (user_answer == correct_answer_id)
+            score = 1.0 if is_correct else 0.0
+            prefix = "Correct! " if is_correct else f"The correct answer is {correct_answer_id}: {correct_answer_text}. "
+            feedback = prefix + (question.get("feedback") or "")
+            if detailed_feedback and not is_correct:
+                feedback_job_id = await _start_feedback_job(
+                    username=username,
+                    topic=topic,
+                    question_text=question["question"],
+                    user_answer_text=user_answer_text,
+                    correct_answer_text=correct_answer_text,
+                    llm_config=llm_config
+                )
+        else:
+            # Free-text answer: the LLM judge decides, feedback is generated alongside it
+            user_answer_text = user_answer.strip()
+            user_context = await user_context_cache.get(username, topic)
+            feedback, score = await asyncio.gather(
+                _generate_feedback(username, topic, question["question"], user_answer_text, correct_answer_text, llm_config, user_context),
+                llm_judge_score(
+                    question=question["question"], # Use 'question' key from structured question
+                    correct_answer=correct_answer_text,
+                    user_answer=user_answer_text,
+                    context=user_context,
+                    llm_config=llm_config,
+                    topic=topic,
+                    username=username
+                )
+            )
+            is_correct = score >= 0.5
     except LLMProviderError as e:
         logging.error(f"Feedback/Judging generation error: {str(e)}")
         # Provide a fallback feedback if LLM fails
         return {
-            "correct": is_correct,
+            "correct": False,
+            "score": None,
             "feedback": f"Could not generate detailed feedback. Error: {str(e)}",
             "correct_answer": {
                 "id": correct_answer_id,
                 "text": correct_answer_text
             },
             "user_answer": {
-                "id": user_answer,
+                "id": None,
                 "text": user_answer_text
             }
         }
     except Exception as e:
         logging.exception(f"Unexpected error in evaluate_quiz_answer: {e}")
         raise
+
+    # Log to Pathway for real-time adaptation
+    await stream_topic_event(username, topic, score)
+    # Log user event for quiz evaluation
+    log_user_event(username, "quiz_evaluate", topic, {
+        "question": question["question"],
+        "user_answer": user_answer_text,
+        "correct_answer": correct_answer_text,
+        "is_correct": is_correct,
+        "score": score,
+        "feedback": feedback,
+        "question_index": question_index,
+        "difficulty": difficulty
+    })
+
+    result = {
+        "correct": is_correct,
+        "score": score,
+        "feedback": feedback,
+        "correct_answer": {
+            "id": correct_answer_id,
+            "text": correct_answer_text
+        },
+        "user_answer": {
+            "id": user_answer if is_mcq else None,
+            "text": user_answer_text
+        }
+    }
+    if feedback_job_id:
+        result["feedback_job_id"] = feedback_job_id
+    return result
@@ -0,0 +1,55 @@
+"""
+in-flight request coalescing ("single flight").
+
+- concurrent calls with the same key share one underlying coroutine
+- the shared work runs as its own task, so a caller disconnecting
+  does not cancel the result for everyone else waiting on it
+- counts calls, executions and coalesced waiters for /metrics
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+_groups: list["SingleFlight"] = []
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+        _groups.append(self)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Runs fn() once per key at a time; concurrent callers with the same key await the same result."""
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executed += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+def singleflight_stats() -> dict:
+    return {group.name: group.stats() for group in _groups}
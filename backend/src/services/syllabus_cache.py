@@ -0,0 +1,144 @@
+"""
+content-addressed cache of parsed syllabus pdfs.
+
+- students of the same course upload the same pdf; the parsed topic list is stored
+  once per (file sha256, extraction config hash) and reused across users, so only the
+  per-user steps (topics rows, user_syllabus, content events) run again
+- the file is hashed while the upload streams in (routes/syllabus.py)
+- eviction: entries unused for SYLLABUS_CACHE_TTL_DAYS are dropped, and beyond
+  SYLLABUS_CACHE_MAX_ENTRIES the least recently used ones go first
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from db import SessionLocal
+from db_models import SyllabusParseCache
+
+logger = logging.getLogger(__name__)
+
+SYLLABUS_CACHE_MAX_ENTRIES = int(os.getenv("SYLLABUS_CACHE_MAX_ENTRIES", "5000"))
+SYLLABUS_CACHE_TTL_DAYS = int(os.getenv("SYLLABUS_CACHE_TTL_DAYS", "90"))
+
+
+def config_hash(config: dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# --- db helpers (blocking, called via asyncio.to_thread) ---
+
+def _lookup(content_sha256: str, config_key: str) -> Optional[list]:
+    db = SessionLocal()
+    try:
+        entry = db.get(SyllabusParseCache, (content_sha256, config_key))
+        if entry is None:
+            return None
+        if entry.last_used_at < datetime.utcnow() - timedelta(days=SYLLABUS_CACHE_TTL_DAYS):
+            db.delete(entry)
+            db.commit()
+            return None
+        entry.hits += 1
+        entry.last_used_at = datetime.utcnow()
+        db.commit()
+        return json.loads(entry.topics)
+    finally:
+        db.close()
+
+
+def _store(content_sha256: str, config_key: str, topics: list) -> int:
+    """Inserts the entry and evicts expired / least recently used ones. Returns how many were evicted."""
+    payload = json.dumps(topics)
+    db = SessionLocal()
+    try:
+        db.add(SyllabusParseCache(
+            content_sha256=content_sha256,
+            config_hash=config_key,
+            topics=payload,
+            size_bytes=len(payload.encode("utf-8")),
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # parsed concurrently by another job, keep the first result
+            db.rollback()
+            return 0
+
+        evicted = (
+            db.query(SyllabusParseCache)
+            .filter(SyllabusParseCache.last_used_at < datetime.utcnow() - timedelta(days=SYLLABUS_CACHE_TTL_DAYS))
+            .delete(synchronize_session=False)
+        )
+        overflow = db.query(SyllabusParseCache).count() - SYLLABUS_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            oldest = (
+                db.query(SyllabusParseCache.content_sha256, SyllabusParseCache.config_hash)
+                .order_by(SyllabusParseCache.last_used_at)
+                .limit(overflow)
+                .all()
+            )
+            for sha, cfg in oldest:
+                db.query(SyllabusParseCache).filter_by(content_sha256=sha, config_hash=cfg).delete(synchronize_session=False)
+            evicted += len(oldest)
+        db.commit()
+        return evicted
+    finally:
+        db.close()
+
+
+def _usage() -> dict:
+    db = SessionLocal()
+    try:
+        entries = db.query(SyllabusParseCache).count()
+        size = sum(n for (n,) in db.query(SyllabusParseCache.size_bytes).all())
+        return {"entries": entries, "bytes": size}
+    finally:
+        db.close()
+
+
+class SyllabusCache:
+    def __init__(self):
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    async def get(self, content_sha256: str, config: dict) -> Optional[list]:
+        try:
+            topics = await asyncio.to_thread(_lookup, content_sha256, config_hash(config))
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.error(f"[syllabus_cache] lookup failed: {e}")
+            return None
+        self.counters["hits" if topics is not None else "misses"] += 1
+        return topics
+
+    async def set(self, content_sha256: str, config: dict, topics: list):
+        try:
+            evicted = await asyncio.to_thread(_store, content_sha256, config_hash(config), topics)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.error(f"[syllabus_cache] store failed: {e}")
+            return
+        self.counters["stores"] += 1
+        self.counters["evictions"] += evicted
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        try:
+            usage = _usage()
+        except Exception as e:
+            usage = {"error": str(e)}
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+            **usage,
+            "max_entries": SYLLABUS_CACHE_MAX_ENTRIES,
+            "ttl_days": SYLLABUS_CACHE_TTL_DAYS,
+        }
+
+
+syllabus_cache = SyllabusCache()
@@ -0,0 +1,102 @@
+"""
+syllabus ingestion, run as a background job (see services.jobs).
+
+- reuses the parsed topics of an identical pdf from the shared parse cache, otherwise
+  parses it (see services.parser) and caches the result
+- saves user_syllabus and adds the missing topics rows in one query + one commit
+- streams topic contents to the pathway jsonl feed
+- reports progress per stage; the temp file is removed when the job ends
+- a parse that yields no topics (usually an llm failure) fails the job and is not
+  cached, so uploading the same file again retries it
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+
+from sqlalchemy import select
+
+from db import AsyncSessionLocal
+from db_models import UserSyllabus, Topic, User
+from services.parser import parse_pdf_topics, parse_config
+from services.syllabus_cache import syllabus_cache
+from services.event_logger import log_user_event
+from services.topic_classifier import topic_classifier
+from services.user_context import user_context_cache
+from services.jobs import job_queue, JobContext
+from pathway_flow.stream import stream_content_event
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = "syllabus"
+
+
+def idempotency_key(username: str, file_sha256: str, llm_config: dict) -> str:
+    """Same user, same file, same model -> same job."""
+    return hashlib.sha256(json.dumps([JOB_KIND, username, file_sha256, llm_config["provider"], llm_config["model"]]).encode("utf-8")).hexdigest()
+
+
+def _topic_name(entry) -> str | None:
+    if isinstance(entry, dict) and "topic" in entry:
+        return entry["topic"]
+    return entry if isinstance(entry, str) else None
+
+
+async def _save_topics(username: str, topics: list) -> None:
+    """Stores the parsed syllabus and adds topics rows the user doesn't have yet."""
+    async with AsyncSessionLocal() as db:
+        existing = (await db.execute(select(UserSyllabus).filter_by(username=username))).scalars().first()
+        if existing:
+            existing.topics_text = json.dumps(topics)
+        else:
+            db.add(UserSyllabus(username=username, topics_text=json.dumps(topics)))
+
+        if (await db.execute(select(User.id).filter(User.username == username))).first():
+            known = set(await db.scalars(select(Topic.topic_name).filter_by(username=username)))
+            for entry in topics:
+                topic_name = _topic_name(entry)
+                if topic_name and topic_name not in known:
+                    known.add(topic_name)
+                    db.add(Topic(username=username, topic_name=topic_name))
+        await db.commit()
+
+
+async def ingest_syllabus(ctx: JobContext, payload: dict) -> dict:
+    username = payload["username"]
+    config = parse_config(payload["llm_config"])
+    try:
+        topics = await syllabus_cache.get(payload["file_sha256"], config)
+        if topics is None:
+            await ctx.progress(0.05, "parsing")
+
+            async def on_progress(fraction: float):
+                await ctx.progress(0.05 + 0.65 * fraction, "parsing")
+
+            topics = await parse_pdf_topics(payload["path"], payload["llm_config"], on_progress)
+            # an empty list usually means the llm failed, let the next upload retry
+            if topics:
+                await syllabus_cache.set(payload["file_sha256"], config, topics)
+    finally:
+        os.remove(payload["path"])
+    if not topics:
+        raise ValueError("no topics could be parsed from the syllabus, please upload it again")
+
+    await ctx.progress(0.7, "saving")
+    await _save_topics(username, topics)
+    topic_classifier.invalidate(username)
+    user_context_cache.invalidate(username)
+    await asyncio.to_thread(log_user_event, username, "syllabus_uploaded", None, {"topics": topics})
+
+    # stream all topics and content to Pathway
+    contents = [t for t in topics if isinstance(t, dict) and "topic" in t and "content" in t]
+    for i, t in enumerate(contents):
+        await stream_content_event(username, t["topic"], t["content"])
+        if i % 10 == 0:
+            await ctx.progress(0.8 + 0.2 * i / len(contents), "indexing")
+
+    return {"topics": topics}
+
+
+job_queue.register(JOB_KIND, ingest_syllabus)
@@ -0,0 +1,192 @@
+"""
+local topic detection against the user's own syllabus.
+
+- per-user in-memory tf-idf index over syllabus topic names + descriptions
+  (user_syllabus.topics_text) and the user's saved topics (topics table)
+- features are word unigrams plus character 3-5 grams, so "eigenvector" still
+  matches a syllabus entry for "Eigenvalues and Eigenvectors"
+- the question is matched by cosine similarity; above TOPIC_CLASSIFIER_THRESHOLD
+  the syllabus topic is used and the detect_topic llm call is skipped
+- n-grams alone let substrings through ("dynamics" scores high against
+  "Thermodynamics"), so a topic is only a candidate if it shares a whole word
+  (plural-insensitive) with the question
+- with fewer than TOPIC_CLASSIFIER_MIN_TOPICS topics the idf is nearly flat and scores
+  say little, so such indexes never replace the llm
+- indexes are rebuilt after TOPIC_INDEX_TTL or when the syllabus/topics change
+- llm_calls_avoided only counts matches that replaced a detect_topic call; matches
+  used only for context (the fused explain call detects the topic itself) are
+  counted as context_matches
+"""
+
+import os
+import re
+import json
+import math
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from cachetools import TTLCache
+
+from db import SessionLocal
+from db_models import UserSyllabus, Topic
+
+logger = logging.getLogger(__name__)
+
+TOPIC_CLASSIFIER_THRESHOLD = float(os.getenv("TOPIC_CLASSIFIER_THRESHOLD", "0.25"))
+TOPIC_CLASSIFIER_MIN_TOPICS = int(os.getenv("TOPIC_CLASSIFIER_MIN_TOPICS", "3"))
+TOPIC_INDEX_TTL = int(os.getenv("TOPIC_INDEX_TTL", "600"))
+# topic names say more about a topic than its description does
+NAME_WEIGHT = 2.0
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "the", "of", "and", "or", "to", "in", "on", "for", "with", "is", "are", "was", "be",
+    "what", "how", "why", "when", "which", "does", "do", "can", "explain", "describe", "define", "me", "i",
+}
+
+
+@dataclass
+class TopicMatch:
+    topic: str
+    confidence: float
+
+
+def _words(text: str) -> list[str]:
+    return [w for w in _WORD.findall(text.casefold()) if w not in _STOPWORDS]
+
+
+def _stem(word: str) -> str:
+    # just enough that "eigenvector" meets "Eigenvectors" and "matrix" meets "matrices"
+    if len(word) > 4 and word.endswith("ices"):
+        return word[:-4] + "ix"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _stems(text: str) -> set[str]:
+    return {_stem(w) for w in _words(text)}
+
+
+def _features(text: str) -> Counter:
+    words = _words(text)
+    features = Counter(f"w:{w}" for w in words)
+    for word in words:
+        padded = f" {word} "
+        for n in (3, 4, 5):
+            features.update(f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+    return features
+
+
+class TopicIndex:
+    def __init__(self, topics: list[tuple[str, str]]):
+        """topics: (name, description) pairs"""
+        self.names = [name for name, _ in topics]
+        self.stems = [_stems(f"{name} {description}") for name, description in topics]
+        docs = []
+        for name, description in topics:
+            features = _features(description)
+            for feature, count in _features(name).items():
+                features[feature] += count * NAME_WEIGHT
+            docs.append(features)
+        df = Counter(feature for doc in docs for feature in doc)
+        n = len(docs)
+        self.idf = {feature: math.log((1 + n) / (1 + count)) + 1 for feature, count in df.items()}
+        self.vectors = [self._weigh(doc) for doc in docs]
+
+    def _weigh(self, features: Counter) -> dict[str, float]:
+        vector = {f: (1 + math.log(c)) * self.idf[f] for f, c in features.items() if f in self.idf}
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {f: v / norm for f, v in vector.items()} if norm else {}
+
+    def best(self, question: str) -> Optional[TopicMatch]:
+        """The most similar topic among those sharing at least one word with the question."""
+        query = self._weigh(_features(question))
+        if not query:
+            return None
+        query_stems = _stems(question)
+        best_score, best_name = 0.0, None
+        for name, stems, vector in zip(self.names, self.stems, self.vectors):
+            if not stems & query_stems:
+                continue
+            score = sum(weight * vector.get(feature, 0.0) for feature, weight in query.items())
+            if score > best_score:
+                best_score, best_name = score, name
+        return TopicMatch(best_name, round(best_score, 3)) if best_name else None
+
+
+def _load_topics(username: str) -> list[tuple[str, str]]:
+    """Blocking: syllabus entries and saved topic names for a user, deduplicated by name."""
+    db = SessionLocal()
+    try:
+        topics: dict[str, str] = {}
+        syllabus = db.query(UserSyllabus).filter_by(username=username).first()
+        if syllabus and syllabus.topics_text:
+            try:
+                entries = json.loads(syllabus.topics_text)
+            except json.JSONDecodeError:
+                entries = []
+            for entry in entries:
+                if isinstance(entry, dict) and entry.get("topic"):
+                    topics[entry["topic"]] = entry.get("content") or entry.get("description") or ""
+                elif isinstance(entry, str) and entry.strip():
+                    topics.setdefault(entry.strip(), "")
+        for (name,) in db.query(Topic.topic_name).filter_by(username=username).all():
+            topics.setdefault(name, "")
+        return list(topics.items())
+    finally:
+        db.close()
+
+
+class TopicClassifier:
+    def __init__(self):
+        self.indexes: TTLCache = TTLCache(maxsize=5000, ttl=TOPIC_INDEX_TTL)
+        self.counters = {"lookups": 0, "llm_calls_avoided": 0, "context_matches": 0, "below_threshold": 0, "no_syllabus": 0, "too_few_topics": 0, "index_builds": 0}
+
+    async def _index(self, username: str) -> Optional[TopicIndex]:
+        if username in self.indexes:
+            return self.indexes[username]
+        topics = await asyncio.to_thread(_load_topics, username)
+        index = TopicIndex(topics) if topics else None
+        self.indexes[username] = index
+        self.counters["index_builds"] += 1
+        return index
+
+    def invalidate(self, username: str):
+        """Call when the user's syllabus or saved topics change."""
+        self.indexes.pop(username, None)
+
+    async def classify(self, username: str, question: str, replaces_llm_call: bool = True) -> Optional[TopicMatch]:
+        """
+        Returns the best syllabus topic if it clears the confidence threshold, else None (use the llm).
+        Pass replaces_llm_call=False when no detect_topic call would be made without the match.
+        """
+        self.counters["lookups"] += 1
+        try:
+            index = await self._index(username)
+        except Exception as e:
+            logger.error(f"[topic_classifier] could not load topics for {username!r}: {e}")
+            return None
+        if index is None:
+            self.counters["no_syllabus"] += 1
+            return None
+        if len(index.names) < TOPIC_CLASSIFIER_MIN_TOPICS:
+            self.counters["too_few_topics"] += 1
+            return None
+        match = index.best(question)
+        if match is None or match.confidence < TOPIC_CLASSIFIER_THRESHOLD:
+            self.counters["below_threshold"] += 1
+            return None
+        self.counters["llm_calls_avoided" if replaces_llm_call else "context_matches"] += 1
+        return match
+
+    def stats(self) -> dict:
+        return {**self.counters, "threshold": TOPIC_CLASSIFIER_THRESHOLD, "min_topics": TOPIC_CLASSIFIER_MIN_TOPICS, "cached_indexes": len(self.indexes)}
+
+
+topic_classifier = TopicClassifier()
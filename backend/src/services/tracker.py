@@ -5,45 +5,61 @@
 - supports real-time tracking via pathway + persistent tracking via postgres
 """
 
-import asyncio
 import json
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, List
 from db_models import User
-from db import SessionLocal
+from sqlalchemy import select, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import SessionLocal, AsyncSessionLocal
 from db_models import UserTopicActivity, UserTopicNotes, UserQuizHistory
 from pathway_flow.stream import stream_topic_event
 from db_models import UserTopicActivity, UserTopicProgress, UserSyllabus
+from services.user_context import user_context_cache
 
 LATEST_KB = Path("data/latest_content.jsonl")
 TOPIC_ATTEMPTS = Path("data/topic_attempts.jsonl")
 TOPIC_MASTERY = Path("data/user_topic_progress.jsonl")
 
 # --- update topic progress (postgres + pathway) ---
+def _upsert_topic_stats(dialect: str, username: str, topic: str, score: float, now: datetime):
+    """One INSERT ... ON CONFLICT DO UPDATE: concurrent attempts can't overwrite each other."""
+    insert = pg_insert if dialect == "postgresql" else sqlite_insert
+    table = UserTopicActivity.__table__
+    stmt = insert(table).values(
+        username=username,
+        topic=topic,
+        attempt_count=1,
+        score_sum=score,
+        average_score=score,
+        last_attempt=now,
+        mastery_status=_infer_mastery(score),
+    )
+    # SET expressions see the row before the update
+    attempt_count = table.c.attempt_count + 1
+    score_sum = table.c.score_sum + stmt.excluded.score_sum
+    average_score = score_sum / attempt_count
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.username, table.c.topic],
+        set_={
+            "attempt_count": attempt_count,
+            "score_sum": score_sum,
+            "average_score": average_score,
+            "last_attempt": stmt.excluded.last_attempt,
+            "mastery_status": _mastery_case(average_score),
+        },
+    )
+
+
 async def update_topic_stats(username: str, topic: str, score: float, source: str = "quiz"):
-    """updates average score and mastery status, streams to pathway"""
-    def db_op():
-        db = SessionLocal()
-        entry = db.query(UserTopicActivity).filter_by(username=username, topic=topic).first()
-        if entry:
-            entry.average_score = (entry.average_score + score) / 2
-            entry.last_attempt = datetime.utcnow()
-            entry.mastery_status = _infer_mastery(entry.average_score)
-        else:
-            entry = UserTopicActivity(
-                username=username,
-                topic=topic,
-                average_score=score,
-                last_attempt=datetime.utcnow(),
-                mastery_status=_infer_mastery(score),
-            )
-            db.add(entry)
-        db.commit()
-        db.close()
-
-    await asyncio.to_thread(db_op)
-    await asyncio.to_thread(stream_topic_event, username, topic, score)
+    """adds the attempt to the running mean score and mastery status, streams to pathway"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(_upsert_topic_stats(db.bind.dialect.name, username, topic, score, datetime.utcnow()))
+        await db.commit()
+    user_context_cache.invalidate(username, topic)
+    await stream_topic_event(username, topic, score)
 
 # --- shortcut to log quiz/ask interaction ---
 async def log_topic_attempt(username: str, topic: str, score: float = 0.3, source: str = "ask"):
@@ -71,9 +87,8 @@ def get_user_progress(username: str):
 
 # --- suggest revision reminders ---
 async def get_due_reminders(username: str):
-    db = SessionLocal()
-    entries = db.query(UserTopicActivity).filter_by(username=username).all()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        entries = (await db.execute(select(UserTopicActivity).filter_by(username=username))).scalars().all()
     now = datetime.utcnow()
     reminders = []
     for e in entries:
@@ -87,13 +102,20 @@ async def get_due_reminders(username: str):
     return reminders
 
 # --- helper to classify score into mastery ---
+MASTERED_SCORE = 0.8
+IMPROVING_SCORE = 0.5
+
 def _infer_mastery(score: float) -> str:
-    if score >= 0.8:
+    if score >= MASTERED_SCORE:
         return "mastered"
-    elif score >= 0.5:
+    elif score >= IMPROVING_SCORE:
         return "improving"
     return "weak"
 
+def _mastery_case(score):
+    """_infer_mastery as a SQL expression, for the upsert."""
+    return case((score >= MASTERED_SCORE, "mastered"), (score >= IMPROVING_SCORE, "improving"), else_="weak")
+
 # --- fallback: read from streamed jsonl ---
 # def get_user_progress_from_pathway(user_id: str):
 #     db = SessionLocal()
@@ -117,54 +139,12 @@ def _infer_mastery(score: float) -> str:
 #     }
 
 # --- build full LLM context: notes + history + preferences ---
-def get_user_context(username: str, topic: str) -> dict:
+async def get_user_context(username: str, topic: str) -> dict:
     """
     Builds user context for LLM: notes, quiz history, preferences/progress, and syllabus topics.
-    Fetches all from the database using username and topic.
+    Served from the per-(username, topic) cache in services.user_context.
     """
-    db = SessionLocal()
-    context = {
-        "notes": "",
-        "quiz_history": [],
-        "preferences": {},
-        "syllabus_topics": []
-    }
-    try:
-        # Notes
-        note = db.query(UserTopicNotes).filter_by(username=username, topic=topic).order_by(UserTopicNotes.updated_at.desc()).first()
-        if note:
-            context["notes"] = note.notes or ""
-        # Quiz history (most recent 10)
-        quiz_rows = db.query(UserQuizHistory).filter_by(username=username, topic=topic).order_by(UserQuizHistory.timestamp.desc()).limit(10).all()
-        for q in quiz_rows:
-            context["quiz_history"].append({
-                "question": q.question,
-                "answer": q.answer,
-                "correct": q.correct,
-                "score": q.score,
-                "timestamp": q.timestamp.isoformat() if q.timestamp else None
-            })
-        # Preferences/progress
-        activity = db.query(UserTopicActivity).filter_by(username=username, topic=topic).first()
-        if activity:
-            context["preferences"]["mastery_level"] = activity.mastery_status
-            context["preferences"]["average_score"] = activity.average_score
-            context["preferences"]["last_attempt"] = activity.last_attempt.isoformat() if activity.last_attempt else None
-        progress = db.query(UserTopicProgress).filter_by(username=username, topic=topic).first()
-        if progress:
-            context["preferences"]["latest_score"] = progress.latest_score
-            context["preferences"]["trend"] = progress.trend
-            context["preferences"]["status"] = progress.status
-        # Syllabus topics
-        syllabus = db.query(UserSyllabus).filter_by(username=username).first()
-        if syllabus and syllabus.topics_text:
-            try:
-                context["syllabus_topics"] = json.loads(syllabus.topics_text)
-            except Exception:
-                context["syllabus_topics"] = []
-    finally:
-        db.close()
-    return context
+    return await user_context_cache.get(username, topic)
 
 
 def get_user_progress_from_pathway(username: str):
@@ -0,0 +1,62 @@
+"""
+streaming upload handling.
+
+- copies an UploadFile to a named temp file in UPLOAD_CHUNK_SIZE chunks instead of
+  reading it into memory, so concurrent large uploads don't spike worker rss
+- sha256 is computed incrementally as the bytes arrive
+- uploads over the per-kind size cap are rejected (UploadTooLarge -> 413) and the
+  partial file is removed
+- callers get the on-disk path (pymupdf / audio clients open it from there) and
+  must remove it when done
+"""
+
+import os
+import asyncio
+import hashlib
+import tempfile
+import logging
+from dataclasses import dataclass
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_BYTES_PDF = int(os.getenv("UPLOAD_MAX_BYTES_PDF", str(50 * 1024 * 1024)))
+UPLOAD_MAX_BYTES_AUDIO = int(os.getenv("UPLOAD_MAX_BYTES_AUDIO", str(25 * 1024 * 1024)))
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds the size limit of {max_bytes} bytes.")
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class SavedUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+async def save_upload(upload: UploadFile, max_bytes: int, suffix: str = "") -> SavedUpload:
+    """Streams the upload to a temp file, hashing it on the way. Raises UploadTooLarge past max_bytes."""
+    # multipart parsing already knows the size, reject before copying anything
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    digest = hashlib.sha256()
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        with tmp:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                await asyncio.to_thread(tmp.write, chunk)
+    except BaseException:
+        os.remove(tmp.name)
+        raise
+    return SavedUpload(path=tmp.name, size=size, sha256=digest.hexdigest())
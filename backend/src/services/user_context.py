@@ -0,0 +1,152 @@
+"""
+user context for llm prompts (notes, quiz history, progress, syllabus topics).
+
+- loaded with two statements instead of five: one row of scalar subqueries for the
+  single-row parts (latest notes, activity, progress, syllabus) and one for the last
+  10 quiz answers
+- parsed results are kept in an LRU keyed by (username, topic), bounded by
+  USER_CONTEXT_CACHE_SIZE and USER_CONTEXT_CACHE_TTL (the ttl covers writes made
+  by other processes)
+- reads go through the async session (db.AsyncSessionLocal), so a miss doesn't hold
+  a worker thread or block the event loop
+- writers call invalidate(): topic stats updates, syllabus uploads, the progress
+  uploader, and notes / quiz history writes
+- a load racing with an invalidation is not cached, so a stale read can't outlive the write
+"""
+
+import os
+import json
+import copy
+import logging
+import threading
+
+from cachetools import TTLCache
+from sqlalchemy import select
+
+from db import AsyncSessionLocal
+from db_models import UserTopicActivity, UserTopicNotes, UserQuizHistory, UserTopicProgress, UserSyllabus
+
+logger = logging.getLogger(__name__)
+
+USER_CONTEXT_CACHE_SIZE = int(os.getenv("USER_CONTEXT_CACHE_SIZE", "4096"))
+USER_CONTEXT_CACHE_TTL = int(os.getenv("USER_CONTEXT_CACHE_TTL", "300"))
+QUIZ_HISTORY_LIMIT = 10
+
+
+def _scalar(column, *where, order_by=None):
+    query = select(column).where(*where)
+    if order_by is not None:
+        query = query.order_by(order_by)
+    return query.limit(1).scalar_subquery()
+
+
+async def load_user_context(username: str, topic: str) -> dict:
+    """Reads the context for (username, topic) from the database."""
+    activity = (UserTopicActivity.username == username, UserTopicActivity.topic == topic)
+    progress = (UserTopicProgress.username == username, UserTopicProgress.topic == topic)
+    single_rows = select(
+        _scalar(UserTopicNotes.notes, UserTopicNotes.username == username, UserTopicNotes.topic == topic, order_by=UserTopicNotes.updated_at.desc()),
+        _scalar(UserTopicActivity.mastery_status, *activity),
+        _scalar(UserTopicActivity.average_score, *activity),
+        _scalar(UserTopicActivity.last_attempt, *activity),
+        _scalar(UserTopicProgress.latest_score, *progress),
+        _scalar(UserTopicProgress.trend, *progress),
+        _scalar(UserTopicProgress.status, *progress),
+        _scalar(UserSyllabus.topics_text, UserSyllabus.username == username),
+    )
+    history = (
+        select(UserQuizHistory.question, UserQuizHistory.answer, UserQuizHistory.correct, UserQuizHistory.score, UserQuizHistory.timestamp)
+        .where(UserQuizHistory.username == username, UserQuizHistory.topic == topic)
+        .order_by(UserQuizHistory.timestamp.desc())
+        .limit(QUIZ_HISTORY_LIMIT)
+    )
+
+    async with AsyncSessionLocal() as db:
+        notes, mastery, average, last_attempt, latest, trend, status, topics_text = (await db.execute(single_rows)).one()
+        quiz_rows = (await db.execute(history)).all()
+
+    context = {
+        "notes": notes or "",
+        "quiz_history": [
+            {
+                "question": q.question,
+                "answer": q.answer,
+                "correct": q.correct,
+                "score": q.score,
+                "timestamp": q.timestamp.isoformat() if q.timestamp else None
+            }
+            for q in quiz_rows
+        ],
+        "preferences": {},
+        "syllabus_topics": []
+    }
+    if mastery is not None:
+        context["preferences"]["mastery_level"] = mastery
+        context["preferences"]["average_score"] = average
+        context["preferences"]["last_attempt"] = last_attempt.isoformat() if last_attempt else None
+    if status is not None:
+        context["preferences"]["latest_score"] = latest
+        context["preferences"]["trend"] = trend
+        context["preferences"]["status"] = status
+    if topics_text:
+        try:
+            context["syllabus_topics"] = json.loads(topics_text)
+        except Exception:
+            context["syllabus_topics"] = []
+    return context
+
+
+class UserContextCache:
+    def __init__(self):
+        self.entries: TTLCache = TTLCache(maxsize=USER_CONTEXT_CACHE_SIZE, ttl=USER_CONTEXT_CACHE_TTL)
+        # bumped on every invalidation, so a load that started before it isn't cached
+        self.generations: dict[str, int] = {}
+        # the progress uploader invalidates from its own thread
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0, "stale_loads": 0}
+
+    def _cached(self, key: tuple[str, str]):
+        with self.lock:
+            context = self.entries.get(key)
+            self.counters["hits" if context is not None else "misses"] += 1
+            return context, self.generations.get(key[0], 0)
+
+    def _store(self, key: tuple[str, str], context: dict, generation: int):
+        with self.lock:
+            if self.generations.get(key[0], 0) == generation:
+                self.entries[key] = context
+            else:
+                self.counters["stale_loads"] += 1
+
+    async def get(self, username: str, topic: str) -> dict:
+        """Callers get their own copy, so mutating it can't corrupt the cache."""
+        key = (username, topic or "")
+        context, generation = self._cached(key)
+        if context is None:
+            context = await load_user_context(username, topic)
+            self._store(key, context, generation)
+        return copy.deepcopy(context)
+
+    def invalidate(self, username: str, topic: str | None = None):
+        """Drops one (username, topic) entry, or every entry of the user (e.g. after a syllabus upload)."""
+        with self.lock:
+            self.generations[username] = self.generations.get(username, 0) + 1
+            self.counters["invalidations"] += 1
+            if topic is not None:
+                self.entries.pop((username, topic), None)
+                return
+            for key in [k for k in self.entries.keys() if k[0] == username]:
+                self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+            "entries": len(self.entries),
+            "max_entries": USER_CONTEXT_CACHE_SIZE,
+            "ttl_seconds": USER_CONTEXT_CACHE_TTL,
+        }
+
+
+user_context_cache = UserContextCache()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# same layout the app runs with: root modules (db, models) plus src/ for services.*
+sys.path[:0] = [BACKEND, os.path.join(BACKEND, "src")]
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from services.topic_classifier import TopicClassifier, TopicIndex, TOPIC_CLASSIFIER_THRESHOLD
+
+SYLLABUS = [
+    ("Thermodynamics", "Laws of thermodynamics, heat engines and entropy"),
+    ("Eigenvalues and Eigenvectors", "Characteristic polynomial and diagonalization"),
+    ("Graph Theory", "Paths, trees and colourings"),
+    ("Organic Chemistry", "Reactions of carbon compounds"),
+]
+
+
+def classify(topics, question):
+    classifier = TopicClassifier()
+    classifier.indexes["alice"] = TopicIndex(topics)
+    return asyncio.run(classifier.classify("alice", question)), classifier.counters
+
+
+def test_exact_name_matches():
+    match, counters = classify(SYLLABUS, "What is graph theory?")
+    assert match.topic == "Graph Theory"
+    assert counters["llm_calls_avoided"] == 1
+
+
+def test_plural_and_singular_match():
+    match, _ = classify(SYLLABUS, "How do I find an eigenvector?")
+    assert match.topic == "Eigenvalues and Eigenvectors"
+
+
+def test_description_words_match():
+    match, _ = classify(SYLLABUS, "Explain entropy")
+    assert match.topic == "Thermodynamics"
+
+
+@pytest.mark.parametrize("question", [
+    "Explain dynamics of rigid bodies",  # "dynamics" is only a substring of "thermodynamics"
+    "What is a chemical bond?",  # "chemical" shares n-grams with "chemistry" but no word
+    "Explain the graphical method",
+])
+def test_substring_overlap_is_not_a_match(question):
+    match, counters = classify(SYLLABUS, question)
+    assert match is None
+    assert counters["llm_calls_avoided"] == 0
+
+
+def test_substring_overlap_scores_nothing_in_the_index():
+    index = TopicIndex([("Thermodynamics", "")])
+    assert index.best("Explain dynamics of rigid bodies") is None
+
+
+def test_small_index_never_replaces_the_llm():
+    match, counters = classify([("Thermodynamics", "")], "Explain thermodynamics")
+    assert match is None
+    assert counters["too_few_topics"] == 1
+    assert TopicIndex([("Thermodynamics", "")]).best("Explain thermodynamics").confidence >= TOPIC_CLASSIFIER_THRESHOLD
+
+
+def test_context_only_lookups_are_not_counted_as_avoided_calls():
+    classifier = TopicClassifier()
+    classifier.indexes["alice"] = TopicIndex(SYLLABUS)
+    match = asyncio.run(classifier.classify("alice", "What is graph theory?", replaces_llm_call=False))
+    assert match.topic == "Graph Theory"
+    assert classifier.counters["llm_calls_avoided"] == 0
+    assert classifier.counters["context_matches"] == 1
@@ -1,5 +1,29 @@
-// Upload a PDF syllabus for a user
-export async function uploadSyllabus(pdfFile: File, username: string, llmConfig: { provider: string, apiKey: string, model: string }) {
+const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+const JOB_POLL_INTERVAL_MS = 1000;
+
+export interface SyllabusJob {
+  id: string;
+  status: "queued" | "running" | "succeeded" | "failed";
+  stage: string | null;
+  progress: number;
+  result: { topics: any[] } | null;
+  error: string | null;
+}
+
+// Status of a background job (e.g. syllabus parsing)
+export async function getJob(jobId: string): Promise<SyllabusJob> {
+  const res = await fetch(`${API_URL}/jobs/${jobId}`);
+  if (!res.ok) throw new Error("Failed to fetch job status");
+  return res.json();
+}
+
+// Upload a PDF syllabus for a user; parsing runs as a background job that is polled until done
+export async function uploadSyllabus(
+  pdfFile: File,
+  username: string,
+  llmConfig: { provider: string, apiKey: string, model: string },
+  onProgress?: (job: SyllabusJob) => void
+) {
   const formData = new FormData();
   formData.append("pdf", pdfFile);
   formData.append("username", username);
@@ -7,10 +31,18 @@ export async function uploadSyllabus(pdfFile: File, username: string, llmConfig:
   formData.append("llm_api_key", llmConfig.apiKey);
   formData.append("llm_model", llmConfig.model);
 
-  const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000"}/syllabus`, {
+  const res = await fetch(`${API_URL}/syllabus`, {
     method: "POST",
     body: formData,
   });
   if (!res.ok) throw new Error("Failed to upload syllabus");
-  return res.json();
+  const { job_id } = await res.json();
+
+  while (true) {
+    const job = await getJob(job_id);
+    onProgress?.(job);
+    if (job.status === "succeeded") return job.result ?? { topics: [] };
+    if (job.status === "failed") throw new Error(job.error || "Failed to parse syllabus");
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
 }